@@ -1,4 +1,12 @@
+import itertools
+import math
+import os
+import threading
 import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from utils.timer_wheel import TimerWheel
 
 class ContextManager:
     def __init__(self):
@@ -16,4 +24,249 @@ class ContextManager:
     def valid(self):
         return self.data and time.time() < self.data["expires"]
 
-context = ContextManager()
+
+# ---------------- STORE POR SESSAO ----------------
+
+CONTEXT_SHARDS = 16
+CONTEXT_TICK = 0.1  # resolucao da expiracao (segundos)
+# Sessoes com contexto pendente por shard; acima disso sai a mais antiga
+CONTEXT_MAX_PER_SHARD = int(os.getenv("CONTEXT_MAX_PER_SHARD", "1024"))
+
+# memory: por processo | sqlite: compartilhado entre workers do host
+# (arquivo em SHARED_STORE_PATH, ver core.shared_store). So o contexto:
+# o espelho de estados (core.state_mirror) fica por worker, cada um com a
+# sua assinatura de state_changed
+CONTEXT_BACKEND = os.getenv("CONTEXT_BACKEND", "memory")
+
+
+class _Shard:
+    __slots__ = ("lock", "entries", "wheel")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.wheel = TimerWheel()
+
+
+class ContextStore:
+    """
+    Contextos de confirmacao pendentes, um por sessao (satelite/dispositivo).
+
+    As sessoes sao distribuidas em shards, cada um com seu lock, entao
+    satelites diferentes nao disputam o mesmo lock. A expiracao fica com um
+    timer wheel por shard, avancado por uma thread a cada CONTEXT_TICK:
+    get() nao consulta o relogio, so o dict (entrada presente = valida).
+    set, get e expirar sao O(1); cada shard guarda no maximo max_per_shard
+    sessoes.
+
+    auto_tick=False dispensa a thread (quem usa chama advance()).
+    """
+
+    def __init__(self, shards: int = CONTEXT_SHARDS, tick: float = CONTEXT_TICK,
+                 max_per_shard: int = CONTEXT_MAX_PER_SHARD, auto_tick: bool = True):
+        self.tick = tick
+        self.auto_tick = auto_tick
+        self.max_per_shard = max_per_shard
+        self._shards = [_Shard() for _ in range(shards)]
+        self._ticker = None
+        self._ticker_lock = threading.Lock()
+        self.expired = 0
+        self.evicted = 0
+        self._versions = itertools.count(1)
+
+    def _shard(self, session: str) -> _Shard:
+        return self._shards[hash(session) % len(self._shards)]
+
+    def __len__(self):
+        return sum(len(shard.entries) for shard in self._shards)
+
+    def set(self, session: str, payload: dict, ttl: float = 10) -> int | None:
+        """Contexto da sessao por ttl segundos (ttl <= 0 apenas limpa); devolve a versao."""
+        if ttl <= 0:
+            self.delete(session)
+            return None
+
+        shard = self._shard(session)
+        with shard.lock:
+            return self._write(shard, session, payload, ttl)
+
+    def compare_and_set(self, session: str, expected_version: int | None,
+                        payload: dict, ttl: float = 10) -> int | None:
+        """Grava so se a versao atual for expected_version (None = sem contexto)."""
+        shard = self._shard(session)
+        with shard.lock:
+            entry = shard.entries.get(session)
+            if (entry["version"] if entry else None) != expected_version:
+                return None
+            if ttl <= 0:
+                self._remove(shard, session)
+                return None
+            return self._write(shard, session, payload, ttl)
+
+    def take(self, session: str) -> dict | None:
+        """Le e remove o contexto numa operacao so."""
+        shard = self._shard(session)
+        with shard.lock:
+            return self._remove(shard, session)
+
+    def _remove(self, shard: _Shard, session: str) -> dict | None:
+        entry = shard.entries.pop(session, None)
+        if entry is not None:
+            shard.wheel.cancel(session)
+        return entry
+
+    def _write(self, shard: _Shard, session: str, payload: dict, ttl: float) -> int:
+        """Chamado com shard.lock."""
+        self._ensure_ticker()
+        entry = {"payload": payload, "expires": time.time() + ttl, "version": next(self._versions)}
+        if session not in shard.entries and len(shard.entries) >= self.max_per_shard:
+            oldest = next(iter(shard.entries))
+            self._remove(shard, oldest)
+            self.evicted += 1
+        shard.entries.pop(session, None)
+        shard.entries[session] = entry
+        # +1: o tick atual ja comecou, nunca expira antes do ttl
+        shard.wheel.schedule(session, math.ceil(round(ttl / self.tick, 6)) + 1)
+        return entry["version"]
+
+    def get(self, session: str) -> dict | None:
+        """{"payload", "expires"} da sessao, ou None se nao ha contexto valido."""
+        return self._shard(session).entries.get(session)
+
+    def delete(self, session: str):
+        shard = self._shard(session)
+        with shard.lock:
+            self._remove(shard, session)
+
+    def advance(self, ticks: int = 1):
+        """Anda os wheels de todos os shards (chamado pela thread de tick)."""
+        for shard in self._shards:
+            with shard.lock:
+                for session in shard.wheel.advance(ticks):
+                    del shard.entries[session]
+                    self.expired += 1
+
+    def _ensure_ticker(self):
+        if self._ticker is not None or not self.auto_tick:
+            return
+        with self._ticker_lock:
+            if self._ticker is None:
+                self._ticker = threading.Thread(target=self._run_ticker, name="friday-context-ticker", daemon=True)
+                self._ticker.start()
+
+    def _run_ticker(self):
+        # Compensa atrasos do sleep: anda quantos ticks passaram de fato
+        started = time.monotonic()
+        done = 0
+        while True:
+            time.sleep(self.tick)
+            due = int((time.monotonic() - started) / self.tick)
+            if due > done:
+                self.advance(due - done)
+                done = due
+
+
+class SQLiteContextStore:
+    """
+    Mesma interface de ContextStore, guardada no SharedStore (SQLite): a
+    confirmacao perguntada por um worker e respondida em qualquer outro.
+    """
+
+    def __init__(self, path: str = None):
+        from core.shared_store import SHARED_STORE_PATH, SharedStore
+        self._kv = SharedStore(path or SHARED_STORE_PATH, namespace="context")
+
+    def __len__(self):
+        return len(self._kv)
+
+    def set(self, session: str, payload: dict, ttl: float = 10) -> int | None:
+        if ttl <= 0:
+            self.delete(session)
+            return None
+        return self._kv.set(session, payload, ttl)
+
+    def compare_and_set(self, session: str, expected_version: int | None,
+                        payload: dict, ttl: float = 10) -> int | None:
+        if ttl <= 0:
+            entry = self._kv.get(session)
+            if entry and entry["version"] == expected_version:
+                self._kv.delete(session)
+            return None
+        return self._kv.compare_and_set(session, expected_version, payload, ttl)
+
+    def get(self, session: str) -> dict | None:
+        return _as_context(self._kv.get(session))
+
+    def take(self, session: str) -> dict | None:
+        return _as_context(self._kv.take(session))
+
+    def delete(self, session: str):
+        self._kv.delete(session)
+
+
+def _as_context(entry: dict | None) -> dict | None:
+    if entry is None:
+        return None
+    return {"payload": entry["value"], "expires": entry["expires"], "version": entry["version"]}
+
+
+def make_store(backend: str = CONTEXT_BACKEND):
+    if backend == "sqlite":
+        return SQLiteContextStore()
+    if backend != "memory":
+        raise ValueError(f"CONTEXT_BACKEND invalido: {backend}")
+    return ContextStore()
+
+
+store = make_store()
+
+
+# ---------------- CONTEXTO DA SESSAO ATUAL ----------------
+#
+# Cada sessao (conexao WebSocket de um satelite, campo session das
+# requisicoes) tem seu proprio contexto: a confirmacao pendente de um
+# satelite nao vaza para outro. Fora de uma sessao vale DEFAULT_SESSION.
+
+DEFAULT_SESSION = "default"
+_session_id: ContextVar[str] = ContextVar("session_id", default=DEFAULT_SESSION)
+
+
+def current_session() -> str:
+    return _session_id.get()
+
+
+@contextmanager
+def session_scope(session: str | None):
+    """Usa o contexto de `session` em tudo que rodar no bloco (inclusive tasks criadas nele)."""
+    token = _session_id.set(session or DEFAULT_SESSION)
+    try:
+        yield session
+    finally:
+        _session_id.reset(token)
+
+
+class SessionContext:
+    """
+    Fachada com a mesma interface de ContextManager que usa o contexto da
+    sessao atual no store. E o `context` importado pelos dominios.
+    """
+
+    @property
+    def data(self):
+        return store.get(_session_id.get())
+
+    def set(self, payload: dict, ttl=10):
+        store.set(_session_id.get(), payload, ttl)
+
+    def clear(self):
+        store.delete(_session_id.get())
+
+    def take(self):
+        """data + clear atomicos: so quem pegar a confirmacao a executa."""
+        return store.take(_session_id.get())
+
+    def valid(self):
+        return store.get(_session_id.get()) is not None
+
+
+context = SessionContext()
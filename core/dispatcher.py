@@ -1,34 +1,107 @@
+import asyncio
+import logging
+import time
+
 from core.context_manager import context
-from core.domains import climate, light
-from utils.logger import setup_logger
-from utils.version import print_version_banner
+from core.registry import HANDLE, HANDLE_CONFIRMATION, TARGET_SETTLED, registry
+from utils.aio import run_sync
+from utils.logger import log_event, setup_logger
+from utils.metrics import span
 
 logger = setup_logger(__name__)
 
-# Exibe banner de versão na inicialização
-print_version_banner()
-
-def dispatch(intent: dict):
+async def async_dispatch(intent: dict):
     domain = intent.get("domain")
     intent_type = intent.get("intent")
     
-    if context.valid():
-        payload = context.data.get("payload", {})
-        ctx_domain = payload.get("domain")
-        logger.info(f"Contexto ativo: {ctx_domain} | Roteando confirmacao")
+    with span("dispatch", domain=domain, intent=intent_type) as labels:
+        # Uma leitura so: a entrada pode expirar entre valid() e data
+        data = context.data
+        if data:
+            payload = data.get("payload", {})
+            ctx_domain = payload.get("domain")
+            log_event(logger, "Contexto ativo: %(domain)s | Roteando confirmacao", domain=ctx_domain)
 
-        if ctx_domain == "light":
-            return light.handle_confirmation(intent)
-        if ctx_domain == "climate":
-            return climate.handle_confirmation(intent)
+            handle_confirmation = registry.handler(ctx_domain, HANDLE_CONFIRMATION)
+            if handle_confirmation is not None:
+                labels.update(domain=ctx_domain, intent="confirmation")
+                with span("handler", domain=ctx_domain, intent="confirmation"):
+                    return await handle_confirmation(intent)
 
-    logger.info(f"Despachando: {domain}.{intent_type}")
-    
-    if domain == "light":
-        return light.handle(intent)
+        if intent_type == "compound":
+            return await async_dispatch_compound(intent)
 
-    if domain == "climate":
-        return climate.handle(intent)
+        log_event(logger, "Despachando: %(domain)s.%(intent)s", domain=domain, intent=intent_type)
+        return await _async_route(intent)
 
-    logger.warning(f"Dominio desconhecido: {domain}")
+async def _async_route(intent: dict):
+    domain = intent.get("domain")
+    handle = registry.handler(domain, HANDLE)
+    if handle is not None:
+        with span("handler", domain=domain, intent=intent.get("intent")):
+            return await handle(intent)
+
+    log_event(logger, "Dominio desconhecido: %(domain)s", logging.WARNING, domain=domain)
     return {"message": "Não entendi. Pode repetir?"}
+
+async def async_target_settled(intent: dict) -> bool:
+    """
+    Alvo do intent nao muda se a frase continuar (ver is_complete).
+
+    Dominios sem async_target_settled tem alvos fixos (ex: comodos do ar).
+    """
+    settled = registry.handler(intent.get("domain"), TARGET_SETTLED)
+    if settled is None:
+        return True
+    return await settled(intent)
+
+# ---------------- COMPOSTOS ----------------
+
+async def async_dispatch_compound(intent: dict):
+    """
+    Executa os sub-intents de um comando composto (ver intent_parser._compound).
+
+    Dominios diferentes rodam em paralelo; dentro de um dominio a ordem da
+    frase e mantida (um trecho pode depender do anterior, ex: ligar o ar e
+    depois mudar a temperatura). A latencia total e a do dominio mais lento.
+    As respostas voltam na ordem da frase.
+    """
+    commands = intent["commands"]
+    started = time.perf_counter()
+
+    chains = {}
+    for index, command in enumerate(commands):
+        chains.setdefault(command.get("domain"), []).append(index)
+    log_event(logger, "Composto: %(commands)s trecho(s) em %(domains)s dominio(s)",
+              commands=len(commands), domains=len(chains))
+
+    results = [None] * len(commands)
+
+    async def run_chain(indices):
+        for index in indices:
+            command = commands[index]
+            log_event(logger, "Despachando: %(domain)s.%(intent)s (composto)",
+                      domain=command.get("domain"), intent=command.get("intent"))
+            try:
+                response = await _async_route(command)
+            except Exception as e:
+                log_event(logger, "Falha no trecho '%(text)s': %(error)s", logging.ERROR,
+                          text=command.get("text"), error=str(e))
+                response = {"message": "Falha ao executar comando."}
+            results[index] = {
+                "domain": command.get("domain"),
+                "intent": command.get("intent"),
+                "message": response.get("message", ""),
+                "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+            }
+
+    await asyncio.gather(*(run_chain(indices) for indices in chains.values()))
+
+    return {
+        "message": " | ".join(r["message"] for r in results),
+        "segments": results,
+    }
+
+def dispatch(intent: dict):
+    """Versao sincrona de async_dispatch (testes e scripts)."""
+    return run_sync(async_dispatch(intent))
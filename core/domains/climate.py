@@ -1,6 +1,10 @@
+import logging
+
 from core.context_manager import context
-from core.ha_client import call_service, get_state
-from utils.logger import log_action, setup_logger
+from core.ha_client import (async_call_service, async_get_state,
+                            async_get_states)
+from utils.aio import run_sync
+from utils.logger import log_action, log_event, setup_logger
 
 logger = setup_logger(__name__)
 
@@ -48,23 +52,23 @@ def match_room(search: str):
     for room, aliases in ROOM_ALIASES.items():
         for a in aliases:
             if a in search:
-                logger.debug(f"Comodo identificado: '{search}' -> {room}")
+                logger.debug("Comodo identificado: '%s' -> %s", search, room)
                 return room
-    logger.debug(f"Nenhum comodo identificado para: '{search}'")
+    logger.debug("Nenhum comodo identificado para: '%s'", search)
     return None
 
 def is_generic_ar(search: str):
     return not search or search in GENERIC_AR
 
-def is_on(entity_id: str):
-    return get_state(entity_id) == "on"
+async def async_is_on(entity_id: str):
+    return await async_get_state(entity_id) == "on"
 
 # -------- SUB-FEATURE HANDLERS --------
 
-def handle_fan_on(intent: dict):
+async def async_handle_fan_on(intent: dict):
     """Liga o ventilador do ar-condicionado."""
     room = intent.get("room")
-    logger.info(f"Ligando ventilador do ar do {room}")
+    log_event(logger, "Ligando ventilador do ar do %(room)s", room=room)
     
     if not room or room not in CLIMATE_DEVICES:
         return {"message": "Qual cômodo? Quarto ou closet?"}
@@ -75,14 +79,14 @@ def handle_fan_on(intent: dict):
     if not script:
         return {"message": f"Ventilador não disponível no {room}."}
     
-    call_service("script", script.replace("script.", ""), {})
+    await async_call_service("script", script.replace("script.", ""), {})
     log_action(logger, "climate", "fan_on", room)
     return {"message": f"Ventilador do {room} ligado."}
 
-def handle_fan_off(intent: dict):
+async def async_handle_fan_off(intent: dict):
     """Desliga o ventilador do ar-condicionado."""
     room = intent.get("room")
-    logger.info(f"Desligando ventilador do ar do {room}")
+    log_event(logger, "Desligando ventilador do ar do %(room)s", room=room)
     
     if not room or room not in CLIMATE_DEVICES:
         return {"message": "Qual cômodo? Quarto ou closet?"}
@@ -93,14 +97,14 @@ def handle_fan_off(intent: dict):
     if not script:
         return {"message": f"Ventilador não disponível no {room}."}
     
-    call_service("script", script.replace("script.", ""), {})
+    await async_call_service("script", script.replace("script.", ""), {})
     log_action(logger, "climate", "fan_off", room)
     return {"message": f"Ventilador do {room} desligado."}
 
-def handle_heater_on(intent: dict):
+async def async_handle_heater_on(intent: dict):
     """Liga o aquecedor do ar-condicionado."""
     room = intent.get("room")
-    logger.info(f"Ligando aquecedor do ar do {room}")
+    log_event(logger, "Ligando aquecedor do ar do %(room)s", room=room)
     
     if not room or room not in CLIMATE_DEVICES:
         return {"message": "Qual cômodo? Quarto ou closet?"}
@@ -111,14 +115,14 @@ def handle_heater_on(intent: dict):
     if not script:
         return {"message": f"Aquecedor não disponível no {room}."}
     
-    call_service("script", script.replace("script.", ""), {})
+    await async_call_service("script", script.replace("script.", ""), {})
     log_action(logger, "climate", "heater_on", room)
     return {"message": f"Aquecedor do {room} ligado."}
 
-def handle_heater_off(intent: dict):
+async def async_handle_heater_off(intent: dict):
     """Desliga o aquecedor do ar-condicionado."""
     room = intent.get("room")
-    logger.info(f"Desligando aquecedor do ar do {room}")
+    log_event(logger, "Desligando aquecedor do ar do %(room)s", room=room)
     
     if not room or room not in CLIMATE_DEVICES:
         return {"message": "Qual cômodo? Quarto ou closet?"}
@@ -129,14 +133,14 @@ def handle_heater_off(intent: dict):
     if not script:
         return {"message": f"Aquecedor não disponível no {room}."}
     
-    call_service("script", script.replace("script.", ""), {})
+    await async_call_service("script", script.replace("script.", ""), {})
     log_action(logger, "climate", "heater_off", room)
     return {"message": f"Aquecedor do {room} desligado."}
 
-def handle_display_off(intent: dict):
+async def async_handle_display_off(intent: dict):
     """Apaga a tela do ar-condicionado via controle remoto."""
     room = intent.get("room")
-    logger.info(f"Apagando tela do ar do {room}")
+    log_event(logger, "Apagando tela do ar do %(room)s", room=room)
     
     if not room or room not in CLIMATE_DEVICES:
         return {"message": "Qual cômodo? Quarto ou closet?"}
@@ -148,7 +152,7 @@ def handle_display_off(intent: dict):
         return {"message": f"Controle remoto não disponível no {room}."}
     
     remote_entity, command = remote_data
-    call_service("remote", "send_command", {
+    await async_call_service("remote", "send_command", {
         "entity_id": remote_entity,
         "device": "SmartInverter",
         "command": command
@@ -156,11 +160,11 @@ def handle_display_off(intent: dict):
     log_action(logger, "climate", "display_off", room)
     return {"message": f"Tela do ar do {room} apagada."}
 
-def handle_set_temperature(intent: dict):
+async def async_handle_set_temperature(intent: dict):
     """Define a temperatura do ar-condicionado."""
     room = intent.get("room")
     temp = intent.get("value")
-    logger.info(f"Definindo temperatura do ar do {room} para {temp}°C")
+    log_event(logger, "Definindo temperatura do ar do %(room)s para %(temp)s°C", room=room, temp=temp)
     
     if not room or room not in CLIMATE_DEVICES:
         return {"message": "Qual cômodo? Quarto ou closet?"}
@@ -178,18 +182,18 @@ def handle_set_temperature(intent: dict):
     if not temp_entity:
         return {"message": f"Controle de temperatura não disponível no {room}."}
     
-    call_service("input_number", "set_value", {
+    await async_call_service("input_number", "set_value", {
         "entity_id": temp_entity,
         "value": temp
     })
     log_action(logger, "climate", f"temperature_{temp}", room)
     return {"message": f"Temperatura do {room} definida para {temp}°C."}
 
-def handle_set_speed(intent: dict):
+async def async_handle_set_speed(intent: dict):
     """Define a velocidade do ventilador (1-3)."""
     room = intent.get("room")
     speed = intent.get("value")
-    logger.info(f"Definindo velocidade do ar do {room} para {speed}")
+    log_event(logger, "Definindo velocidade do ar do %(room)s para %(speed)s", room=room, speed=speed)
     
     if not room or room not in CLIMATE_DEVICES:
         return {"message": "Qual cômodo? Quarto ou closet?"}
@@ -207,17 +211,17 @@ def handle_set_speed(intent: dict):
     if not speed_entity:
         return {"message": f"Controle de velocidade não disponível no {room}."}
     
-    call_service("input_number", "set_value", {
+    await async_call_service("input_number", "set_value", {
         "entity_id": speed_entity,
         "value": speed
     })
     log_action(logger, "climate", f"speed_{speed}", room)
     return {"message": f"Velocidade do {room} definida para {speed}."}
 
-def handle_increase_speed(intent: dict):
+async def async_handle_increase_speed(intent: dict):
     """Aumenta a velocidade do ventilador."""
     room = intent.get("room")
-    logger.info(f"Aumentando velocidade do ar do {room}")
+    log_event(logger, "Aumentando velocidade do ar do %(room)s", room=room)
     
     if not room or room not in CLIMATE_DEVICES:
         return {"message": "Qual cômodo? Quarto ou closet?"}
@@ -229,10 +233,10 @@ def handle_increase_speed(intent: dict):
         return {"message": f"Controle de velocidade não disponível no {room}."}
     
     # Pega valor atual e incrementa
-    current = get_state(speed_entity)
+    current = await async_get_state(speed_entity)
     try:
         new_speed = min(int(float(current)) + 1, 3)  # Máximo 3
-        call_service("input_number", "set_value", {
+        await async_call_service("input_number", "set_value", {
             "entity_id": speed_entity,
             "value": new_speed
         })
@@ -241,10 +245,10 @@ def handle_increase_speed(intent: dict):
     except (ValueError, TypeError):
         return {"message": "Não consegui aumentar a velocidade."}
 
-def handle_decrease_speed(intent: dict):
+async def async_handle_decrease_speed(intent: dict):
     """Diminui a velocidade do ventilador."""
     room = intent.get("room")
-    logger.info(f"Diminuindo velocidade do ar do {room}")
+    log_event(logger, "Diminuindo velocidade do ar do %(room)s", room=room)
     
     if not room or room not in CLIMATE_DEVICES:
         return {"message": "Qual cômodo? Quarto ou closet?"}
@@ -256,10 +260,10 @@ def handle_decrease_speed(intent: dict):
         return {"message": f"Controle de velocidade não disponível no {room}."}
     
     # Pega valor atual e decrementa
-    current = get_state(speed_entity)
+    current = await async_get_state(speed_entity)
     try:
         new_speed = max(int(float(current)) - 1, 1)  # Mínimo 1
-        call_service("input_number", "set_value", {
+        await async_call_service("input_number", "set_value", {
             "entity_id": speed_entity,
             "value": new_speed
         })
@@ -272,40 +276,40 @@ def handle_decrease_speed(intent: dict):
 
 # -------- MAIN HANDLER --------
 
-def handle(intent: dict):
+async def async_handle(intent: dict):
     action = intent["intent"]
-    logger.info(f"Processando climate.{action}")
+    log_event(logger, "Processando climate.%(action)s", action=action)
     
     # Roteia para handlers de sub-features
     if action == "fan_on":
-        return handle_fan_on(intent)
+        return await async_handle_fan_on(intent)
     if action == "fan_off":
-        return handle_fan_off(intent)
+        return await async_handle_fan_off(intent)
     if action == "heater_on":
-        return handle_heater_on(intent)
+        return await async_handle_heater_on(intent)
     if action == "heater_off":
-        return handle_heater_off(intent)
+        return await async_handle_heater_off(intent)
     if action == "display_off":
-        return handle_display_off(intent)
+        return await async_handle_display_off(intent)
     if action == "set_temperature":
-        return handle_set_temperature(intent)
+        return await async_handle_set_temperature(intent)
     if action == "set_speed":
-        return handle_set_speed(intent)
+        return await async_handle_set_speed(intent)
     if action == "increase_speed":
-        return handle_increase_speed(intent)
+        return await async_handle_increase_speed(intent)
     if action == "decrease_speed":
-        return handle_decrease_speed(intent)
+        return await async_handle_decrease_speed(intent)
     
     # ---- LIGAR/DESLIGAR AR (comportamento existente)
     search = intent.get("search", "").lower()
-    logger.info(f"Processando climate.{action} | Busca: '{search}'")
+    log_event(logger, "Processando climate.%(action)s | Busca: '%(search)s'", action=action, search=search)
 
     # Ligar/desligar TODOS os ares
     if action in ("all_on", "all_off"):
         service_action = "on" if action == "all_on" else "off"
         for room, cfg in CLIMATE_DEVICES.items():
             script = cfg["power_on"] if service_action == "on" else cfg["power_off"]
-            call_service("script", script.replace("script.", ""), {})
+            await async_call_service("script", script.replace("script.", ""), {})
             log_action(logger, "climate", service_action, room)
         
         msg_action = "ligados" if service_action == "on" else "desligados"
@@ -315,47 +319,52 @@ def handle(intent: dict):
 
     # GENÉRICO: desligar ar
     if action == "off" and is_generic_ar(search) and not room:
+        # Uma unica consulta para o estado de todos os comodos
+        states = await async_get_states([cfg["state"] for cfg in CLIMATE_DEVICES.values()])
         ligados = [
             {"room": r, "script": cfg["power_off"]}
             for r, cfg in CLIMATE_DEVICES.items()
-            if is_on(cfg["state"])
+            if states.get(cfg["state"]) == "on"
         ]
 
         if not ligados:
             return {"message": "Nenhum ar-condicionado está ligado."}
 
         if len(ligados) == 1:
-            call_service("script", ligados[0]["script"].replace("script.", ""), {})
+            await async_call_service("script", ligados[0]["script"].replace("script.", ""), {})
             log_action(logger, "climate", "off", ligados[0]["room"])
             return {"message": f"Ar do {ligados[0]['room']} desligado."}
 
-        logger.info(f"Multiplos ares ligados: {[l['room'] for l in ligados]}")
+        nomes = ", ".join(l["room"] for l in ligados)
+        log_event(logger, "Multiplos ares ligados: %(rooms)s", rooms=nomes)
         context.set({
             "domain": "climate",
             "action": "off",
             "candidates": ligados
         })
 
-        nomes = ", ".join(l["room"] for l in ligados)
         return {"message": f"Mais de um ar está ligado: {nomes}. Qual deles?"}
 
     # COM CÔMODO
     if room:
         cfg = CLIMATE_DEVICES[room]
         script = cfg["power_on"] if action == "on" else cfg["power_off"]
-        call_service("script", script.replace("script.", ""), {})
+        await async_call_service("script", script.replace("script.", ""), {})
         log_action(logger, "climate", action, room)
         return {"message": f"Ar do {room} {'ligado' if action == 'on' else 'desligado'}."}
 
-    logger.warning(f"Comando de ar-condicionado nao compreendido: '{search}'")
+    log_event(logger, "Comando de ar-condicionado nao compreendido: '%(search)s'", logging.WARNING, search=search)
     return {"message": "Não entendi o comando de ar-condicionado."}
 
 # ---------------- CONFIRMAÇÃO ----------------
 
-def handle_confirmation(intent: dict):
-    payload = context.data.get("payload", {})
+async def async_handle_confirmation(intent: dict):
+    data = context.take()
+    if data is None:
+        # Outra requisicao ja respondeu (ou expirou)
+        return {"message": "Confirmação inválida."}
+    payload = data.get("payload", {})
     text = intent.get("text", "").lower()
-    context.clear()
 
     if payload.get("domain") != "climate":
         return {"message": "Confirmação inválida."}
@@ -364,12 +373,51 @@ def handle_confirmation(intent: dict):
 
     if "todos" in text:
         for c in candidates:
-            call_service("script", c["script"].replace("script.", ""), {})
+            await async_call_service("script", c["script"].replace("script.", ""), {})
         return {"message": "Todos os ar-condicionados foram desligados."}
 
     for c in candidates:
         if c["room"] in text:
-            call_service("script", c["script"].replace("script.", ""), {})
+            await async_call_service("script", c["script"].replace("script.", ""), {})
             return {"message": f"Ar do {c['room']} desligado."}
 
     return {"message": "Não entendi qual ar desligar."}
+
+# ---------------- SYNC API ----------------
+# Wrappers finos sobre as versoes async_ (testes e scripts)
+
+def is_on(entity_id: str):
+    return run_sync(async_is_on(entity_id))
+
+def handle_fan_on(intent: dict):
+    return run_sync(async_handle_fan_on(intent))
+
+def handle_fan_off(intent: dict):
+    return run_sync(async_handle_fan_off(intent))
+
+def handle_heater_on(intent: dict):
+    return run_sync(async_handle_heater_on(intent))
+
+def handle_heater_off(intent: dict):
+    return run_sync(async_handle_heater_off(intent))
+
+def handle_display_off(intent: dict):
+    return run_sync(async_handle_display_off(intent))
+
+def handle_set_temperature(intent: dict):
+    return run_sync(async_handle_set_temperature(intent))
+
+def handle_set_speed(intent: dict):
+    return run_sync(async_handle_set_speed(intent))
+
+def handle_increase_speed(intent: dict):
+    return run_sync(async_handle_increase_speed(intent))
+
+def handle_decrease_speed(intent: dict):
+    return run_sync(async_handle_decrease_speed(intent))
+
+def handle(intent: dict):
+    return run_sync(async_handle(intent))
+
+def handle_confirmation(intent: dict):
+    return run_sync(async_handle_confirmation(intent))
@@ -1,9 +1,18 @@
+import asyncio
+import logging
 import re
 import time
+from collections import OrderedDict
+
+import aiohttp
 
 from core.context_manager import context
-from core.ha_client import call_service, get_all_states
-from utils.logger import log_action, setup_logger
+from core.fuzzy import entity_index
+from core.ha_client import (async_call_service, async_get_all_states,
+                            coalesce_calls)
+from core.state_mirror import names_key
+from utils.aio import run_sync
+from utils.logger import log_action, log_event, setup_logger
 
 logger = setup_logger(__name__)
 
@@ -26,6 +35,10 @@ IGNORED_LIGHT_ENTITIES = {
     "light.esp32ledstrip_fita_led_quarto",
 }
 
+# Tokens de busca memorizados pelo indice de luzes (LRU: as buscas vem do
+# STT e nao se repetem para sempre)
+TOKEN_CACHE_SIZE = 512
+
 # ---------------- UTIL ----------------
 
 def normalize_name(text: str) -> str:
@@ -34,68 +47,174 @@ def normalize_name(text: str) -> str:
     text = re.sub(r"\s+", " ", text)
     return text.strip()
 
-def get_all_lights():
+async def async_get_all_lights():
     return [
-        e for e in get_all_states()
+        e for e in await async_get_all_states()
         if e["entity_id"].startswith("light.")
     ]
 
-def get_lights_on():
+async def async_get_lights_on():
     return [
-        e for e in get_all_lights()
+        e for e in await async_get_all_lights()
         if e["state"] == "on"
         and e["entity_id"] not in IGNORED_LIGHT_ENTITIES
         # descarta grupos (quando existir atributo entity_id)
         and "entity_id" not in e.get("attributes", {})
     ]
 
-def find_light_entities(search: str):
+# ---------------- INDEX ----------------
+
+class LightNameIndex:
+    """
+    Indice invertido token -> entity_id dos nomes normalizados das luzes.
+
+    Reconstruido apenas quando o conjunto de luzes ou seus friendly_name
+    mudam. A busca vira intersecao de conjuntos seguida da mesma checagem
+    de substring de antes, aplicada so aos candidatos.
+    """
+
+    def __init__(self, token_cache_size: int = TOKEN_CACHE_SIZE):
+        self.token_cache_size = token_cache_size
+        self._key = None
+        self._names = {}         # entity_id -> nome normalizado
+        self._position = {}      # entity_id -> ordem original
+        self._postings = {}      # token do nome -> {entity_id}
+        self._token_cache = OrderedDict()   # token da busca -> {entity_id} (LRU)
+        self.rebuilds = 0
+
+    def refresh(self, lights: list):
+        key = names_key(lights)
+        if key == self._key:
+            return
+
+        self._names = {}
+        self._position = {}
+        self._postings = {}
+        self._token_cache = OrderedDict()
+
+        for position, e in enumerate(lights):
+            entity_id = e["entity_id"]
+            name = normalize_name(e.get("attributes", {}).get("friendly_name", ""))
+            self._names[entity_id] = name
+            self._position[entity_id] = position
+            for token in name.split():
+                self._postings.setdefault(token, set()).add(entity_id)
+
+        self._key = key
+        self.rebuilds += 1
+        logger.debug("Indice de luzes reconstruido: %d luz(es)", len(self._names))
+
+    def _candidates(self, token: str) -> set:
+        # Um token da busca pode estar dentro de um token do nome ("sal" em "sala")
+        cache = self._token_cache
+        cached = cache.get(token)
+        if cached is not None:
+            cache.move_to_end(token)
+            return cached
+
+        cached = set()
+        for name_token, entity_ids in self._postings.items():
+            if token in name_token:
+                cached |= entity_ids
+        cache[token] = cached
+        while len(cache) > self.token_cache_size:
+            cache.popitem(last=False)
+        return cached
+
+    def search(self, search: str) -> list:
+        """Busca por substring no nome normalizado (search ja normalizado)."""
+        tokens = search.split()
+        if not tokens:
+            candidates = self._names.keys()
+        else:
+            candidates = None
+            for token in sorted(tokens, key=len, reverse=True):
+                found = self._candidates(token)
+                candidates = found if candidates is None else candidates & found
+                if not candidates:
+                    return []
+
+        matches = [eid for eid in candidates if search in self._names[eid]]
+        return sorted(matches, key=self._position.__getitem__)
+
+
+_name_index = LightNameIndex()
+
+async def async_find_light_entities(search: str, lights: list = None):
     search = normalize_name(search)
-    matches = []
 
-    for e in get_all_lights():
-        name = normalize_name(e.get("attributes", {}).get("friendly_name", ""))
-        if search in name:
-            matches.append(e["entity_id"])
+    if lights is None:
+        lights = await async_get_all_lights()
+
+    _name_index.refresh(lights)
+    matches = _name_index.search(search)
 
-    logger.debug(f"Busca '{search}': {len(matches)} luz(es) encontrada(s)")
+    if not matches and search:
+        matches = await _async_fuzzy_light_entities(search)
+
+    logger.debug("Busca '%s': %d luz(es) encontrada(s)", search, len(matches))
     return matches
 
+async def _async_fuzzy_light_entities(search: str):
+    # Erros do STT ("cosinha", "sálla"): so tentado quando a busca exata falha
+    entity_index.refresh(await async_get_all_states())
+    ranked = entity_index.search(search, domain="light")
+    if not ranked:
+        return []
+
+    best = ranked[0][1]
+    matches = [entity_id for entity_id, score in ranked if score == best]
+    logger.info("Busca aproximada '%s': %s -> %s", search, ranked[:3], matches)
+    return matches
+
+async def async_target_settled(intent: dict) -> bool:
+    """
+    Busca que ja resolve para uma luz so (despacho antecipado de parciais).
+
+    "luz sala" com "Luz da Sala" e "Luz da Sala de Jantar" ainda espera o
+    resto da frase; sem nenhuma luz tambem (pode ser palavra incompleta).
+    """
+    search = intent.get("search")
+    if search is None:
+        return True
+    _name_index.refresh(await async_get_all_lights())
+    return len(_name_index.search(search)) == 1
+
 # ---------------- HANDLER ----------------
 
-def handle(intent: dict):
+async def async_handle(intent: dict):
     intent_type = intent.get("intent")
-    logger.info(f"Processando light.{intent_type}")
+    log_event(logger, "Processando light.%(intent)s", intent=intent_type)
 
     if intent_type in ("all_on", "all_off"):
-        return handle_all(intent)
+        return await async_handle_all(intent)
 
     if intent_type == "multi":
-        return handle_multi(intent)
+        return await async_handle_multi(intent)
 
     if "search" in intent:
-        return handle_single(intent)
+        return await async_handle_single(intent)
 
-    logger.warning(f"Intent desconhecida no dominio light: {intent_type}")
+    log_event(logger, "Intent desconhecida no dominio light: %(intent)s", logging.WARNING, intent=intent_type)
     return {"message": "Não entendi o comando."}
 
 # ---------------- SINGLE ----------------
 
-def handle_single(intent: dict):
+async def async_handle_single(intent: dict):
     action = intent["intent"]
     search = intent["search"]
     from_multi = intent.get("_from_multi", False)
 
     # apagar luz genérico
     if action == "off" and search == "luz" and not from_multi:
-        lights_on = get_lights_on()
+        lights_on = await async_get_lights_on()
 
         if not lights_on:
             return {"message": "Nenhuma luz está ligada."}
 
         if len(lights_on) == 1:
             entity = lights_on[0]["entity_id"]
-            call_service("light", "turn_off", {"entity_id": entity})
+            await async_call_service("light", "turn_off", {"entity_id": entity})
             log_action(logger, "light", "turn_off", entity)
             return {"message": "Luz desligada."}
 
@@ -107,7 +226,7 @@ def handle_single(intent: dict):
             for e in lights_on
         ]
 
-        logger.info(f"Multiplas luzes ligadas: {len(candidates)} luz(es)")
+        log_event(logger, "Multiplas luzes ligadas: %(count)s luz(es)", count=len(candidates))
         context.set({
             "domain": "light",
             "action": "off",
@@ -117,72 +236,169 @@ def handle_single(intent: dict):
         nomes = ", ".join(c["name"] for c in candidates)
         return {"message": f"Mais de uma luz está ligada: {nomes}. Qual luz?"}
 
-    entities = find_light_entities(search)
+    entities = await async_find_light_entities(search)
     if not entities:
-        logger.warning(f"Luz nao encontrada: '{search}'")
+        log_event(logger, "Luz nao encontrada: '%(search)s'", logging.WARNING, search=search)
         return {"message": "Não encontrei essa luz."}
 
     service = "turn_on" if action == "on" else "turn_off"
-    call_service("light", service, {"entity_id": entities})
+    await async_call_service("light", service, {"entity_id": entities})
     log_action(logger, "light", service, search)
 
     return {"message": f"{search} {'ligada' if action == 'on' else 'desligada'}."}
 
 # ---------------- MULTI ----------------
 
-def handle_multi(intent: dict):
-    text = intent["text"]
-    partes = [p.strip() for p in text.split(" e ")]
+def parse_segment(parte: str, action: str = "off", light_type: str = "led") -> dict:
+    """
+    Extrai acao e busca de um trecho de comando composto.
 
-    respostas = []
+    Trecho sem acao ou sem tipo ("e da cozinha") usa os do trecho anterior.
+    """
+    words = parte.lower().split()
 
-    for parte in partes:
-        parte = parte.lower()
+    # Compara palavras inteiras: "ligar" e substring de "desligar"
+    if any(v in words for v in ("ligar", "acender")):
+        action = "on"
+    elif any(v in words for v in ("desligar", "apagar")):
+        action = "off"
+    if "luz" in parte.lower():
+        light_type = "luz"
+    elif "led" in parte.lower():
+        light_type = "led"
 
-        action = "on" if any(v in parte for v in ("ligar", "acender")) else "off"
-        light_type = "luz" if "luz" in parte else "led"
+    ignored = {"ligar", "acender", "desligar", "apagar", "luz", "led"}
+    target = " ".join(w for w in words if w not in ignored)
 
-        search = parte
-        for w in ["ligar", "acender", "desligar", "apagar", "luz", "led"]:
-            search = search.replace(w, "")
+    search = f"{light_type} {target}".strip()
+    return {"action": action, "search": search}
 
-        search = f"{light_type} {' '.join(search.split())}".strip()
-
-        r = handle_single({
-            "intent": action,
+async def async_handle_multi(intent: dict):
+    text = intent["text"]
+    started = time.perf_counter()
+    segments = []
+    action, light_type = "off", "led"
+    for parte in text.split(" e "):
+        seg = parse_segment(parte.strip(), action, light_type)
+        action, light_type = seg["action"], seg["search"].split()[0]
+        segments.append(seg)
+
+    # Resolve todos os trechos antes de disparar qualquer servico
+    lights = await async_get_all_lights()
+    for seg in segments:
+        seg["entities"] = await async_find_light_entities(seg["search"], lights)
+
+    # Trechos com a mesma acao viram uma unica chamada ao HA
+    resolved = [i for i, seg in enumerate(segments) if seg["entities"]]
+    groups = coalesce_calls([
+        {
             "domain": "light",
-            "search": search,
-            "_from_multi": True
-        })
-
-        respostas.append(r.get("message", ""))
-        time.sleep(0.4)
+            "service": "turn_on" if segments[i]["action"] == "on" else "turn_off",
+            "data": {"entity_id": segments[i]["entities"]},
+        }
+        for i in resolved
+    ])
+    logger.debug("Multi: %d trecho(s) em %d chamada(s)", len(segments), len(groups))
+
+    # Grupos em paralelo (limites de concorrencia/taxa ficam no ha_client)
+    outcomes = await asyncio.gather(*(_async_run_group(g, started) for g in groups))
+
+    results = [None] * len(segments)
+    for group, (error, latency_ms) in zip(groups, outcomes):
+        for member in group["members"]:
+            index = resolved[member]
+            results[index] = _segment_result(segments[index], error, latency_ms)
+
+    for index, seg in enumerate(segments):
+        if results[index] is None:
+            log_event(logger, "Luz nao encontrada: '%(search)s'", logging.WARNING, search=seg["search"])
+            latency_ms = round((time.perf_counter() - started) * 1000, 1)
+            results[index] = {
+                "search": seg["search"],
+                "message": "Não encontrei essa luz.",
+                "latency_ms": latency_ms,
+            }
 
-    return {"message": " | ".join(respostas)}
+    return {
+        "message": " | ".join(r["message"] for r in results),
+        "segments": results,
+    }
+
+async def _async_run_group(group: dict, started: float):
+    error = None
+    try:
+        await async_call_service(group["domain"], group["service"], group["data"])
+        log_action(logger, "light", group["service"], ", ".join(group["data"]["entity_id"]))
+    except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+        log_event(logger, "Falha em light.%(service)s: %(error)s", logging.ERROR,
+                  service=group["service"], error=e)
+        error = e
+
+    return error, round((time.perf_counter() - started) * 1000, 1)
+
+def _segment_result(seg: dict, error: Exception | None, latency_ms: float) -> dict:
+    search = seg["search"]
+    if error is not None:
+        message = f"Falha ao controlar {search}."
+    else:
+        message = f"{search} {'ligada' if seg['action'] == 'on' else 'desligada'}."
+
+    log_event(logger, "Trecho '%(search)s' concluido em %(latency_ms)s ms", search=search, latency_ms=latency_ms)
+    return {"search": search, "message": message, "latency_ms": latency_ms}
 
 # ---------------- CONFIRMAÇÃO ----------------
 
-def handle_confirmation(intent: dict):
-    payload = context.data["payload"]
+async def async_handle_confirmation(intent: dict):
+    data = context.take()
+    if data is None:
+        # Outra requisicao ja respondeu (ou expirou)
+        return {"message": "Confirmação inválida."}
+    payload = data["payload"]
     user_text = intent.get("text", "").lower()
-    context.clear()
 
     candidates = payload["candidates"]
 
     if user_text in ("todas", "todas as luzes"):
-        call_service("light", "turn_off", {"entity_id": "light.all_light_entities"})
+        await async_call_service("light", "turn_off", {"entity_id": "light.all_light_entities"})
         return {"message": "Todas as luzes foram desligadas."}
 
     for c in candidates:
         if c["name"] == user_text:
-            call_service("light", "turn_off", {"entity_id": c["entity_id"]})
+            await async_call_service("light", "turn_off", {"entity_id": c["entity_id"]})
             return {"message": f"{c['name']} desligada."}
 
     return {"message": "Não encontrei essa luz."}
 
 # ---------------- ALL ----------------
 
-def handle_all(intent: dict):
+async def async_handle_all(intent: dict):
     service = "turn_on" if intent["intent"] == "all_on" else "turn_off"
-    call_service("light", service, {"entity_id": "light.all_light_entities"})
+    await async_call_service("light", service, {"entity_id": "light.all_light_entities"})
     return {"message": "Comando executado para todas as luzes."}
+
+# ---------------- SYNC API ----------------
+# Wrappers finos sobre as versoes async_ (testes e scripts)
+
+def get_all_lights():
+    return run_sync(async_get_all_lights())
+
+def get_lights_on():
+    return run_sync(async_get_lights_on())
+
+def find_light_entities(search: str, lights: list = None):
+    return run_sync(async_find_light_entities(search, lights))
+
+def handle(intent: dict):
+    return run_sync(async_handle(intent))
+
+def handle_single(intent: dict):
+    return run_sync(async_handle_single(intent))
+
+def handle_multi(intent: dict):
+    return run_sync(async_handle_multi(intent))
+
+def handle_confirmation(intent: dict):
+    return run_sync(async_handle_confirmation(intent))
+
+def handle_all(intent: dict):
+    return run_sync(async_handle_all(intent))
@@ -0,0 +1,161 @@
+import heapq
+import re
+import unicodedata
+from collections import Counter
+
+from core.state_mirror import names_key
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Similaridade minima (Dice sobre trigramas) para aceitar um candidato
+MIN_SCORE = 0.45
+
+FILLER_WORDS = {"do", "da", "de", "dos", "das"}
+
+# ---------------- TRIGRAMAS ----------------
+
+def normalize_text(text: str) -> str:
+    """Minusculas, sem acentos, pontuacao ou preposicoes."""
+    text = unicodedata.normalize("NFKD", text or "")\
+        .encode("ascii", "ignore")\
+        .decode("ascii")\
+        .lower()
+    words = re.sub(r"[^a-z0-9]+", " ", text).split()
+    return " ".join(w for w in words if w not in FILLER_WORDS)
+
+def trigrams(text: str) -> set[str]:
+    """Trigramas de cada palavra com bordas (' sala ' -> ' sa', 'sal', 'ala', 'la ')."""
+    grams = set()
+    for word in normalize_text(text).split():
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+# ---------------- INDEX ----------------
+
+class TrigramIndex:
+    """
+    Indice invertido trigrama -> documentos.
+
+    Os candidatos saem apenas dos trigramas raros da busca (presentes em
+    poucos documentos), contados de uma vez com Counter sobre as listas de
+    postings. So esses candidatos recebem o Dice exato contra o conjunto de
+    trigramas do documento, entao trigramas comuns como ' lu'/'luz' nao
+    fazem a busca visitar a casa inteira.
+    """
+
+    # Trigramas presentes em mais documentos que isso nao geram candidatos
+    COMMON_MIN_DF = 32
+    COMMON_RATIO = 0.05
+
+    def __init__(self):
+        self._keys = []
+        self._grams = []
+        self._postings = {}
+        self._common_df = self.COMMON_MIN_DF
+
+    def __len__(self):
+        return len(self._keys)
+
+    def build(self, items):
+        """items: iteravel de (chave, nome)"""
+        postings = {}
+        self._keys = []
+        self._grams = []
+
+        for key, name in items:
+            doc = len(self._keys)
+            grams = frozenset(trigrams(name))
+            self._keys.append(key)
+            self._grams.append(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(doc)
+
+        self._postings = {gram: tuple(docs) for gram, docs in postings.items()}
+        self._common_df = max(self.COMMON_MIN_DF, int(len(self._keys) * self.COMMON_RATIO))
+
+    def search(self, query: str, limit: int = 5, min_score: float = MIN_SCORE) -> list[tuple]:
+        """
+        Candidatos ordenados por similaridade.
+
+        Returns:
+            lista de (chave, score) com score em [0, 1]
+        """
+        grams = trigrams(query)
+        if not grams:
+            return []
+
+        postings = [self._postings[g] for g in grams if g in self._postings]
+        rare = [docs for docs in postings if len(docs) <= self._common_df]
+
+        counts = Counter()
+        for docs in rare or postings:
+            counts.update(docs)
+
+        query_size = len(grams)
+        doc_grams = self._grams
+        scored = []
+        for doc in counts:
+            shared = len(grams & doc_grams[doc])
+            scored.append((2 * shared / (query_size + len(doc_grams[doc])), doc))
+
+        # Empates mantem a ordem original dos documentos
+        best = heapq.nlargest(
+            limit,
+            (s for s in scored if s[0] >= min_score),
+            key=lambda s: (s[0], -s[1]),
+        )
+        return [(self._keys[doc], round(score, 3)) for score, doc in best]
+
+
+class EntityIndex:
+    """
+    Indices de trigramas dos friendly_name, um por dominio de entidade.
+
+    Reconstruido apenas quando entidades ou nomes mudam (ver names_key).
+    """
+
+    def __init__(self):
+        self._key = None
+        self._domains = {}
+        self.rebuilds = 0
+
+    def refresh(self, states: list):
+        key = names_key(states)
+        if key == self._key:
+            return
+
+        by_domain = {}
+        for e in states:
+            domain = e["entity_id"].split(".", 1)[0]
+            name = e.get("attributes", {}).get("friendly_name") or e["entity_id"].split(".", 1)[-1]
+            by_domain.setdefault(domain, []).append((e["entity_id"], name))
+
+        self._domains = {}
+        for domain, items in by_domain.items():
+            index = TrigramIndex()
+            index.build(items)
+            self._domains[domain] = index
+
+        self._key = key
+        self.rebuilds += 1
+        logger.debug("Indice fuzzy reconstruido: %d entidade(s), %d dominio(s)", len(states), len(self._domains))
+
+    def search(self, query: str, domain: str = None, limit: int = 5,
+               min_score: float = MIN_SCORE) -> list[tuple]:
+        """Candidatos (entity_id, score) de um dominio ou de todos."""
+        if domain is not None:
+            index = self._domains.get(domain)
+            return index.search(query, limit, min_score) if index else []
+
+        ranked = []
+        for index in self._domains.values():
+            ranked.extend(index.search(query, limit, min_score))
+        ranked.sort(key=lambda r: r[1], reverse=True)
+        return ranked[:limit]
+
+
+# Instancia compartilhada (todas as entidades do HA)
+entity_index = EntityIndex()
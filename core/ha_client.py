@@ -1,9 +1,16 @@
+import asyncio
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 
+import aiohttp
 import requests
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 
-from utils.logger import log_api_call, setup_logger
+from core.state_mirror import mirror
+from utils.logger import log_api_call, log_event, setup_logger
+from utils.metrics import span
 
 # Carrega variáveis de ambiente do arquivo .env
 load_dotenv()
@@ -13,47 +20,444 @@ logger = setup_logger(__name__)
 HA_URL = os.getenv("HA_URL")
 HA_TOKEN = os.getenv("HA_TOKEN")
 
+# Conexoes keep-alive mantidas abertas com o Home Assistant
+HA_POOL_SIZE = int(os.getenv("HA_POOL_SIZE", "10"))
+HA_TIMEOUT = 5
+
+# Limites por instancia do HA no caminho async. O rate limit vale para
+# todas as requisicoes do servidor, entao fica desligado por padrao (0);
+# HA_MAX_CONCURRENCY ja segura o fan-out dos comandos multi/compostos
+HA_MAX_CONCURRENCY = int(os.getenv("HA_MAX_CONCURRENCY", "4"))
+HA_RATE_LIMIT = float(os.getenv("HA_RATE_LIMIT", "0"))  # requisicoes/s
+
 HEADERS = {
     "Authorization": f"Bearer {HA_TOKEN}",
     "Content-Type": "application/json",
 }
 
+# ---------------- CLIENT ----------------
+
+def service_label(method: str, path: str) -> str:
+    """Rotulo da chamada nas metricas: "light.turn_on", "states" ou "state"."""
+    if path.startswith("/api/services/"):
+        return path[len("/api/services/"):].replace("/", ".", 1)
+    if path == "/api/states":
+        return "states"
+    if path.startswith("/api/states/"):
+        return "state"
+    return f"{method} {path}"
+
+class HAClient:
+    """
+    Cliente HTTP do Home Assistant com sessao persistente.
+
+    Mantem um pool de conexoes keep-alive compartilhado por todos os
+    dominios, evitando abrir uma conexao TCP nova a cada comando.
+    """
+
+    def __init__(self, base_url: str = None, headers: dict = None,
+                 pool_size: int = HA_POOL_SIZE, timeout: int = HA_TIMEOUT):
+        self.base_url = base_url if base_url is not None else HA_URL
+        self.headers = headers if headers is not None else HEADERS
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.session = None
+        self._adapter = None
+        self._open()
+
+    def _open(self):
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.mount("http://", self._adapter)
+        self.session.mount("https://", self._adapter)
+
+    def _ensure_open(self):
+        # Permite reutilizar o cliente apos close() (ex: scripts e testes)
+        if self.session is None:
+            self._open()
+
+    def post(self, path: str, data: dict):
+        self._ensure_open()
+        with span("ha", service=service_label("POST", path)):
+            return self.session.post(f"{self.base_url}{path}", json=data, timeout=self.timeout)
+
+    def get(self, path: str):
+        self._ensure_open()
+        with span("ha", service=service_label("GET", path)):
+            return self.session.get(f"{self.base_url}{path}", timeout=self.timeout)
+
+    def stats(self) -> dict:
+        """
+        Contadores de conexoes do pool.
+
+        Returns:
+            dict com requests feitas, conexoes novas e conexoes reaproveitadas
+        """
+        requests_count = 0
+        new_connections = 0
+
+        if self._adapter is not None:
+            pools = self._adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                requests_count += pool.num_requests
+                new_connections += pool.num_connections
+
+        return {
+            "requests": requests_count,
+            "new_connections": new_connections,
+            "reused_connections": max(requests_count - new_connections, 0),
+            "pool_size": self.pool_size,
+        }
+
+    def close(self):
+        """Fecha as conexoes do pool (chamado no shutdown do servidor)."""
+        if self.session is None:
+            return
+        log_event(logger, "Encerrando sessao HA | %(stats)s", stats=self.stats())
+        self.session.close()
+        self.session = None
+        self._adapter = None
+
+
+class RateLimiter:
+    """
+    Token bucket assincrono: no maximo `rate` requisicoes por segundo,
+    permitindo rajadas de ate `burst`.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = None
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+
+        now = asyncio.get_running_loop().time()
+        if self._updated is not None:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+        # Reserva o token mesmo sem saldo: o proximo a chegar espera mais
+        self._tokens -= 1
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self.rate)
+
+
+class AsyncHAClient:
+    """
+    Versao assincrona do HAClient (aiohttp).
+
+    Usada pelo caminho async_dispatch -> dominios, permitindo manter
+    centenas de comandos em andamento em um unico worker. A sessao e
+    criada sob demanda no event loop que a utiliza.
+    """
+
+    def __init__(self, base_url: str = None, headers: dict = None,
+                 pool_size: int = HA_POOL_SIZE, timeout: int = HA_TIMEOUT,
+                 max_concurrency: int = HA_MAX_CONCURRENCY,
+                 rate_limit: float = HA_RATE_LIMIT):
+        self.base_url = base_url if base_url is not None else HA_URL
+        self.headers = headers if headers is not None else HEADERS
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.rate_limit = rate_limit
+        self._session = None
+        self._loop = None
+        self._semaphore = None
+        self._limiter = None
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._requests = 0
+        self._new_connections = 0
+        self._reused_connections = 0
+
+    async def _on_new_connection(self, session, ctx, params):
+        self._new_connections += 1
+
+    async def _on_reused_connection(self, session, ctx, params):
+        self._reused_connections += 1
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is not None and not self._session.closed and self._loop is loop:
+            return self._session
+
+        # Sessao de outro event loop nao pode ser reaproveitada: fecha no
+        # loop dela se ainda roda; senao (ex: asyncio.run anterior ja
+        # terminou) solta o connector e fecha os sockets direto
+        old = self._session
+        if old is not None and not old.closed:
+            if self._loop.is_running():
+                asyncio.run_coroutine_threadsafe(old.close(), self._loop)
+            else:
+                connector = old.connector
+                old.detach()
+                connector._close()
+
+        trace = aiohttp.TraceConfig()
+        trace.on_connection_create_end.append(self._on_new_connection)
+        trace.on_connection_reuseconn.append(self._on_reused_connection)
+
+        self._session = aiohttp.ClientSession(
+            headers=self.headers,
+            connector=aiohttp.TCPConnector(limit=self.pool_size),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            trace_configs=[trace],
+        )
+        # Limites sao primitivas do event loop: recriados junto com a sessao
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._limiter = RateLimiter(self.rate_limit, burst=self.max_concurrency)
+        self._loop = loop
+        return self._session
+
+    async def request(self, method: str, path: str, data: dict = None,
+                      not_found_ok: bool = False):
+        """
+        Executa uma requisicao no HA.
+
+        Returns:
+            tupla (status, corpo JSON ou None)
+        """
+        session = self._get_session()
+        # Inclui a espera do rate limit e do semaforo: e o que o comando sente
+        with span("ha", service=service_label(method, path)):
+            return await self._request(session, method, path, data, not_found_ok)
+
+    async def _request(self, session, method, path, data, not_found_ok):
+        await self._limiter.acquire()
+
+        async with self._semaphore:
+            self._requests += 1
+            self._in_flight += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+            try:
+                async with session.request(method, f"{self.base_url}{path}", json=data) as r:
+                    raw = await r.read()
+                    if not (not_found_ok and r.status == 404):
+                        r.raise_for_status()
+                    return r.status, (json.loads(raw) if raw else None)
+            finally:
+                self._in_flight -= 1
+
+    def stats(self) -> dict:
+        """Contadores de conexoes (mesmo formato de HAClient.stats)."""
+        return {
+            "requests": self._requests,
+            "new_connections": self._new_connections,
+            "reused_connections": self._reused_connections,
+            "pool_size": self.pool_size,
+            "in_flight": self._in_flight,
+            "peak_in_flight": self._peak_in_flight,
+        }
+
+    async def close(self):
+        if self._session is None or self._session.closed:
+            return
+        log_event(logger, "Encerrando sessao async HA | %(stats)s", stats=self.stats())
+        await self._session.close()
+        self._session = None
+
+
+# Instancias compartilhadas por todos os dominios
+client = HAClient()
+async_client = AsyncHAClient()
+
+# Consultas paralelas de get_states (uma thread por conexao do pool)
+_executor = ThreadPoolExecutor(max_workers=HA_POOL_SIZE, thread_name_prefix="ha-client")
+
 # ---------------- CORE CALL ----------------
 
 def call_service(domain: str, service: str, data: dict):
-    url = f"{HA_URL}/api/services/{domain}/{service}"
-    logger.debug(f"Chamando servico: {domain}.{service} | Data: {data}")
-    
+    path = f"/api/services/{domain}/{service}"
+    url = f"{client.base_url}{path}"
+    logger.debug("Chamando servico: %s.%s | Data: %s", domain, service, data)
+
     try:
-        r = requests.post(url, headers=HEADERS, json=data, timeout=5)
+        r = client.post(path, data)
         r.raise_for_status()
         log_api_call(logger, "POST", url, r.status_code)
         return True
     except requests.exceptions.Timeout:
-        log_api_call(logger, "POST", url, error="Timeout (5s)")
+        log_api_call(logger, "POST", url, error=f"Timeout ({client.timeout}s)")
         raise
     except requests.exceptions.RequestException as e:
         log_api_call(logger, "POST", url, error=str(e))
         raise
 
+# ---------------- BATCHING ----------------
+
+def coalesce_calls(calls: list[dict]) -> list[dict]:
+    """
+    Agrupa chamadas compativeis em uma unica chamada por grupo.
+
+    Chamadas com mesmo dominio, servico e dados (exceto entity_id) viram uma
+    so, com a lista de entity_id unida na ordem original.
+
+    Args:
+        calls: lista de {"domain", "service", "data"}
+
+    Returns:
+        lista de {"domain", "service", "data", "members"}, onde members sao
+        os indices em `calls` atendidos pelo grupo
+    """
+    groups = {}
+
+    for index, call in enumerate(calls):
+        data = dict(call["data"])
+        entity_ids = data.pop("entity_id", [])
+        if isinstance(entity_ids, str):
+            entity_ids = [entity_ids]
+        key = (call["domain"], call["service"], json.dumps(data, sort_keys=True, default=str))
+
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {
+                "domain": call["domain"],
+                "service": call["service"],
+                "data": data,
+                "entity_ids": [],
+                "members": [],
+            }
+        for entity_id in entity_ids:
+            if entity_id not in group["entity_ids"]:
+                group["entity_ids"].append(entity_id)
+        group["members"].append(index)
+
+    result = []
+    for group in groups.values():
+        data = group.pop("data")
+        entity_ids = group.pop("entity_ids")
+        if entity_ids:
+            data = {"entity_id": entity_ids, **data}
+        result.append({**group, "data": data})
+    return result
+
 # ---------------- STATES ----------------
 
 def get_all_states():
-    url = f"{HA_URL}/api/states"
-    
+    # Servido do espelho local quando a conexao WebSocket esta ativa
+    if mirror.ready:
+        return mirror.all()
+
+    path = "/api/states"
+    url = f"{client.base_url}{path}"
+
     try:
-        r = requests.get(url, headers=HEADERS, timeout=5)
+        r = client.get(path)
         r.raise_for_status()
         states = r.json()
         log_api_call(logger, "GET", url, r.status_code)
-        logger.debug(f"Recuperados {len(states)} estados")
+        logger.debug("Recuperados %d estados", len(states))
         return states
     except requests.exceptions.RequestException as e:
         log_api_call(logger, "GET", url, error=str(e))
         raise
 
 def get_state(entity_id: str) -> str | None:
-    for e in get_all_states():
-        if e["entity_id"] == entity_id:
-            return e["state"]
-    return None
+    """Estado de uma unica entidade via /api/states/<entity_id> (None se nao existir)."""
+    if mirror.ready:
+        e = mirror.get(entity_id)
+        return e["state"] if e else None
+
+    path = f"/api/states/{entity_id}"
+    url = f"{client.base_url}{path}"
+
+    try:
+        r = client.get(path)
+        if r.status_code == 404:
+            log_api_call(logger, "GET", url, r.status_code)
+            return None
+        r.raise_for_status()
+        log_api_call(logger, "GET", url, r.status_code)
+        return r.json()["state"]
+    except requests.exceptions.RequestException as e:
+        log_api_call(logger, "GET", url, error=str(e))
+        raise
+
+def get_states(entity_ids: list[str]) -> dict[str, str | None]:
+    """
+    Estados de varias entidades em uma unica ida ao Home Assistant.
+
+    A API REST nao tem consulta em lote: as requisicoes por entidade sao
+    disparadas em paralelo sobre o pool keep-alive, entao o tempo total e
+    o de uma unica requisicao.
+
+    Returns:
+        dict entity_id -> estado (None se a entidade nao existir)
+    """
+    if mirror.ready:
+        result = {}
+        for entity_id in entity_ids:
+            e = mirror.get(entity_id)
+            result[entity_id] = e["state"] if e else None
+        return result
+
+    if len(entity_ids) <= 1:
+        return {entity_id: get_state(entity_id) for entity_id in entity_ids}
+
+    return dict(zip(entity_ids, _executor.map(get_state, entity_ids)))
+
+# ---------------- ASYNC API ----------------
+
+async def async_call_service(domain: str, service: str, data: dict):
+    path = f"/api/services/{domain}/{service}"
+    url = f"{async_client.base_url}{path}"
+    logger.debug("Chamando servico: %s.%s | Data: %s", domain, service, data)
+
+    try:
+        status, _ = await async_client.request("POST", path, data)
+        log_api_call(logger, "POST", url, status)
+        return True
+    except asyncio.TimeoutError:
+        log_api_call(logger, "POST", url, error=f"Timeout ({async_client.timeout}s)")
+        raise
+    except aiohttp.ClientError as e:
+        log_api_call(logger, "POST", url, error=str(e))
+        raise
+
+async def async_get_all_states():
+    if mirror.ready:
+        return mirror.all()
+
+    path = "/api/states"
+    url = f"{async_client.base_url}{path}"
+
+    try:
+        status, states = await async_client.request("GET", path)
+        log_api_call(logger, "GET", url, status)
+        logger.debug("Recuperados %d estados", len(states))
+        return states
+    except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+        log_api_call(logger, "GET", url, error=str(e) or "Timeout")
+        raise
+
+async def async_get_state(entity_id: str) -> str | None:
+    if mirror.ready:
+        e = mirror.get(entity_id)
+        return e["state"] if e else None
+
+    path = f"/api/states/{entity_id}"
+    url = f"{async_client.base_url}{path}"
+
+    try:
+        status, body = await async_client.request("GET", path, not_found_ok=True)
+        log_api_call(logger, "GET", url, status)
+        return body["state"] if status != 404 else None
+    except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+        log_api_call(logger, "GET", url, error=str(e) or "Timeout")
+        raise
+
+async def async_get_states(entity_ids: list[str]) -> dict[str, str | None]:
+    if mirror.ready:
+        return get_states(entity_ids)
+
+    states = await asyncio.gather(*(async_get_state(i) for i in entity_ids))
+    return dict(zip(entity_ids, states))
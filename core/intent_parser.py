@@ -1,9 +1,18 @@
+import os
+import re
+import threading
 import unicodedata
+from collections import Counter, OrderedDict
 
+from core.matcher import KeywordMatcher
 from utils.logger import setup_logger
+from utils.metrics import span
 
 logger = setup_logger(__name__)
 
+# Frases distintas memorizadas por parse() (0 desativa o cache)
+PARSE_CACHE_SIZE = int(os.getenv("PARSE_CACHE_SIZE", "1024"))
+
 # ------------------ NORMALIZAÇÃO ------------------
 
 STOPWORDS = {
@@ -15,20 +24,39 @@ STOPWORDS = {
     "a", "o", "as", "os", "um", "uma", "uns", "umas"
 }
 
+def _fold(text: str) -> str:
+    """Sem acentos e em minusculas (sem tirar stopwords)."""
+    return unicodedata.normalize("NFKD", text)\
+        .encode("ascii", "ignore")\
+        .decode("ascii")\
+        .lower()
+
 def normalize(text: str) -> str:
     if not text:
         return ""
 
-    text = unicodedata.normalize("NFKD", text)\
-        .encode("ascii", "ignore")\
-        .decode("ascii")\
-        .lower()
+    text = _fold(text)
 
     words = [w for w in text.split() if w not in STOPWORDS]
     normalized = " ".join(words)
-    logger.debug(f"Normalizado: '{text}' -> '{normalized}'")
+    logger.debug("Normalizado: '%s' -> '%s'", text, normalized)
     return normalized
 
+# Separador do lote: nao muda com NFKD/ascii/lower e nao aparece em texto falado
+_BATCH_SEP = "\x00"
+
+def normalize_many(texts: list[str]) -> list[str]:
+    """normalize() de um lote inteiro com uma unica passada de Unicode."""
+    if any(_BATCH_SEP in t for t in texts):
+        return [normalize(t) for t in texts]
+
+    folded = unicodedata.normalize("NFKD", _BATCH_SEP.join(texts))\
+        .encode("ascii", "ignore")\
+        .decode("ascii")\
+        .lower()\
+        .split(_BATCH_SEP)
+    return [" ".join(w for w in f.split() if w not in STOPWORDS) for f in folded]
+
 def extract_number(text: str) -> int | None:
     """Extrai o primeiro número encontrado no texto."""
     import re
@@ -45,10 +73,12 @@ def extract_temperature_range(text: str) -> tuple[int, int] | None:
 
 def extract_room_from_climate(raw: str, text_lower: str) -> str | None:
     """Extrai cômodo da busca de climate (quarto, closet, etc)."""
-    if "quarto" in raw or "quarto" in text_lower:
-        return "quarto"
-    if "closet" in raw or "closet" in text_lower:
-        return "closet"
+    return _room(_MATCHER.labels(raw), _MATCHER.labels(text_lower))
+
+def _room(found: set, lower: set) -> str | None:
+    for room in ROOMS:
+        if room in found or room in lower:
+            return room
     return None
 
 # ------------------ VOCABULÁRIO ------------------
@@ -67,268 +97,522 @@ CLIMATE_FEATURES = {
     "display": ["tela", "display", "scoreboard"]
 }
 
+CLIMATE_PHRASES = ["ar-condicionado", "ar condicionado", "arcondicionados", "ar-condicionados"]
+
+# Detectados no TEXTO ORIGINAL (antes de normalizar, para pegar "os")
+CLIMATE_PLURAL_TERMS = [
+    "todos",
+    "os dois",
+    "dois ar",
+    "arcondicionados",
+    "ar-condicionados",
+    "todos ar",
+    "todos ar-",
+    "todos arcondicionado"
+]
+
+SPEED_UP = ["aumentar", "subir"]
+SPEED_DOWN = ["abaixar", "diminuir", "reduzir"]
+ROOMS = ["quarto", "closet"]
+
+# ------------------ AUTOMATO ------------------
+
+def _build_vocabulary() -> dict:
+    """palavra -> rotulos (cada palavra tambem e rotulo de si mesma)"""
+    vocabulary = {}
+
+    def tag(label, words):
+        for w in words:
+            vocabulary.setdefault(w, set()).add(label)
+
+    for feature, words in CLIMATE_FEATURES.items():
+        tag("climate_feature", words)
+        tag(feature, words)
+    tag("climate_phrase", CLIMATE_PHRASES)
+    tag("plural", CLIMATE_PLURAL_TERMS)
+    tag("light_type", LIGHT_TYPES)
+    tag("action", ACTIONS_ON + ACTIONS_OFF)
+    tag("speed_up", SPEED_UP)
+    tag("speed_down", SPEED_DOWN)
+    tag("room", ROOMS)
+    tag("all", ["todas"])
+    tag("and", [" e "])
+    return vocabulary
+
+def reload_vocabulary():
+    """
+    Recompila o automato a partir das listas acima.
+
+    Chamar depois de alterar o vocabulario (ex: novo sinonimo); invalida
+    o cache de parse().
+    """
+    global _MATCHER, _TARGET_WORDS, ACTION_WORDS, WORD_LABELS
+    # Acoes e "ar" sao comparados por palavra inteira; o resto por substring
+    ACTION_WORDS = {**{a: "on" for a in ACTIONS_ON}, **{a: "off" for a in ACTIONS_OFF}}
+    WORD_LABELS = {w: frozenset({w, "action", a}) for w, a in ACTION_WORDS.items()}
+    WORD_LABELS["ar"] = frozenset({"ar"})
+    _TARGET_WORDS = frozenset(ACTIONS_ON + ACTIONS_OFF + LIGHT_TYPES)
+    # Compilado uma vez: cada texto e varrido uma unica vez, qualquer que
+    # seja o tamanho do vocabulario
+    _MATCHER = KeywordMatcher(_build_vocabulary())
+    parse_cache.clear()
+
+# ------------------ CACHE ------------------
+
+class ParseCache:
+    """
+    Memo LRU de parse(), chaveado pelo texto cru.
+
+    Usuarios de voz repetem poucas frases o dia inteiro; a normalizacao e a
+    cadeia de regras so rodam na primeira vez. Guarda e devolve copias dos
+    intents, entao um handler que altera o dict nao corrompe o cache.
+    """
+
+    def __init__(self, maxsize: int = PARSE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, text: str) -> dict | None:
+        with self._lock:
+            intent = self._entries.get(text)
+            if intent is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(text)
+            self.hits += 1
+        return _copy_intent(intent)
+
+    def put(self, text: str, intent: dict):
+        if self.maxsize <= 0:
+            return
+        intent = _copy_intent(intent)
+        with self._lock:
+            self._entries[text] = intent
+            self._entries.move_to_end(text)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+            }
+
+
+def _copy_intent(intent: dict) -> dict:
+    """Copia o intent (e listas como 'entities' e os sub-intents de 'commands')."""
+    return {
+        k: [_copy_intent(x) if isinstance(x, dict) else x for x in v] if isinstance(v, list) else v
+        for k, v in intent.items()
+    }
+
+
+parse_cache = ParseCache()
+reload_vocabulary()
+
+
 # ------------------ PARSER ------------------
 
 def parse(text: str):
-    raw = normalize(text)
-
-    # ---- VERIFICA FEATURES DE CLIMATE (antes de checar por "ar")
-    text_lower = text.lower()
-    
-    # Checagem rápida: se tem algum feature de climate, trata como climate
-    has_climate_feature = any(
-        any(feat in text_lower for feat in CLIMATE_FEATURES[feature])
-        for feature in CLIMATE_FEATURES
-    )
-    
-    # ---- CLIMATE (com features ou com "ar")
+    """Intent do comando (memorizado por texto; ver ParseCache)."""
+    with span("parse") as labels:
+        intent = parse_cache.get(text)
+        labels["cache"] = "miss" if intent is None else "hit"
+        if intent is None:
+            intent = _parse(text)
+            parse_cache.put(text, intent)
+        labels["domain"] = intent.get("domain")
+        labels["intent"] = intent.get("intent")
+    return intent
+
+def parse_many(texts: list[str]) -> list[dict]:
+    """
+    parse() de um lote, na mesma ordem.
+
+    Textos repetidos sao analisados uma vez; normalizacao e minusculas rodam
+    numa passada so para o lote, e textos com o mesmo normalizado
+    compartilham tokens e rotulos.
+    """
+    results = {}
+    pending = []
+    for text in texts:
+        if text in results:
+            continue
+        intent = parse_cache.get(text)
+        results[text] = intent
+        if intent is None:
+            pending.append(text)
+
+    if pending:
+        raws = normalize_many(pending)
+        lowers = _BATCH_SEP.join(pending).lower().split(_BATCH_SEP)
+        if len(lowers) != len(pending):
+            lowers = [t.lower() for t in pending]
+        shared = {}
+        for text, raw, lower in zip(pending, raws, lowers):
+            intent, _ = _ENGINE.evaluate(Utterance(text, raw, lower, shared))
+            parse_cache.put(text, intent)
+            results[text] = intent
+
+    # Cada posicao recebe seu proprio dict, mesmo com textos repetidos
+    return [_copy_intent(results[text]) for text in texts]
+
+def explain(text: str) -> dict:
+    """
+    Parse sem cache, com as regras consideradas e avaliadas.
+
+    Returns:
+        {"intent": ..., "candidates": [nomes], "evaluated": [nomes]}
+    """
+    utterance = Utterance(text)
+    intent, evaluated = _ENGINE.evaluate(utterance)
+    return {
+        "intent": intent,
+        "candidates": [rule["name"] for rule in _ENGINE.candidates(utterance)],
+        "evaluated": evaluated,
+    }
+
+def _parse(text: str):
+    intent, evaluated = _ENGINE.evaluate(Utterance(text))
+    logger.debug("Regras avaliadas: %s", evaluated)
+    return intent
+
+# ------------------ UTTERANCE ------------------
+
+class Utterance:
+    """
+    Tudo que as regras consultam sobre o texto, calculado uma vez.
+
+    Zonas de rotulos (as mesmas de RULES[*]["when"]):
+        text:       substrings do texto original em minusculas
+        normalized: substrings do texto normalizado (sem acentos/stopwords)
+        words:      palavras inteiras do texto normalizado
+    """
+
+    __slots__ = ("text", "raw", "text_lower", "words", "zones", "actions", "action_on", "action_off")
+
+    def __init__(self, text: str, raw: str = None, text_lower: str = None, shared: dict = None):
+        """
+        raw/text_lower: ja calculados (parse_many).
+        shared: memo normalizado -> (palavras, rotulos) compartilhado por um lote.
+        """
+        self.text = text
+        self.raw = normalize(text) if raw is None else raw
+        self.text_lower = text.lower() if text_lower is None else text_lower
+
+        analysis = shared.get(self.raw) if shared is not None else None
+        if analysis is None:
+            words = self.raw.split()
+            word_labels = set()
+            for w in words:
+                word_labels |= WORD_LABELS.get(w, frozenset())
+            analysis = (words, _MATCHER.labels(self.raw), word_labels)
+            if shared is not None:
+                shared[self.raw] = analysis
+        self.words, normalized, word_labels = analysis
+
+        # Uma varredura por texto: rotulos do texto original e do normalizado
+        self.zones = {
+            "text": _MATCHER.labels(self.text_lower),
+            "normalized": normalized,
+            "words": word_labels,
+        }
+        self._find_actions()
+
+    @classmethod
+    def from_zones(cls, text: str, raw: str, words: list, zones: dict):
+        """Utterance com tokens e rotulos ja calculados (IncrementalParser)."""
+        u = cls.__new__(cls)
+        u.text = text
+        u.raw = raw
+        u.text_lower = None
+        u.words = words
+        u.zones = zones
+        u._find_actions()
+        return u
+
+    def _find_actions(self):
+        self.actions = {w: ACTION_WORDS[w] for w in self.words if w in ACTION_WORDS}
+        self.action_on = "on" in self.zones["words"]
+        self.action_off = "off" in self.zones["words"]
+
+    def has(self, zone: str, label: str) -> bool:
+        return label in self.zones[zone]
+
+    def room(self) -> str | None:
+        return _room(self.zones["normalized"], self.zones["text"])
+
+# ------------------ REGRAS ------------------
+#
+# Cada regra recebe (rule, utterance) e devolve o intent ou None para
+# passar a vez. As regras sao avaliadas na ordem de RULES, mas so as que
+# tem algum rotulo de "when" presente no texto (sem "when": sempre).
+
+_AND = re.compile(r"\s+e\s+", re.IGNORECASE)
+
+_DOMAIN_LABELS = frozenset({"light_type", "climate_feature", "climate_phrase"})
+
+def _names_domain(raw: str) -> bool:
+    """Trecho cita luz/led ou o ar (ou uma sub-feature dele)."""
+    return bool(_MATCHER.labels(raw) & _DOMAIN_LABELS) or "ar" in raw.split()
+
+_VERB = re.compile(r"\w+[aei]r$")
+
+def _other_verb(raw: str) -> bool:
+    """Trecho comeca por um verbo que nao e acao ("reduzir luz", "aumentar ...")."""
     words = raw.split()
-    
-    if has_climate_feature or "ar" in words or "ar-condicionado" in raw or "ar condicionado" in raw or "arcondicionados" in raw or "ar-condicionados" in raw:
-        # Verifica sub-features (ventilador, aquecedor, temperatura, velocidade, tela)
-        text_lower = text.lower()
-        
-        # FAN (ventilador)
-        if any(feat in text_lower for feat in CLIMATE_FEATURES["fan"]):
-            action_on = any(a in words for a in ACTIONS_ON)
-            action_off = any(a in words for a in ACTIONS_OFF)
-            
-            if not action_on and not action_off:
-                return {
-                    "intent": "error",
-                    "domain": "climate",
-                    "response": "Você quer ligar ou desligar o ventilador?",
-                    "text": text
-                }
-            
-            action = "on" if action_on else "off"
-            room = extract_room_from_climate(raw, text_lower)
-            
-            return {
-                "intent": f"fan_{action}",
-                "domain": "climate",
-                "room": room,
-                "text": text
-            }
-        
-        # HEATER (aquecedor)
-        if any(feat in text_lower for feat in CLIMATE_FEATURES["heater"]):
-            action_on = any(a in words for a in ACTIONS_ON)
-            action_off = any(a in words for a in ACTIONS_OFF)
-            
-            if not action_on and not action_off:
-                return {
-                    "intent": "error",
-                    "domain": "climate",
-                    "response": "Você quer ligar ou desligar o aquecedor?",
-                    "text": text
-                }
-            
-            action = "on" if action_on else "off"
-            room = extract_room_from_climate(raw, text_lower)
-            
-            return {
-                "intent": f"heater_{action}",
-                "domain": "climate",
-                "room": room,
-                "text": text
-            }
-        
-        # DISPLAY (tela)
-        if any(feat in text_lower for feat in CLIMATE_FEATURES["display"]):
-            if any(a in words for a in ACTIONS_OFF + ["desligar", "apagar"]):
-                room = extract_room_from_climate(raw, text_lower)
-                return {
-                    "intent": "display_off",
-                    "domain": "climate",
-                    "room": room,
-                    "text": text
-                }
-        
-        # TEMPERATURE (temperatura)
-        if any(feat in text_lower for feat in CLIMATE_FEATURES["temperature"]):
-            temp_range = extract_temperature_range(text)
-            if temp_range:
-                room = extract_room_from_climate(raw, text_lower)
-                return {
-                    "intent": "set_temperature",
-                    "domain": "climate",
-                    "room": room,
-                    "value": temp_range[0],  # Usa primeiro valor do range como temperatura
-                    "text": text
-                }
-            
-            temp = extract_number(text)
-            if temp:
-                room = extract_room_from_climate(raw, text_lower)
-                return {
-                    "intent": "set_temperature",
-                    "domain": "climate",
-                    "room": room,
-                    "value": temp,
-                    "text": text
-                }
-            
-            return {
-                "intent": "error",
-                "domain": "climate",
-                "response": "Qual temperatura você quer? Ex: 22 graus.",
-                "text": text
-            }
-        
-        # SPEED (velocidade do ventilador)
-        if any(feat in text_lower for feat in CLIMATE_FEATURES["speed"]):
-            if "aumentar" in text_lower or "aumentar" in raw or "subir" in raw:
-                room = extract_room_from_climate(raw, text_lower)
-                return {
-                    "intent": "increase_speed",
-                    "domain": "climate",
-                    "room": room,
-                    "text": text
-                }
-            
-            if "abaixar" in text_lower or "diminuir" in text_lower or "reduzir" in raw:
-                room = extract_room_from_climate(raw, text_lower)
-                return {
-                    "intent": "decrease_speed",
-                    "domain": "climate",
-                    "room": room,
-                    "text": text
-                }
-            
-            speed = extract_number(text)
-            if speed:
-                room = extract_room_from_climate(raw, text_lower)
-                return {
-                    "intent": "set_speed",
-                    "domain": "climate",
-                    "room": room,
-                    "value": speed,
-                    "text": text
-                }
-            
-            return {
-                "intent": "error",
-                "domain": "climate",
-                "response": "Qual velocidade? Ex: velocidade 2",
-                "text": text
-            }
-        
-        # ---- LIGAR/DESLIGAR AR (comportamento existente)
-        # Detecta ação
-        action_on = any(a in words for a in ACTIONS_ON)
-        action_off = any(a in words for a in ACTIONS_OFF)
-        
-        if not action_on and not action_off:
-            return {
-                "intent": "error",
-                "domain": "climate",
-                "response": "Você quer ligar ou desligar o ar?",
-                "text": text
-            }
-        
-        action = "on" if action_on else "off"
-        
-        # Detecta plural no TEXTO ORIGINAL (antes de normalizar, para pegar "os")
-        is_plural = any(term in text_lower for term in [
-            "todos", 
-            "os dois", 
-            "dois ar", 
-            "arcondicionados",
-            "ar-condicionados",
-            "todos ar",
-            "todos ar-",
-            "todos arcondicionado"
-        ])
-        
-        # Se plural, retorna all_on/all_off
-        if is_plural:
-            return {
-                "intent": "all_on" if action == "on" else "all_off",
-                "domain": "climate",
-                "text": text
-            }
-        
-        # Singular: remove palavras de ação e tipo, mantendo somente o cômodo
-        blacklist = set(ACTIONS_ON + ACTIONS_OFF + ["ar", "condicionado"])
-        target_words = [w for w in words if w not in blacklist]
-    
-        search = " ".join(target_words)
-    
+    return (bool(words) and words[0] != "ar" and words[0] not in ACTION_WORDS
+            and bool(_VERB.match(words[0])))
+
+def split_compound(text: str) -> list[str]:
+    """
+    Trechos de um comando composto ("ligar luz da sala e ligar ar do quarto").
+
+    Trecho sem acao herda a do anterior: "ligar luz da sala e ar do quarto"
+    vira ["ligar luz da sala", "ligar ar do quarto"]. Trecho sem luz nem ar
+    continua o anterior: "ligar luz da sala e da cozinha e ligar ar do
+    quarto" vira ["ligar luz da sala e da cozinha", "ligar ar do quarto"]
+    (o primeiro e um multi das luzes). Trecho com um verbo que nao e acao
+    ("acender ar e reduzir luz do quarto") fica como esta: herdar "acender"
+    trocaria o sentido.
+    """
+    segments = []
+    action = None
+    for segment in _AND.split(text.strip()):
+        if not segment:
+            continue
+        raw = normalize(segment)
+        found = [w for w in raw.split() if w in ACTION_WORDS]
+        if segments and not _names_domain(raw):
+            segments[-1] = f"{segments[-1]} e {segment}"
+        elif found or not action or _other_verb(raw):
+            segments.append(segment)
+        else:
+            segments.append(f"{action} {segment}")
+        if found:
+            action = found[-1]
+    return segments
+
+def _compound(rule, u):
+    """
+    Trechos de dominios diferentes: cada um vira seu proprio intent.
+
+    Dentro de um dominio so continua valendo o resto das regras (multi das
+    luzes, sub-features do ar). Trechos sem dominio ja vem juntados ao
+    anterior (split_compound); se ainda assim um trecho nao e comando
+    sozinho, a divisao e desfeita. Trecho com um verbo que nao e acao e que
+    nao foi entendido torna a frase toda nao entendida: sem ele, o resto da
+    frase seria lido com a acao do outro trecho.
+    """
+    segments = split_compound(u.text)
+    if len(segments) < 2:
+        return None
+
+    commands = [parse(segment) for segment in segments]
+    for segment, command in zip(segments, commands):
+        if command and command["intent"] == "error" and _other_verb(normalize(segment)):
+            return {**command, "text": u.text}
+    if any(c is None or c["intent"] == "error" for c in commands):
+        return None
+    if len({c["domain"] for c in commands}) < 2:
+        return None
+
+    return {
+        "intent": "compound",
+        "domain": "compound",
+        "commands": commands,
+        "text": u.text
+    }
+
+def _feature_switch(rule, u):
+    """Liga/desliga de uma sub-feature do ar (ventilador, aquecedor)."""
+    if not u.action_on and not u.action_off:
         return {
-            "intent": action,
+            "intent": "error",
             "domain": "climate",
-            "search": search if search else "ar",
-            "text": text
+            "response": f"Você quer ligar ou desligar o {rule['noun']}?",
+            "text": u.text
         }
 
-    # ------------------ TODAS AS LUZES ------------------
-    if "todas" in raw and ("luz" in raw or "luzes" in raw):
-        if any(a in words for a in ACTIONS_ON):
-            return {
-                "intent": "all_on",
-                "domain": "light",
-                "entities": ["light.all_light_entities"],
-                "text": text
-            }
-        if any(a in words for a in ACTIONS_OFF):
-            return {
-                "intent": "all_off",
-                "domain": "light",
-                "entities": ["light.all_light_entities"],
-                "text": text
-            }
+    action = "on" if u.action_on else "off"
+    return {
+        "intent": f"{rule['feature']}_{action}",
+        "domain": "climate",
+        "room": u.room(),
+        "text": u.text
+    }
+
+def _display_off(rule, u):
+    if not u.action_off:
+        return None
+    return {
+        "intent": "display_off",
+        "domain": "climate",
+        "room": u.room(),
+        "text": u.text
+    }
+
+def _set_temperature(rule, u):
+    temp_range = extract_temperature_range(u.text)
+    if temp_range:
+        return {
+            "intent": "set_temperature",
+            "domain": "climate",
+            "room": u.room(),
+            "value": temp_range[0],  # Usa primeiro valor do range como temperatura
+            "text": u.text
+        }
+
+    temp = extract_number(u.text)
+    if temp:
+        return {
+            "intent": "set_temperature",
+            "domain": "climate",
+            "room": u.room(),
+            "value": temp,
+            "text": u.text
+        }
+
+    return {
+        "intent": "error",
+        "domain": "climate",
+        "response": "Qual temperatura você quer? Ex: 22 graus.",
+        "text": u.text
+    }
+
+def _speed(rule, u):
+    if u.has("text", "aumentar") or u.has("normalized", "aumentar") or u.has("normalized", "subir"):
+        return {
+            "intent": "increase_speed",
+            "domain": "climate",
+            "room": u.room(),
+            "text": u.text
+        }
 
-    # ------------------ MULTI ------------------
-    actions_found = []
-    for a in ACTIONS_ON:
-        if a in words:
-            actions_found.append("on")
-    for a in ACTIONS_OFF:
-        if a in words:
-            actions_found.append("off")
-
-    if (
-        len(actions_found) > 1
-        and any(t in raw for t in LIGHT_TYPES)
-    ) or (" e " in raw and any(a in words for a in ACTIONS_ON + ACTIONS_OFF)):
+    if u.has("text", "abaixar") or u.has("text", "diminuir") or u.has("normalized", "reduzir"):
+        return {
+            "intent": "decrease_speed",
+            "domain": "climate",
+            "room": u.room(),
+            "text": u.text
+        }
+
+    speed = extract_number(u.text)
+    if speed:
+        return {
+            "intent": "set_speed",
+            "domain": "climate",
+            "room": u.room(),
+            "value": speed,
+            "text": u.text
+        }
+
+    return {
+        "intent": "error",
+        "domain": "climate",
+        "response": "Qual velocidade? Ex: velocidade 2",
+        "text": u.text
+    }
+
+def _climate_power(rule, u):
+    """Ligar/desligar o ar (um comodo ou todos)."""
+    if not u.action_on and not u.action_off:
+        return {
+            "intent": "error",
+            "domain": "climate",
+            "response": "Você quer ligar ou desligar o ar?",
+            "text": u.text
+        }
+
+    action = "on" if u.action_on else "off"
+
+    if u.has("text", "plural"):
+        return {
+            "intent": "all_on" if action == "on" else "all_off",
+            "domain": "climate",
+            "text": u.text
+        }
+
+    # Singular: remove palavras de ação e tipo, mantendo somente o cômodo
+    blacklist = {"ar", "condicionado"}
+    target_words = [w for w in u.words if w not in blacklist and w not in ACTION_WORDS]
+    search = " ".join(target_words)
+
+    return {
+        "intent": action,
+        "domain": "climate",
+        "search": search if search else "ar",
+        "text": u.text
+    }
+
+def _all_lights(rule, u):
+    # ("luzes" contem "luz")
+    if not u.has("normalized", "luz"):
+        return None
+    if u.action_on:
+        intent = "all_on"
+    elif u.action_off:
+        intent = "all_off"
+    else:
+        return None
+    return {
+        "intent": intent,
+        "domain": "light",
+        "entities": ["light.all_light_entities"],
+        "text": u.text
+    }
+
+def _multi(rule, u):
+    if u.actions and (
+        (len(u.actions) > 1 and u.has("normalized", "light_type")) or u.has("normalized", "and")
+    ):
         return {
             "intent": "multi",
             "domain": "light",
-            "text": text
+            "text": u.text
         }
+    return None
 
-    # ------------------ SINGLE ------------------
-    if any(a in words for a in ACTIONS_ON):
+def _single_light(rule, u):
+    if u.action_on:
         action = "on"
-    elif any(a in words for a in ACTIONS_OFF):
+    elif u.action_off:
         action = "off"
     else:
         return {
             "intent": "error",
             "domain": "light",
             "response": "Não entendi.",
-            "text": text
+            "text": u.text
         }
 
-    light_type = None
-    for t in LIGHT_TYPES:
-        if t in raw:
-            light_type = t
-            break
+    found = u.zones["normalized"]
+    light_type = next((t for t in LIGHT_TYPES if t in found), None)
 
     if not light_type:
         return {
             "intent": "error",
             "domain": "light",
             "response": "Você quer controlar luz ou led?",
-            "text": text
+            "text": u.text
         }
 
-    target = raw
-    for w in ACTIONS_ON + ACTIONS_OFF + LIGHT_TYPES:
-        target = target.replace(w, "")
-
+    # Remove acoes e tipos numa passada (a mais longa vence: "desligar"
+    # sai inteiro, sem sobrar "des")
+    target = _MATCHER.strip(u.raw, _TARGET_WORDS)
     target = " ".join(target.split()).strip()
 
     return {
@@ -336,5 +620,252 @@ def parse(text: str):
         "domain": "light",
         "type": light_type,
         "search": f"{light_type} {target}".strip(),
-        "text": text
+        "text": u.text
     }
+
+# Ordem = prioridade. Compostos entre dominios vem antes de tudo (um "ar"
+# num dos trechos nao leva a frase inteira para climate). Sub-features do
+# ar vem antes de "ar"; qualquer texto que chegue em climate_power termina nela.
+RULES = [
+    {"name": "compound", "when": {"text": ["and"]}, "build": _compound},
+    {"name": "fan", "when": {"text": ["fan"]},
+     "build": _feature_switch, "feature": "fan", "noun": "ventilador"},
+    {"name": "heater", "when": {"text": ["heater"]},
+     "build": _feature_switch, "feature": "heater", "noun": "aquecedor"},
+    {"name": "display_off", "when": {"text": ["display"]}, "build": _display_off},
+    {"name": "temperature", "when": {"text": ["temperature"]}, "build": _set_temperature},
+    {"name": "speed", "when": {"text": ["speed"]}, "build": _speed},
+    {"name": "climate_power",
+     "when": {"text": ["climate_feature"], "words": ["ar"], "normalized": ["climate_phrase"]},
+     "build": _climate_power},
+    {"name": "all_lights", "when": {"normalized": ["todas"]}, "build": _all_lights},
+    {"name": "multi", "when": {"words": ["action"]}, "build": _multi},
+    {"name": "single_light", "build": _single_light},
+]
+
+# ------------------ MOTOR ------------------
+
+class RuleEngine:
+    """
+    Compila RULES num indice (zona, rotulo) -> regras.
+
+    Por parse, so as regras com algum rotulo presente sao avaliadas; o
+    custo depende dos rotulos do texto e nao do tamanho da gramatica.
+    evaluations conta, por regra, quantas vezes ela foi avaliada.
+    """
+
+    def __init__(self, rules: list):
+        self.rules = list(rules)
+        self._index = {}
+        self._always = []
+        self.evaluations = Counter()
+
+        for pos, rule in enumerate(self.rules):
+            when = rule.get("when")
+            if not when:
+                self._always.append(pos)
+                continue
+            for zone, labels in when.items():
+                by_label = self._index.setdefault(zone, {})
+                for label in labels:
+                    by_label.setdefault(label, []).append(pos)
+
+    def candidates(self, utterance: Utterance) -> list:
+        positions = set(self._always)
+        for zone, by_label in self._index.items():
+            for label in utterance.zones[zone]:
+                positions.update(by_label.get(label, ()))
+        return [self.rules[pos] for pos in sorted(positions)]
+
+    def evaluate(self, utterance: Utterance) -> tuple[dict | None, list]:
+        """(intent da primeira regra que responder, nomes das regras avaliadas)"""
+        evaluated = []
+        for rule in self.candidates(utterance):
+            evaluated.append(rule["name"])
+            self.evaluations[rule["name"]] += 1
+            intent = rule["build"](rule, utterance)
+            if intent is not None:
+                return intent, evaluated
+        return None, evaluated
+
+
+_ENGINE = RuleEngine(RULES)
+
+# ------------------ INCREMENTAL ------------------
+
+def is_complete(intent: dict | None) -> bool:
+    """
+    Intent que ja pode ser executado sem esperar o fim da frase.
+
+    Erros, multi e compound nunca sao completos (a frase ainda pode ganhar "e ...");
+    comandos de um alvo precisam do alvo ("ligar luz" sozinho espera o comodo),
+    e temperatura/velocidade precisam do valor e do comodo ("temperatura 22"
+    ainda pode ganhar "quarto").
+    Aqui so entra o texto: se o alvo resolve para uma entidade so (e nao e
+    prefixo de outro nome, "sala" x "sala de jantar") e checado pelo dominio
+    antes do despacho (dispatcher.async_target_settled).
+    """
+    if not intent or intent.get("intent") in ("error", "multi", "compound"):
+        return False
+
+    kind = intent["intent"]
+    if kind in ("on", "off"):
+        if intent["domain"] == "light":
+            return intent["search"] != intent["type"]
+        return intent.get("search", "ar") != "ar"
+    if kind in ("set_temperature", "set_speed"):
+        return intent.get("value") is not None and intent.get("room") is not None
+    if "room" in intent:
+        return intent["room"] is not None
+    return True
+
+
+def expand_commands(intent: dict | None) -> list[dict]:
+    """
+    Comandos simples de um intent: compound vira seus trechos e multi das
+    luzes vira um intent por trecho, com acao e tipo herdados ("ligar luz
+    da sala e da cozinha" -> on "luz sala", on "luz cozinha").
+    """
+    if not intent:
+        return []
+    if intent["intent"] == "compound":
+        return [c for command in intent["commands"] for c in expand_commands(command)]
+    if intent["intent"] != "multi":
+        return [intent]
+
+    commands = []
+    action = light_type = None
+    for segment in _AND.split(intent["text"].strip()):
+        words = normalize(segment).split()
+        actions = [w for w in words if w in ACTION_WORDS]
+        types = [w for w in words if w in LIGHT_TYPES]
+        prefix = [w for w in (None if actions else action, None if types else light_type) if w]
+        action = actions[-1] if actions else action
+        light_type = types[-1] if types else light_type
+        commands.append(parse(" ".join(prefix + [segment])))
+    return commands
+
+def same_command(a: dict | None, b: dict | None) -> bool:
+    """Mesmo comando, ignorando o texto de origem."""
+    if not a or not b:
+        return a is b
+    ignored = ("text", "response")
+    return ({k: v for k, v in a.items() if k not in ignored}
+            == {k: v for k, v in b.items() if k not in ignored})
+
+def remaining_commands(final: dict | None, dispatched: dict) -> list[dict] | None:
+    """
+    O que falta executar da frase final depois do despacho antecipado.
+
+    [] se a final e o mesmo comando; os demais trechos se o despachado e um
+    deles ("... e da cozinha"); None se a frase final nao contem o comando
+    despachado (transcricao revisada).
+    """
+    commands = expand_commands(final)
+    for index, command in enumerate(commands):
+        if same_command(command, dispatched):
+            return commands[:index] + commands[index + 1:]
+    return None
+
+
+class IncrementalParser:
+    """
+    Parser para transcricoes parciais que crescem ("ligar", "ligar luz", ...).
+
+    Palavras ja terminadas (seguidas de espaco) sao tokenizadas e varridas
+    pelo automato uma vez so; cada update processa apenas o trecho novo e a
+    palavra em andamento. Se a transcricao for revisada (deixa de comecar
+    pelo prefixo ja processado) o estado e refeito do zero.
+
+    update() devolve complete=True quando o intent e completo (is_complete)
+    e a ultima palavra terminou: veio seguida de espaco ou repetiu igual no
+    update anterior. O intent e sempre o mesmo que parse() daria para o
+    texto recebido.
+    """
+
+    def __init__(self):
+        self.updates = 0
+        self.restarts = 0
+        self._clear()
+
+    def _clear(self):
+        self._committed = ""        # prefixo processado (termina em espaco)
+        self._text_state = 0
+        self._text_labels = set()
+        self._words = []            # palavras normalizadas do prefixo
+        self._raw_state = 0
+        self._raw_labels = set()
+        self._word_labels = set()
+        self._last_tail = None
+
+    def reset(self):
+        """Comeca uma nova frase."""
+        self._clear()
+
+    def update(self, text: str, final: bool = False) -> dict:
+        """
+        Returns:
+            {"intent": dict, "complete": bool, "final": bool}
+        """
+        self.updates += 1
+        if not text.startswith(self._committed):
+            self.restarts += 1
+            self._clear()
+
+        # Corta na ultima palavra terminada; o resto ainda pode mudar
+        cut = len(text)
+        while cut > len(self._committed) and not text[cut - 1].isspace():
+            cut -= 1
+        if cut > len(self._committed):
+            self._commit(text[len(self._committed):cut])
+            self._committed = text[:cut]
+        tail = text[cut:]
+
+        intent, _ = _ENGINE.evaluate(self._utterance(text, tail))
+
+        finished = final or not tail or tail == self._last_tail
+        self._last_tail = tail
+        return {
+            "intent": intent,
+            "complete": finished and is_complete(intent),
+            "final": final,
+        }
+
+    def _commit(self, chunk: str):
+        labels, self._text_state = _MATCHER.scan(chunk.lower(), self._text_state)
+        self._text_labels |= labels
+
+        for w in _fold(chunk).split():
+            if w in STOPWORDS:
+                continue
+            labels, self._raw_state = _MATCHER.scan(
+                f" {w}" if self._words else w, self._raw_state
+            )
+            self._raw_labels |= labels
+            self._word_labels |= WORD_LABELS.get(w, frozenset())
+            self._words.append(w)
+
+    def _utterance(self, text: str, tail: str) -> Utterance:
+        """Prefixo processado + palavra em andamento (varrida a partir do estado salvo)."""
+        text_labels = self._text_labels
+        raw_labels = self._raw_labels
+        word_labels = self._word_labels
+        words = self._words
+
+        if tail:
+            text_labels = text_labels | _MATCHER.scan(tail.lower(), self._text_state)[0]
+            tail_words = [w for w in _fold(tail).split() if w not in STOPWORDS]
+            if tail_words:
+                sep = " " if words else ""
+                raw_labels = raw_labels | _MATCHER.scan(sep + " ".join(tail_words), self._raw_state)[0]
+                word_labels = set(word_labels)
+                for w in tail_words:
+                    word_labels |= WORD_LABELS.get(w, frozenset())
+                words = words + tail_words
+
+        return Utterance.from_zones(
+            text,
+            " ".join(words),
+            words,
+            {"text": text_labels, "normalized": raw_labels, "words": word_labels},
+        )
@@ -0,0 +1,118 @@
+from collections import deque
+
+# ---------------- AHO-CORASICK ----------------
+
+class KeywordMatcher:
+    """
+    Automato Aho-Corasick sobre um vocabulario fixo.
+
+    Encontra todas as ocorrencias (inclusive sobrepostas) de todas as palavras
+    do vocabulario numa unica passada pelo texto. O custo da busca depende
+    so do tamanho do texto; adicionar sinonimos aumenta apenas o automato,
+    que e compilado uma vez.
+
+    vocabulary: dict palavra -> rotulos. Cada palavra tambem e rotulo de si
+    mesma, entao labels() responde tanto "tem 'ventilador'?" quanto
+    "tem algum termo de 'fan'?".
+    """
+
+    def __init__(self, vocabulary: dict):
+        self._delta = [{}]      # transicoes completas (ja resolvendo falhas)
+        self._hits = [()]       # (palavra, tamanho) que terminam em cada estado
+        self._labels = [frozenset()]
+        self._build(vocabulary)
+
+    def __len__(self):
+        return len(self._delta)
+
+    def _build(self, vocabulary: dict):
+        goto = [{}]
+        words = [[]]
+
+        for word, labels in vocabulary.items():
+            if not word:
+                continue
+            state = 0
+            for ch in word:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    words.append([])
+                state = nxt
+            words[state].append((word, frozenset(labels) | {word}))
+
+        fail = [0] * len(goto)
+        delta = [None] * len(goto)
+        hits = [()] * len(goto)
+        labels = [frozenset()] * len(goto)
+        delta[0] = dict(goto[0])
+        hits[0] = tuple((w, len(w)) for w, _ in words[0])
+
+        # BFS: falha de cada estado ja esta pronta quando ele e visitado
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            f = fail[state]
+            delta[state] = {**delta[f], **goto[state]}
+            hits[state] = tuple((w, len(w)) for w, _ in words[state]) + hits[f]
+            labels[state] = labels[f].union(*(lbl for _, lbl in words[state]))
+            for ch, nxt in goto[state].items():
+                fail[nxt] = delta[f].get(ch, 0)
+                queue.append(nxt)
+
+        self._delta = delta
+        self._hits = hits
+        self._labels = labels
+
+    def labels(self, text: str) -> set:
+        """Rotulos de todas as palavras presentes no texto (como substring)."""
+        return self.scan(text)[0]
+
+    def scan(self, text: str, state: int = 0) -> tuple[set, int]:
+        """
+        Como labels(), retomando de um estado anterior.
+
+        scan(a + b) == scan(b, scan(a)[1]) para os rotulos terminados em b:
+        permite varrer um texto que cresce sem voltar ao inicio.
+
+        Returns:
+            (rotulos encontrados, estado final)
+        """
+        found = set()
+        delta = self._delta
+        labels = self._labels
+        for ch in text:
+            state = delta[state].get(ch, 0)
+            if labels[state]:
+                found |= labels[state]
+        return found, state
+
+    def finditer(self, text: str):
+        """Gera (inicio, fim, palavra) de cada ocorrencia, em ordem de fim."""
+        delta = self._delta
+        hits = self._hits
+        state = 0
+        for i, ch in enumerate(text):
+            state = delta[state].get(ch, 0)
+            for word, size in hits[state]:
+                yield i + 1 - size, i + 1, word
+
+    def strip(self, text: str, words) -> str:
+        """
+        Remove do texto as ocorrencias das palavras dadas, pegando sempre a
+        mais a esquerda e, entre elas, a mais longa ('desligar' e nao 'ligar').
+        """
+        spans = sorted(
+            (start, -end) for start, end, word in self.finditer(text) if word in words
+        )
+        parts = []
+        pos = 0
+        for start, neg_end in spans:
+            if start < pos:
+                continue
+            parts.append(text[pos:start])
+            pos = -neg_end
+        parts.append(text[pos:])
+        return "".join(parts)
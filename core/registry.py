@@ -0,0 +1,123 @@
+import importlib
+import os
+import threading
+import time
+
+from utils.logger import log_event, setup_logger
+
+logger = setup_logger(__name__)
+
+# ---------------- CONFIG ----------------
+
+# Dominio -> modulo com async_handle / async_handle_confirmation (e,
+# opcionalmente, async_target_settled).
+# O modulo so e importado no primeiro comando do dominio. cover, media,
+# scene, sensor e infra entram aqui quando tiverem handlers.
+DOMAINS = {
+    "light": "core.domains.light",
+    "climate": "core.domains.climate",
+}
+
+# Dominios importados ja na inicializacao, separados por virgula (ex:
+# "light,climate"): troca cold start por latencia menor no primeiro comando
+PRELOAD_DOMAINS = [d.strip() for d in os.getenv("PRELOAD_DOMAINS", "").split(",") if d.strip()]
+
+HANDLE = "async_handle"
+HANDLE_CONFIRMATION = "async_handle_confirmation"
+# Opcional: o alvo do intent ja e definitivo? (despacho antecipado de parciais)
+TARGET_SETTLED = "async_target_settled"
+
+# ---------------- REGISTRO ----------------
+
+class _Domain:
+    __slots__ = ("name", "module_path", "module", "import_ms")
+
+    def __init__(self, name: str, module_path: str):
+        self.name = name
+        self.module_path = module_path
+        self.module = None
+        self.import_ms = None
+
+
+class DomainRegistry:
+    """
+    Tabela dominio -> modulo de handlers, consultada pelo dispatcher.
+
+    register() so guarda o caminho do modulo; o import acontece na primeira
+    chamada de handler() do dominio (e e cronometrado para o report()).
+    Os handlers sao lidos do modulo a cada chamada, entao patch em
+    core.domains.<dominio>.async_handle continua valendo nos testes.
+    """
+
+    def __init__(self, domains: dict = None):
+        self._domains = {}
+        self._lock = threading.Lock()
+        for name, module_path in (domains or {}).items():
+            self.register(name, module_path)
+
+    def __contains__(self, name):
+        return name in self._domains
+
+    def __iter__(self):
+        return iter(self._domains)
+
+    def register(self, name: str, module_path: str):
+        """Registra (ou substitui) o modulo do dominio, sem importar."""
+        self._domains[name] = _Domain(name, module_path)
+
+    def load(self, name: str):
+        """Modulo do dominio, importado na primeira vez; None se nao registrado."""
+        domain = self._domains.get(name)
+        if domain is None:
+            return None
+        if domain.module is not None:
+            return domain.module
+
+        with self._lock:
+            if domain.module is None:
+                start = time.perf_counter()
+                module = importlib.import_module(domain.module_path)
+                domain.import_ms = (time.perf_counter() - start) * 1000
+                domain.module = module
+                log_event(logger, "Dominio carregado: %(domain)s (%(import_ms).1f ms)",
+                          domain=name, import_ms=domain.import_ms)
+        return domain.module
+
+    def handler(self, name: str, kind: str = HANDLE):
+        """Corrotina `kind` do dominio, ou None (dominio ou handler inexistente)."""
+        module = self.load(name)
+        if module is None:
+            return None
+        return getattr(module, kind, None)
+
+    def preload(self, names) -> list:
+        """Importa ja os dominios dados; devolve os desconhecidos."""
+        unknown = []
+        for name in names:
+            if self.load(name) is None:
+                unknown.append(name)
+        return unknown
+
+    def report(self) -> list[dict]:
+        """[{"domain", "module", "loaded", "import_ms"}] na ordem de registro."""
+        return [
+            {
+                "domain": d.name,
+                "module": d.module_path,
+                "loaded": d.module is not None,
+                "import_ms": d.import_ms,
+            }
+            for d in self._domains.values()
+        ]
+
+    def log_report(self):
+        """Custo de import por dominio (preload) no log de inicializacao."""
+        for row in self.report():
+            if row["loaded"]:
+                log_event(logger, "Dominio %(domain)s: %(import_ms).1f ms",
+                          domain=row["domain"], import_ms=row["import_ms"])
+            else:
+                log_event(logger, "Dominio %(domain)s: sob demanda", domain=row["domain"])
+
+
+registry = DomainRegistry(DOMAINS)
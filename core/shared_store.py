@@ -0,0 +1,191 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Arquivo compartilhado por todos os workers do host
+SHARED_STORE_PATH = os.getenv(
+    "SHARED_STORE_PATH", os.path.join(tempfile.gettempdir(), "friday_store.sqlite3")
+)
+
+# A cada quantas escritas as entradas expiradas sao apagadas do arquivo
+PURGE_EVERY = 256
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    ns      TEXT    NOT NULL,
+    key     TEXT    NOT NULL,
+    value   TEXT    NOT NULL,
+    version INTEGER NOT NULL,
+    expires REAL    NOT NULL,
+    PRIMARY KEY (ns, key)
+);
+CREATE TABLE IF NOT EXISTS seq (id INTEGER PRIMARY KEY CHECK (id = 0), n INTEGER NOT NULL);
+INSERT OR IGNORE INTO seq (id, n) VALUES (0, 0);
+"""
+
+# Conexoes herdadas via fork(): mantidas vivas de proposito (ver _conn)
+_inherited = []
+
+# ---------------- STORE ----------------
+
+class SharedStore:
+    """
+    Chave -> valor JSON com TTL, num arquivo SQLite compartilhado entre
+    processos (uvicorn --workers N no mesmo host).
+
+    Cada escrita recebe uma versao nova (sequencia global do arquivo), o
+    que permite compare_and_set atomico entre workers. Entradas expiradas
+    somem das leituras na hora (expires <= agora) e do arquivo aos poucos.
+    O relogio e time.time(), comum a todos os processos.
+
+    namespace separa os usos (ex: "context") no mesmo arquivo.
+
+    Como em todo SQLite, o processo pai nao deve estar usando o store
+    (conexao aberta) no momento do fork() dos workers; uvicorn --workers
+    usa spawn e nao tem esse problema.
+    """
+
+    def __init__(self, path: str = SHARED_STORE_PATH, namespace: str = "default"):
+        self.path = path
+        self.namespace = namespace
+        self._local = threading.local()
+        self._writes = 0
+        # Conexao temporaria: criar o store nao deixa o arquivo aberto (um
+        # processo que so cria o store e depois faz fork() nao contamina os filhos)
+        conn = self._connect()
+        try:
+            conn.executescript(_SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 nao compartilha conexao entre threads: uma por thread. Nem
+        # entre processos: um filho de fork() abre a sua e nunca fecha a
+        # herdada (fechar solta as travas POSIX das conexoes do proprio filho)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            if conn is not None:
+                _inherited.append(conn)
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # ---- leitura ----
+
+    def get(self, key: str) -> dict | None:
+        """{"value", "version", "expires"} ou None (ausente/expirada)."""
+        row = self._conn().execute(
+            "SELECT value, version, expires FROM kv WHERE ns = ? AND key = ? AND expires > ?",
+            (self.namespace, key, time.time()),
+        ).fetchone()
+        return _entry(row)
+
+    def __len__(self):
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM kv WHERE ns = ? AND expires > ?",
+            (self.namespace, time.time()),
+        ).fetchone()[0]
+
+    # ---- escrita ----
+
+    def set(self, key: str, value, ttl: float) -> int:
+        """Grava por ttl segundos e devolve a nova versao."""
+        with self._transaction() as conn:
+            return self._write(conn, key, value, ttl)
+
+    def compare_and_set(self, key: str, expected_version: int | None, value, ttl: float) -> int | None:
+        """
+        Grava so se a versao atual for expected_version (None = ausente ou
+        expirada). Devolve a nova versao, ou None se outro worker mudou antes.
+        """
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT version FROM kv WHERE ns = ? AND key = ? AND expires > ?",
+                (self.namespace, key, time.time()),
+            ).fetchone()
+            current = row[0] if row else None
+            if current != expected_version:
+                return None
+            return self._write(conn, key, value, ttl)
+
+    def take(self, key: str) -> dict | None:
+        """Le e apaga numa operacao so (apenas um worker recebe a entrada)."""
+        # SELECT + DELETE na mesma transacao (sem RETURNING, que exige SQLite 3.35)
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT value, version, expires FROM kv WHERE ns = ? AND key = ? AND expires > ?",
+                (self.namespace, key, time.time()),
+            ).fetchone()
+            if row is not None:
+                conn.execute("DELETE FROM kv WHERE ns = ? AND key = ?", (self.namespace, key))
+        return _entry(row)
+
+    def delete(self, key: str):
+        self._conn().execute("DELETE FROM kv WHERE ns = ? AND key = ?", (self.namespace, key))
+
+    def clear(self):
+        self._conn().execute("DELETE FROM kv WHERE ns = ?", (self.namespace,))
+
+    def purge(self) -> int:
+        """Apaga do arquivo as entradas expiradas (de todos os namespaces)."""
+        cur = self._conn().execute("DELETE FROM kv WHERE expires <= ?", (time.time(),))
+        return cur.rowcount
+
+    # ---- interno ----
+
+    def _write(self, conn, key: str, value, ttl: float) -> int:
+        conn.execute("UPDATE seq SET n = n + 1 WHERE id = 0")
+        version = conn.execute("SELECT n FROM seq WHERE id = 0").fetchone()[0]
+        conn.execute(
+            "INSERT OR REPLACE INTO kv (ns, key, value, version, expires) VALUES (?, ?, ?, ?, ?)",
+            (self.namespace, key, json.dumps(value), version, time.time() + ttl),
+        )
+        self._writes += 1
+        if self._writes % PURGE_EVERY == 0:
+            conn.execute("DELETE FROM kv WHERE expires <= ?", (time.time(),))
+        return version
+
+    def _transaction(self):
+        return _Transaction(self._conn())
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT: trava escrita no arquivo durante o bloco."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+def _entry(row) -> dict | None:
+    if row is None:
+        return None
+    value, version, expires = row
+    return {"value": json.loads(value), "version": version, "expires": expires}
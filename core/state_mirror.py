@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import threading
+
+import aiohttp
+
+from utils.logger import log_event, setup_logger
+
+logger = setup_logger(__name__)
+
+RECONNECT_DELAY = 5  # segundos ate a primeira tentativa de reconexao
+RECONNECT_MAX_DELAY = 60  # falhas seguidas dobram a espera ate esse limite
+
+# ---------------- MIRROR ----------------
+
+class AuthError(Exception):
+    """Token recusado pelo Home Assistant (nao adianta reconectar)."""
+
+
+class StateMirror:
+    """
+    Espelho local dos estados do Home Assistant.
+
+    Carrega todos os estados ao conectar na API WebSocket, assina o evento
+    state_changed para se manter atualizado e recarrega tudo apos cada
+    reconexao. Enquanto desconectado, ready fica False e o ha_client volta
+    a consultar a API REST.
+    """
+
+    def __init__(self):
+        self._states: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._msg_id = 0
+        self._ready_event = None
+        self._event_loop = None
+        self.ready = False
+        self.events = 0
+        self.snapshots = 0
+        # Incrementa quando entidades entram/saem ou mudam de friendly_name
+        self.names_generation = 0
+
+    # ---- leitura (thread-safe, sem I/O) ----
+
+    def get(self, entity_id: str) -> dict | None:
+        return self._states.get(entity_id)
+
+    def all(self) -> list[dict]:
+        """Lista de estados no formato de /api/states (nao modificar)."""
+        with self._lock:
+            return list(self._states.values())
+
+    def __len__(self):
+        return len(self._states)
+
+    # ---- escrita ----
+
+    def load(self, states: list[dict]):
+        """Substitui todo o espelho por um snapshot completo."""
+        snapshot = {s["entity_id"]: s for s in states}
+        with self._lock:
+            self._states = snapshot
+        self.ready = True
+        self.snapshots += 1
+        self.names_generation += 1
+        if self._ready_event is not None:
+            self._ready_event.set()
+        log_event(logger, "Espelho de estados carregado: %(entities)s entidades", entities=len(snapshot))
+
+    def apply_event(self, data: dict):
+        """Aplica um evento state_changed (new_state None = entidade removida)."""
+        entity_id = data.get("entity_id")
+        new_state = data.get("new_state")
+        if not entity_id:
+            return
+
+        with self._lock:
+            old_state = self._states.get(entity_id)
+            if new_state is None:
+                self._states.pop(entity_id, None)
+            else:
+                self._states[entity_id] = new_state
+        self.events += 1
+
+        if old_state is None or new_state is None or _friendly_name(old_state) != _friendly_name(new_state):
+            self.names_generation += 1
+
+    def invalidate(self):
+        self.ready = False
+        if self._ready_event is not None:
+            self._ready_event.clear()
+
+    def clear(self):
+        with self._lock:
+            self._states = {}
+        self.invalidate()
+
+    # ---- websocket ----
+
+    def _next_id(self) -> int:
+        self._msg_id += 1
+        return self._msg_id
+
+    def _get_ready_event(self) -> asyncio.Event:
+        # O Event pertence ao event loop que o criou: recria ao trocar de
+        # loop (ex: servidor reiniciado no mesmo processo)
+        loop = asyncio.get_running_loop()
+        if self._ready_event is None or self._event_loop is not loop:
+            self._ready_event = asyncio.Event()
+            self._event_loop = loop
+            if self.ready:
+                self._ready_event.set()
+        return self._ready_event
+
+    async def wait_ready(self, timeout: float) -> bool:
+        ready_event = self._get_ready_event()
+        if self.ready:
+            return True
+        try:
+            await asyncio.wait_for(ready_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def run(self, ws_url: str, token: str, reconnect_delay: float = RECONNECT_DELAY,
+                  max_delay: float = RECONNECT_MAX_DELAY):
+        """
+        Mantem a conexao WebSocket aberta, reconectando quando cair.
+
+        Qualquer erro (inclusive mensagem malformada) invalida o espelho e
+        reconecta; sem snapshot na conexao anterior a espera dobra, ate
+        max_delay.
+        """
+        self._get_ready_event()
+
+        delay = reconnect_delay
+        async with aiohttp.ClientSession() as session:
+            while True:
+                snapshots = self.snapshots
+                try:
+                    async with session.ws_connect(ws_url, heartbeat=30) as ws:
+                        await self._listen(ws, token)
+                    logger.warning("WebSocket do HA fechado")
+                except AuthError as e:
+                    self.invalidate()
+                    log_event(logger, "WebSocket do HA: autenticacao recusada (%(error)s)", logging.ERROR, error=e)
+                    return
+                except (aiohttp.ClientError, asyncio.TimeoutError, TypeError, ValueError) as e:
+                    log_event(logger, "WebSocket do HA indisponivel: %(error)s", logging.WARNING, error=e)
+                except Exception:
+                    logger.exception("Erro inesperado no espelho de estados, reconectando")
+
+                self.invalidate()
+                delay = reconnect_delay if self.snapshots > snapshots else min(delay * 2, max_delay)
+                await asyncio.sleep(delay)
+
+    async def _listen(self, ws, token: str):
+        msg = await ws.receive_json()
+        if msg.get("type") == "auth_required":
+            await ws.send_json({"type": "auth", "access_token": token})
+            msg = await ws.receive_json()
+        if msg.get("type") != "auth_ok":
+            raise AuthError(msg.get("message", msg.get("type")))
+
+        # Assina eventos antes do snapshot: nenhum evento se perde entre os dois
+        self._msg_id = 0
+        subscribe_id = self._next_id()
+        await ws.send_json({
+            "id": subscribe_id,
+            "type": "subscribe_events",
+            "event_type": "state_changed",
+        })
+        states_id = self._next_id()
+        await ws.send_json({"id": states_id, "type": "get_states"})
+
+        async for raw in ws:
+            if raw.type != aiohttp.WSMsgType.TEXT:
+                break
+            msg = raw.json()
+
+            if msg.get("type") == "event" and msg.get("id") == subscribe_id:
+                self.apply_event(msg["event"].get("data", {}))
+            elif msg.get("type") == "result" and msg.get("id") == states_id:
+                if not msg.get("success"):
+                    raise ValueError(f"get_states falhou: {msg.get('error')}")
+                self.load(msg["result"])
+
+
+def _friendly_name(state: dict) -> str:
+    return state.get("attributes", {}).get("friendly_name", "")
+
+
+def names_key(states: list):
+    """
+    Chave que muda quando entidades entram/saem ou mudam de friendly_name.
+
+    Usada pelos indices de nomes para decidir se precisam ser reconstruidos.
+    Com o espelho ativo e O(1); sem ele compara os pares (entity_id, nome).
+    """
+    if mirror.ready:
+        return ("mirror", mirror.names_generation, len(states))
+    return tuple((e["entity_id"], _friendly_name(e)) for e in states)
+
+
+def websocket_url(base_url: str) -> str:
+    """http://ha:8123 -> ws://ha:8123/api/websocket"""
+    if base_url.startswith("https://"):
+        base_url = "wss://" + base_url[len("https://"):]
+    elif base_url.startswith("http://"):
+        base_url = "ws://" + base_url[len("http://"):]
+    return f"{base_url.rstrip('/')}/api/websocket"
+
+
+# Instancia compartilhada lida pelo ha_client
+mirror = StateMirror()
@@ -1,35 +1,317 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, suppress
+from uuid import uuid4
+
 from dotenv import load_dotenv
-from fastapi import FastAPI
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
 
 # Carrega variáveis de ambiente do arquivo .env
 load_dotenv()
 
-from core.dispatcher import dispatch
-from core.intent_parser import parse
-from utils.logger import log_command, log_separator, setup_logger
+from core import ha_client
+from core.context_manager import session_scope
+from core.dispatcher import async_dispatch, async_target_settled
+from core.intent_parser import (IncrementalParser, normalize, parse,
+                                parse_cache, remaining_commands)
+from core.registry import PRELOAD_DOMAINS, registry
+from core.state_mirror import mirror, websocket_url
+from utils.logger import (log_command, log_event, log_separator, log_stats,
+                          setup_logger)
+from utils.metrics import Gauge, metrics
+from utils.version import print_version_banner
 
 logger = setup_logger(__name__)
 
-app = FastAPI()
+# Espelho de estados via WebSocket (desative com HA_STATE_MIRROR=0)
+STATE_MIRROR_ENABLED = os.getenv("HA_STATE_MIRROR", "1") != "0"
+STATE_MIRROR_STARTUP_TIMEOUT = 5
+
+# Frases parciais em andamento (uma por sessao de STT)
+MAX_PARTIAL_SESSIONS = 64
+# Frase ja despachada sem final=True (final perdido) expira apos esse tempo
+PARTIAL_TTL = 10.0
+
+# Comandos aguardando por conexao WebSocket; cheio, o servidor para de ler
+# o socket e o cliente sente a contrapressao
+WS_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", "8"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    print_version_banner()
+    for name in registry.preload(PRELOAD_DOMAINS):
+        log_event(logger, "PRELOAD_DOMAINS: dominio desconhecido '%(domain)s'", logging.WARNING, domain=name)
+    registry.log_report()
+
+    mirror_task = None
+    if STATE_MIRROR_ENABLED and ha_client.HA_URL:
+        mirror_task = asyncio.create_task(
+            mirror.run(websocket_url(ha_client.HA_URL), ha_client.HA_TOKEN)
+        )
+        if not await mirror.wait_ready(STATE_MIRROR_STARTUP_TIMEOUT):
+            logger.warning("Espelho de estados indisponivel, usando API REST")
+
+    yield
+
+    if mirror_task:
+        mirror_task.cancel()
+        # Espera a task sair (fecha a sessao do WebSocket) antes dos clientes
+        with suppress(asyncio.CancelledError):
+            await mirror_task
+        mirror.invalidate()
+    # Fecha as conexoes keep-alive com o Home Assistant
+    ha_client.client.close()
+    await ha_client.async_client.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Estado do processo lido a cada /metrics (as latencias vem dos spans)
+metrics.register(Gauge(
+    "friday_parse_cache_total", "Consultas ao cache do parser",
+    lambda: {(("result", k),): v for k, v in parse_cache.stats().items() if k in ("hits", "misses")},
+))
+metrics.register(Gauge(
+    "friday_log_dropped_total", "Registros de log descartados com a fila cheia",
+    lambda: log_stats()["dropped"],
+))
 
 class Command(BaseModel):
     text: str
+    session: str | None = None
+
+class PartialCommand(BaseModel):
+    text: str
+    session: str = "default"
+    final: bool = False
+
+# session -> {"parser": IncrementalParser, "intent": dict | None, "response": dict | None,
+#             "text": frase despachada, "at": time.monotonic() do despacho}
+_partials: OrderedDict = OrderedDict()
+
+def _continues(state: dict, text: str, final: bool) -> bool:
+    """
+    Transcricao ainda e a frase despachada (ou a continua: "... e da cozinha").
+
+    O final so expira: frase final diferente e respondida como "mismatch".
+    """
+    if time.monotonic() - state["at"] > PARTIAL_TTL:
+        return False
+    if final:
+        return True
+    words = normalize(state["text"]).split()
+    if normalize(text).split()[:len(words)] == words:
+        return True
+    # Mesmo comando com a transcricao revisada ("ligar a luz da sala")
+    return remaining_commands(parse(text), state["intent"]) is not None
+
+def _partial_session(session: str, text: str, final: bool) -> dict:
+    state = _partials.get(session)
+    if state is not None and state["intent"] is not None and not _continues(state, text, final):
+        # Frase nova depois de um despacho cujo final nao chegou
+        state = None
+    if state is None:
+        state = {"parser": IncrementalParser(), "intent": None, "response": None}
+        _partials[session] = state
+        while len(_partials) > MAX_PARTIAL_SESSIONS:
+            _partials.popitem(last=False)
+    _partials.move_to_end(session)
+    return state
+
+async def run_command(text: str) -> dict:
+    """Parse + dispatch de um comando completo (HTTP e WebSocket)."""
+    log_separator(logger)
+    log_command(logger, text)
+
+    intent = parse(text)
+    log_event(logger, "Intent parseada: %(intent)s | Domain: %(domain)s",
+              intent=intent.get("intent"), domain=intent.get("domain"))
+
+    response = await async_dispatch(intent)
+    log_event(logger, "Resposta: %(message)s", message=response.get("message", "N/A"))
+    log_separator(logger)
+
+    return {
+        "intent": intent.get("intent"),
+        "domain": intent.get("domain"),
+        "response": response
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """
+    Metricas no formato texto do Prometheus: histogramas de latencia por
+    etapa (friday_stage_latency_seconds{stage=parse|dispatch|handler|ha})
+    e p50/p95/p99 prontos em friday_stage_latency_seconds_quantile.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.post("/command")
-def command(cmd: Command):
+async def command(cmd: Command):
+    with session_scope(cmd.session):
+        return await run_command(cmd.text)
+
+@app.post("/command/partial")
+async def command_partial(cmd: PartialCommand):
+    """
+    Transcricao parcial de uma frase em andamento.
+
+    Despacha assim que o intent estiver completo e o alvo for definitivo
+    (sem esperar o fim da fala), uma unica vez por frase; final=True encerra
+    a frase, despachando se ainda nao foi. Se a frase final for alem do que
+    ja foi despachado ("... e da cozinha"), o resto e despachado; se nao
+    contiver o comando despachado, responde status "mismatch". Sem o final,
+    uma transcricao que nao continua a frase despachada (ou depois de
+    PARTIAL_TTL) comeca uma frase nova.
+    """
+    state = _partial_session(cmd.session, cmd.text, cmd.final)
+
+    if state["intent"] is not None:
+        if not cmd.final:
+            return {
+                "status": "dispatched",
+                "intent": state["intent"].get("intent"),
+                "domain": state["intent"].get("domain"),
+                "response": state["response"],
+            }
+        _partials.pop(cmd.session, None)
+        return await _finish_early_dispatch(cmd, state)
+
+    result = state["parser"].update(cmd.text, final=cmd.final)
+    intent = result["intent"]
+
+    if not cmd.final and not (result["complete"] and await async_target_settled(intent)):
+        return {"status": "pending", "intent": intent.get("intent"), "domain": intent.get("domain")}
+
+    # Marca antes de aguardar: outro parcial da mesma sessao nao despacha de novo
+    state.update(intent=intent, text=cmd.text, at=time.monotonic())
+    if cmd.final:
+        _partials.pop(cmd.session, None)
+
     log_separator(logger)
     log_command(logger, cmd.text)
-    
-    intent = parse(cmd.text)
-    logger.info(f"Intent parseada: {intent.get('intent')} | Domain: {intent.get('domain')}")
-    
-    response = dispatch(intent)
-    logger.info(f"Resposta: {response.get('message', 'N/A')}")
+    log_event(logger, "Intent parseada: %(intent)s | Domain: %(domain)s | %(stage)s",
+              intent=intent.get("intent"), domain=intent.get("domain"),
+              stage="final" if cmd.final else "parcial")
+
+    with session_scope(cmd.session):
+        response = await async_dispatch(intent)
+    state["response"] = response
+    log_event(logger, "Resposta: %(message)s", message=response.get("message", "N/A"))
     log_separator(logger)
 
     return {
+        "status": "dispatched",
         "intent": intent.get("intent"),
         "domain": intent.get("domain"),
         "response": response
     }
+
+async def _finish_early_dispatch(cmd: PartialCommand, state: dict) -> dict:
+    """Frase final de um comando ja despachado: despacha so o que faltou."""
+    dispatched = state["intent"]
+    # Resposta ainda None se o despacho antecipado nao terminou
+    early = state["response"] or {}
+    final_intent = parse(cmd.text)
+    rest = remaining_commands(final_intent, dispatched)
+
+    if rest is None:
+        log_event(logger, "Frase final '%(text)s' difere do intent despachado: %(intent)s", logging.WARNING,
+                  text=cmd.text, intent=dispatched.get("intent"))
+        return {
+            "status": "mismatch",
+            "intent": dispatched.get("intent"),
+            "domain": dispatched.get("domain"),
+            "response": {
+                "message": "A frase mudou depois que comecei: executei só "
+                           f"'{early.get('message', '')}'. Pode repetir?",
+            },
+            "dispatched_response": state["response"],
+        }
+
+    if not rest:
+        return {
+            "status": "dispatched",
+            "intent": dispatched.get("intent"),
+            "domain": dispatched.get("domain"),
+            "response": state["response"],
+        }
+
+    intent = rest[0] if len(rest) == 1 else {
+        "intent": "compound", "domain": "compound", "commands": rest, "text": cmd.text,
+    }
+    log_separator(logger)
+    log_command(logger, cmd.text)
+    log_event(logger, "Intent parseada: %(intent)s | Domain: %(domain)s | %(stage)s",
+              intent=intent.get("intent"), domain=intent.get("domain"), stage="resto")
+
+    with session_scope(cmd.session):
+        response = await async_dispatch(intent)
+    log_event(logger, "Resposta: %(message)s", message=response.get("message", "N/A"))
+    log_separator(logger)
+
+    return {
+        "status": "dispatched",
+        "intent": final_intent.get("intent"),
+        "domain": final_intent.get("domain"),
+        "response": response,
+        "dispatched_response": state["response"],
+    }
+
+@app.websocket("/ws")
+async def command_stream(ws: WebSocket, session: str | None = None):
+    """
+    Sessao de voz continua: {"text": ..., "id": opcional} por mensagem,
+    uma resposta por comando, na ordem de chegada.
+
+    O cliente pode enviar varios comandos sem esperar as respostas; eles
+    ficam numa fila de WS_QUEUE_SIZE e sao executados um de cada vez (a
+    confirmacao de um depende do anterior). O contexto de confirmacao e o
+    da sessao (compartilhado com POST /command do mesmo session). Sem
+    ?session=, cada conexao ganha uma sessao propria.
+    """
+    session = session or f"ws-{uuid4().hex}"
+    await ws.accept()
+    log_event(logger, "Sessao WebSocket aberta: %(session)s", session=session)
+
+    queue = asyncio.Queue(maxsize=WS_QUEUE_SIZE)
+
+    async def worker():
+        while True:
+            msg = await queue.get()
+            if not isinstance(msg, dict) or not isinstance(msg.get("text"), str):
+                await ws.send_json({"error": "Mensagem invalida: esperado {\"text\": ...}"})
+                continue
+            try:
+                reply = await run_command(msg["text"])
+            except Exception as e:
+                log_event(logger, "[%(session)s] Falha no comando '%(text)s': %(error)s", logging.ERROR,
+                          session=session, text=msg["text"], error=str(e))
+                reply = {"error": "Falha ao executar comando"}
+            if "id" in msg:
+                reply["id"] = msg["id"]
+            await ws.send_json(reply)
+
+    with session_scope(session):
+        # A task herda a sessao
+        worker_task = asyncio.create_task(worker())
+        try:
+            while True:
+                raw = await ws.receive_text()
+                try:
+                    msg = json.loads(raw)
+                except ValueError:
+                    msg = None
+                # Fila cheia: para de ler ate o worker liberar espaco
+                await queue.put(msg)
+        except WebSocketDisconnect:
+            log_event(logger, "Sessao WebSocket fechada: %(session)s", session=session)
+        finally:
+            worker_task.cancel()
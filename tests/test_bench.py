@@ -0,0 +1,128 @@
+"""
+Testes para tools.bench
+
+Testa estatisticas, comparacao com limite de regressao e uma rodada curta
+dos benchmarks com o HA substituido por stubs
+"""
+import json
+
+from tools.bench import (Benchmark, build_benchmarks, compare, main, make_lights, measure,
+                         median_ci_ranks, merge, run, summarize)
+
+
+def bench_result(name, median, spread):
+    return {"name": name, "median": median, "ci_low": median - spread, "ci_high": median + spread}
+
+
+class TestStatistics:
+    """Testes das estatisticas das amostras"""
+
+    def test_median_ci_ranks(self):
+        """IC 95% da mediana por posicao (20 amostras: 5a a 16a)"""
+        assert median_ci_ranks(20) == (4, 15)
+        low, high = median_ci_ranks(3)
+        assert low == 0 and high == 2
+
+    def test_summarize(self):
+        """Mediana e IC devem vir das amostras ordenadas"""
+        result = summarize([5.0, 1.0, 3.0, 2.0, 4.0])
+        assert result["median"] == 3.0
+        assert result["ci_low"] <= 3.0 <= result["ci_high"]
+        assert result["min"] == 1.0
+        assert result["samples"] == [5.0, 1.0, 3.0, 2.0, 4.0]
+
+    def test_merge_pools_samples(self):
+        """Rodadas de processos diferentes devem somar as amostras por benchmark"""
+        part = {"commit": "abc", "config": {"samples": 2}, "benchmarks": [
+            {"name": "a", "loops": 10, "samples": [1.0, 2.0]},
+        ]}
+        other = {"commit": "abc", "config": {"samples": 2}, "benchmarks": [
+            {"name": "a", "loops": 12, "samples": [3.0, 4.0]},
+        ]}
+        result = merge([part, other])
+
+        assert result["commit"] == "abc"
+        assert result["benchmarks"][0]["samples"] == [1.0, 2.0, 3.0, 4.0]
+        assert result["benchmarks"][0]["median"] == 2.5
+
+    def test_measure_calibrates_loops(self):
+        """Amostra deve durar pelo menos min_time"""
+        bench = Benchmark("soma", lambda: sum(range(100)))
+        result = measure(bench, samples=3, warmup=1, min_time=0.005)
+
+        assert result["loops"] > 1
+        assert len(result["samples"]) == 3
+        assert result["median"] * result["loops"] >= 0.001
+
+
+class TestCompare:
+    """Testes da deteccao de regressao"""
+
+    def test_regression_needs_threshold_and_separate_ci(self):
+        """So e regressao se passar do limite com ICs separados"""
+        baseline = {"benchmarks": [
+            bench_result("a", 1.0, 0.01),
+            bench_result("b", 1.0, 0.5),
+            bench_result("c", 1.0, 0.01),
+            bench_result("d", 1.0, 0.01),
+        ]}
+        current = {"benchmarks": [
+            bench_result("a", 1.2, 0.01),   # mais lento e fora do ruido
+            bench_result("b", 1.2, 0.5),    # mais lento, mas dentro do ruido
+            bench_result("c", 1.05, 0.01),  # abaixo do limite
+            bench_result("d", 0.5, 0.01),   # mais rapido
+            bench_result("novo", 1.0, 0.01),
+        ]}
+        rows = {row["name"]: row["status"] for row in compare(current, baseline, threshold=0.10)}
+
+        assert rows == {"a": "regression", "b": "same", "c": "same", "d": "improvement"}
+
+
+class TestBenchmarks:
+    """Testes dos benchmarks do Friday"""
+
+    def test_covers_hot_paths(self):
+        """Deve cobrir normalize, familias do parse, busca de luzes, comodos e dispatch"""
+        names = [b.name for b in build_benchmarks()]
+
+        assert "intent_parser.normalize" in names
+        assert "intent_parser.parse[compound]" in names
+        assert "light.find_light_entities[10000]" in names
+        assert "climate.match_room" in names
+        assert "dispatcher.dispatch[compound]" in names
+
+    def test_make_lights(self):
+        """Luzes sinteticas devem manter as da casa e ter ids unicos"""
+        lights = make_lights(1000)
+        assert len(lights) == 1000
+        assert len({e["entity_id"] for e in lights}) == 1000
+        assert lights[0]["entity_id"] == "light.sala"
+
+    def test_run_with_stubbed_ha(self):
+        """Dispatch deve rodar sem rede (HA substituido por stubs)"""
+        result = run(r"dispatch|match_room|find_light_entities\[100\]", samples=2, warmup=0, min_time=0.001)
+        names = [b["name"] for b in result["benchmarks"]]
+
+        assert "dispatcher.dispatch[light_on]" in names
+        assert "light.find_light_entities[100]" in names
+        assert all(b["median"] > 0 for b in result["benchmarks"])
+
+    def test_main_json_and_compare(self, tmp_path, capsys):
+        """--compare deve sair com 1 quando o atual regride contra a referencia"""
+        out = tmp_path / "bench.json"
+        assert main(["-k", "match_room", "--samples", "3", "--warmup", "0",
+                     "--min-time", "0.001", "--processes", "1", "--json", str(out)]) == 0
+
+        saved = json.loads(out.read_text(encoding="utf-8"))
+        assert saved["benchmarks"][0]["name"] == "climate.match_room"
+
+        # Referencia 100x mais rapida: o atual e regressao
+        for b in saved["benchmarks"]:
+            for key in ("median", "ci_low", "ci_high"):
+                b[key] /= 100
+        baseline = tmp_path / "baseline.json"
+        baseline.write_text(json.dumps(saved), encoding="utf-8")
+
+        assert main(["-k", "match_room", "--samples", "3", "--warmup", "0",
+                     "--min-time", "0.001", "--processes", "1", "--compare", str(baseline)]) == 1
+        assert "REGRESSAO" in capsys.readouterr().out
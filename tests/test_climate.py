@@ -55,7 +55,7 @@ class TestHandle:
         """Limpa contexto antes de cada teste"""
         context.clear()
     
-    @patch('core.domains.climate.call_service')
+    @patch('core.domains.climate.async_call_service')
     def test_handle_ligar_ar_com_comodo(self, mock_call):
         """Deve ligar ar de comodo especifico"""
         mock_call.return_value = True
@@ -67,7 +67,7 @@ class TestHandle:
         assert "quarto" in result["message"].lower()
         assert "ligado" in result["message"].lower()
     
-    @patch('core.domains.climate.call_service')
+    @patch('core.domains.climate.async_call_service')
     def test_handle_desligar_ar_com_comodo(self, mock_call):
         """Deve desligar ar de comodo especifico"""
         mock_call.return_value = True
@@ -79,7 +79,7 @@ class TestHandle:
         assert "closet" in result["message"].lower()
         assert "desligado" in result["message"].lower()
     
-    @patch('core.domains.climate.call_service')
+    @patch('core.domains.climate.async_call_service')
     def test_handle_usa_script_correto_on(self, mock_call):
         """Deve usar script correto para ligar"""
         mock_call.return_value = True
@@ -91,7 +91,7 @@ class TestHandle:
         assert call_args[0] == "script"
         assert "gelar_ar_lg_quarto" in call_args[1]
     
-    @patch('core.domains.climate.call_service')
+    @patch('core.domains.climate.async_call_service')
     def test_handle_usa_script_correto_off(self, mock_call):
         """Deve usar script correto para desligar"""
         mock_call.return_value = True
@@ -103,7 +103,7 @@ class TestHandle:
         assert call_args[0] == "script"
         assert "desligar_ar_lg_closet" in call_args[1]
     
-    @patch('core.domains.climate.call_service')
+    @patch('core.domains.climate.async_call_service')
     def test_handle_all_on(self, mock_call):
         """Deve ligar todos os ares-condicionados"""
         mock_call.return_value = True
@@ -116,7 +116,7 @@ class TestHandle:
         assert "todos" in result["message"].lower()
         assert "ligados" in result["message"].lower()
     
-    @patch('core.domains.climate.call_service')
+    @patch('core.domains.climate.async_call_service')
     def test_handle_all_off(self, mock_call):
         """Deve desligar todos os ares-condicionados"""
         mock_call.return_value = True
@@ -129,21 +129,27 @@ class TestHandle:
         assert "todos" in result["message"].lower()
         assert "desligados" in result["message"].lower()
     
-    @patch('core.domains.climate.is_on')
-    def test_handle_generic_off_nenhum_ligado(self, mock_is_on):
+    @patch('core.domains.climate.async_get_states')
+    def test_handle_generic_off_nenhum_ligado(self, mock_states):
         """'desligar ar' sem nenhum ar ligado"""
-        mock_is_on.return_value = False
+        mock_states.return_value = {
+            "binary_sensor.ar_condicionado_quarto_contact": "off",
+            "binary_sensor.sonoff_10017182d6": "off",
+        }
         
         intent = {"intent": "off", "search": "ar"}
         result = handle(intent)
         
         assert "nenhum" in result["message"].lower()
     
-    @patch('core.domains.climate.call_service')
-    @patch('core.domains.climate.is_on')
-    def test_handle_generic_off_um_ligado(self, mock_is_on, mock_call):
+    @patch('core.domains.climate.async_call_service')
+    @patch('core.domains.climate.async_get_states')
+    def test_handle_generic_off_um_ligado(self, mock_states, mock_call):
         """'desligar ar' com um ar ligado deve desligar"""
-        mock_is_on.side_effect = [True, False]  # quarto ligado, closet desligado
+        mock_states.return_value = {  # quarto ligado, closet desligado
+            "binary_sensor.ar_condicionado_quarto_contact": "on",
+            "binary_sensor.sonoff_10017182d6": "off",
+        }
         mock_call.return_value = True
         
         intent = {"intent": "off", "search": "ar"}
@@ -152,10 +158,13 @@ class TestHandle:
         mock_call.assert_called_once()
         assert "desligado" in result["message"].lower()
     
-    @patch('core.domains.climate.is_on')
-    def test_handle_generic_off_multiplos_ligados_cria_contexto(self, mock_is_on):
+    @patch('core.domains.climate.async_get_states')
+    def test_handle_generic_off_multiplos_ligados_cria_contexto(self, mock_states):
         """'desligar ar' com multiplos ares ligados deve criar contexto"""
-        mock_is_on.return_value = True  # ambos ligados
+        mock_states.return_value = {  # ambos ligados
+            "binary_sensor.ar_condicionado_quarto_contact": "on",
+            "binary_sensor.sonoff_10017182d6": "on",
+        }
         
         intent = {"intent": "off", "search": "ar"}
         result = handle(intent)
@@ -163,6 +172,8 @@ class TestHandle:
         assert context.valid()
         assert "mais de um" in result["message"].lower()
         assert "qual" in result["message"].lower()
+        # Estados de todos os comodos em uma unica consulta
+        mock_states.assert_called_once()
     
     def test_handle_comando_desconhecido(self):
         """Deve retornar erro para comando nao compreendido"""
@@ -180,7 +191,7 @@ class TestHandleConfirmation:
         """Limpa contexto antes de cada teste"""
         context.clear()
     
-    @patch('core.domains.climate.call_service')
+    @patch('core.domains.climate.async_call_service')
     def test_handle_confirmation_single_room(self, mock_call):
         """Deve desligar ar do comodo especificado"""
         mock_call.return_value = True
@@ -203,7 +214,7 @@ class TestHandleConfirmation:
         # Contexto deve ser limpo
         assert not context.valid()
     
-    @patch('core.domains.climate.call_service')
+    @patch('core.domains.climate.async_call_service')
     def test_handle_confirmation_todos(self, mock_call):
         """Deve desligar todos os ares quando 'todos'"""
         mock_call.return_value = True
@@ -253,7 +264,7 @@ class TestHandleConfirmation:
         assert "message" in result
         assert not context.valid()  # contexto limpo mesmo com erro
     
-    @patch('core.domains.climate.call_service')
+    @patch('core.domains.climate.async_call_service')
     def test_handle_confirmation_specific_room_from_multiple(self, mock_call):
         """Deve desligar apenas o ar especificado quando ha multiplos"""
         mock_call.return_value = True
@@ -289,7 +300,7 @@ class TestFanFeature:
         """Limpa contexto antes de cada teste"""
         context.clear()
     
-    @patch('core.domains.climate.call_service')
+    @patch('core.domains.climate.async_call_service')
     def test_fan_on_quarto(self, mock_call):
         """Deve ligar ventilador do quarto"""
         mock_call.return_value = True
@@ -301,7 +312,7 @@ class TestFanFeature:
         assert "ventilador" in result["message"].lower()
         assert "quarto" in result["message"].lower()
     
-    @patch('core.domains.climate.call_service')
+    @patch('core.domains.climate.async_call_service')
     def test_fan_off_closet(self, mock_call):
         """Deve desligar ventilador do closet"""
         mock_call.return_value = True
@@ -328,7 +339,7 @@ class TestHeaterFeature:
         """Limpa contexto antes de cada teste"""
         context.clear()
     
-    @patch('core.domains.climate.call_service')
+    @patch('core.domains.climate.async_call_service')
     def test_heater_on_quarto(self, mock_call):
         """Deve ligar aquecedor do quarto"""
         mock_call.return_value = True
@@ -340,7 +351,7 @@ class TestHeaterFeature:
         assert "aquecedor" in result["message"].lower()
         assert "quarto" in result["message"].lower()
     
-    @patch('core.domains.climate.call_service')
+    @patch('core.domains.climate.async_call_service')
     def test_heater_off_quarto(self, mock_call):
         """Deve desligar aquecedor do quarto"""
         mock_call.return_value = True
@@ -366,7 +377,7 @@ class TestDisplayFeature:
         """Limpa contexto antes de cada teste"""
         context.clear()
     
-    @patch('core.domains.climate.call_service')
+    @patch('core.domains.climate.async_call_service')
     def test_display_off_quarto(self, mock_call):
         """Deve apagar tela do quarto via controle remoto"""
         mock_call.return_value = True
@@ -395,7 +406,7 @@ class TestTemperatureFeature:
         """Limpa contexto antes de cada teste"""
         context.clear()
     
-    @patch('core.domains.climate.call_service')
+    @patch('core.domains.climate.async_call_service')
     def test_set_temperature_22_quarto(self, mock_call):
         """Deve definir temperatura para 22°C no quarto"""
         mock_call.return_value = True
@@ -411,7 +422,7 @@ class TestTemperatureFeature:
         assert call_args[0][2]["value"] == 22
         assert "22" in result["message"]
     
-    @patch('core.domains.climate.call_service')
+    @patch('core.domains.climate.async_call_service')
     def test_set_temperature_18_closet(self, mock_call):
         """Deve definir temperatura minima (18°C)"""
         mock_call.return_value = True
@@ -422,7 +433,7 @@ class TestTemperatureFeature:
         mock_call.assert_called_once()
         assert "18" in result["message"]
     
-    @patch('core.domains.climate.call_service')
+    @patch('core.domains.climate.async_call_service')
     def test_set_temperature_26_quarto(self, mock_call):
         """Deve definir temperatura maxima (26°C)"""
         mock_call.return_value = True
@@ -470,7 +481,7 @@ class TestFanSpeedFeature:
         """Limpa contexto antes de cada teste"""
         context.clear()
     
-    @patch('core.domains.climate.call_service')
+    @patch('core.domains.climate.async_call_service')
     def test_set_speed_1_quarto(self, mock_call):
         """Deve definir velocidade para 1"""
         mock_call.return_value = True
@@ -485,7 +496,7 @@ class TestFanSpeedFeature:
         assert call_args[0][2]["value"] == 1
         assert "1" in result["message"]
     
-    @patch('core.domains.climate.call_service')
+    @patch('core.domains.climate.async_call_service')
     def test_set_speed_3_closet(self, mock_call):
         """Deve definir velocidade para 3 (máxima)"""
         mock_call.return_value = True
@@ -510,8 +521,8 @@ class TestFanSpeedFeature:
         
         assert "1" in result["message"] and "3" in result["message"]
     
-    @patch('core.domains.climate.get_state')
-    @patch('core.domains.climate.call_service')
+    @patch('core.domains.climate.async_get_state')
+    @patch('core.domains.climate.async_call_service')
     def test_increase_speed_de_1_para_2(self, mock_call, mock_get_state):
         """Deve aumentar velocidade de 1 para 2"""
         mock_get_state.return_value = "1"
@@ -527,8 +538,8 @@ class TestFanSpeedFeature:
         assert call_args[0][2]["value"] == 2
         assert "2" in result["message"]
     
-    @patch('core.domains.climate.get_state')
-    @patch('core.domains.climate.call_service')
+    @patch('core.domains.climate.async_get_state')
+    @patch('core.domains.climate.async_call_service')
     def test_increase_speed_de_3_permanece_3(self, mock_call, mock_get_state):
         """Deve manter velocidade em 3 (máxima)"""
         mock_get_state.return_value = "3"
@@ -543,8 +554,8 @@ class TestFanSpeedFeature:
         assert call_args[0][1] == "set_value"
         assert call_args[0][2]["value"] == 3
     
-    @patch('core.domains.climate.get_state')
-    @patch('core.domains.climate.call_service')
+    @patch('core.domains.climate.async_get_state')
+    @patch('core.domains.climate.async_call_service')
     def test_decrease_speed_de_3_para_2(self, mock_call, mock_get_state):
         """Deve diminuir velocidade de 3 para 2"""
         mock_get_state.return_value = "3"
@@ -560,8 +571,8 @@ class TestFanSpeedFeature:
         assert call_args[0][2]["value"] == 2
         assert "2" in result["message"]
     
-    @patch('core.domains.climate.get_state')
-    @patch('core.domains.climate.call_service')
+    @patch('core.domains.climate.async_get_state')
+    @patch('core.domains.climate.async_call_service')
     def test_decrease_speed_de_1_permanece_1(self, mock_call, mock_get_state):
         """Deve manter velocidade em 1 (mínima)"""
         mock_get_state.return_value = "1"
@@ -3,11 +3,14 @@ Testes para core.context_manager
 
 Testa o gerenciamento de contexto para confirmacoes
 """
+import asyncio
 import time
 
 import pytest
 
-from core.context_manager import ContextManager
+from core.context_manager import (ContextManager, ContextStore, context,
+                                  current_session, session_scope)
+from utils.aio import run_sync
 
 
 class TestContextManager:
@@ -111,3 +114,127 @@ class TestContextManager:
         expected_expiry = start + 10
         # Tolerancia de 1 segundo
         assert abs(ctx.data["expires"] - expected_expiry) < 1  # type: ignore
+
+
+class TestContextStore:
+    """Testes para o store de contextos por sessao"""
+
+    def test_set_get_per_session(self):
+        """Cada sessao deve ter seu proprio contexto"""
+        store = ContextStore(auto_tick=False)
+        store.set("sala", {"domain": "light"})
+        store.set("quarto", {"domain": "climate"})
+
+        assert store.get("sala")["payload"] == {"domain": "light"}
+        assert store.get("quarto")["payload"] == {"domain": "climate"}
+        assert store.get("cozinha") is None
+
+    def test_expires_by_timer_wheel(self):
+        """Contexto deve sumir quando o wheel passa do ttl"""
+        store = ContextStore(tick=0.1, auto_tick=False)
+        store.set("sala", {"domain": "light"}, ttl=1)
+
+        store.advance(10)
+        assert store.get("sala") is not None
+
+        store.advance(1)
+        assert store.get("sala") is None
+        assert store.expired == 1
+
+    def test_set_again_restarts_ttl(self):
+        """Novo set deve substituir o timer anterior"""
+        store = ContextStore(tick=1, auto_tick=False)
+        store.set("sala", {"n": 1}, ttl=2)
+        store.advance(2)
+        store.set("sala", {"n": 2}, ttl=2)
+        store.advance(2)
+
+        assert store.get("sala")["payload"] == {"n": 2}
+
+    def test_zero_ttl_and_delete(self):
+        """ttl 0 e delete devem remover o contexto imediatamente"""
+        store = ContextStore(auto_tick=False)
+        store.set("sala", {"domain": "light"})
+        store.set("sala", {"domain": "light"}, ttl=0)
+        assert store.get("sala") is None
+
+        store.set("sala", {"domain": "light"})
+        store.delete("sala")
+        assert store.get("sala") is None
+        assert len(store) == 0
+
+    def test_compare_and_set_and_take(self):
+        """compare_and_set so grava na versao esperada; take le e remove"""
+        store = ContextStore(auto_tick=False)
+        v1 = store.compare_and_set("sala", None, {"n": 1})
+
+        assert v1 is not None
+        assert store.compare_and_set("sala", None, {"n": 2}) is None
+        assert store.compare_and_set("sala", v1, {"n": 3}) is not None
+        assert store.take("sala")["payload"] == {"n": 3}
+        assert store.take("sala") is None
+
+    def test_bounded_per_shard(self):
+        """Acima do limite sai a sessao mais antiga do shard"""
+        store = ContextStore(shards=1, max_per_shard=3, auto_tick=False)
+        for i in range(5):
+            store.set(f"satelite-{i}", {"n": i})
+
+        assert len(store) == 3
+        assert store.evicted == 2
+        assert store.get("satelite-0") is None
+        assert store.get("satelite-4") is not None
+
+    def test_ticker_thread_expires(self):
+        """Thread de tick deve expirar sem ninguem chamar advance"""
+        store = ContextStore(tick=0.01)
+        store.set("sala", {"domain": "light"}, ttl=0.05)
+
+        deadline = time.time() + 2
+        while store.get("sala") is not None and time.time() < deadline:
+            time.sleep(0.01)
+
+        assert store.get("sala") is None
+
+
+class TestSessionContext:
+    """Testes para o contexto por sessao"""
+
+    def setup_method(self):
+        context.clear()
+
+    def test_scope_isolates_from_default(self):
+        """Dentro da sessao, context deve usar o contexto da sessao"""
+        with session_scope("sala"):
+            context.set({"domain": "light"})
+            assert current_session() == "sala"
+            assert context.valid()
+
+        assert not context.valid()
+        with session_scope("sala"):
+            assert context.data["payload"] == {"domain": "light"}
+            context.clear()
+
+    @pytest.mark.asyncio
+    async def test_tasks_inherit_session(self):
+        """Tasks criadas na sessao devem ver o mesmo contexto"""
+        async def pending():
+            return context.valid()
+
+        with session_scope("quarto"):
+            context.set({"domain": "climate"})
+            task = asyncio.create_task(pending())
+
+        assert await task
+        assert not context.valid()
+        with session_scope("quarto"):
+            context.clear()
+
+    def test_run_sync_keeps_session(self):
+        """Wrappers sincronos (run_sync) devem ver a sessao de quem chamou"""
+        async def session():
+            return current_session()
+
+        with session_scope("cozinha"):
+            assert run_sync(session()) == "cozinha"
+        assert run_sync(session()) == current_session()
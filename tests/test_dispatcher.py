@@ -18,7 +18,7 @@ class TestDispatch:
         """Limpa contexto antes de cada teste"""
         context.clear()
     
-    @patch('core.domains.light.handle')
+    @patch('core.domains.light.async_handle')
     def test_dispatch_light_domain(self, mock_light_handle):
         """Deve rotear intent de luz para light.handle"""
         mock_light_handle.return_value = {"message": "Luz ligada"}
@@ -29,7 +29,7 @@ class TestDispatch:
         mock_light_handle.assert_called_once_with(intent)
         assert result == {"message": "Luz ligada"}
     
-    @patch('core.domains.climate.handle')
+    @patch('core.domains.climate.async_handle')
     def test_dispatch_climate_domain(self, mock_climate_handle):
         """Deve rotear intent de clima para climate.handle"""
         mock_climate_handle.return_value = {"message": "Ar ligado"}
@@ -55,7 +55,7 @@ class TestDispatch:
         
         assert "message" in result
     
-    @patch('core.domains.light.handle_confirmation')
+    @patch('core.domains.light.async_handle_confirmation')
     def test_dispatch_with_active_context_light(self, mock_confirmation):
         """Deve rotear para confirmacao quando contexto ativo (light)"""
         mock_confirmation.return_value = {"message": "Luz desligada"}
@@ -69,7 +69,7 @@ class TestDispatch:
         mock_confirmation.assert_called_once_with(intent)
         assert result == {"message": "Luz desligada"}
     
-    @patch('core.domains.climate.handle_confirmation')
+    @patch('core.domains.climate.async_handle_confirmation')
     def test_dispatch_with_active_context_climate(self, mock_confirmation):
         """Deve rotear para confirmacao quando contexto ativo (climate)"""
         mock_confirmation.return_value = {"message": "Ar desligado"}
@@ -83,7 +83,7 @@ class TestDispatch:
         mock_confirmation.assert_called_once_with(intent)
         assert result == {"message": "Ar desligado"}
     
-    @patch('core.domains.light.handle')
+    @patch('core.domains.light.async_handle')
     def test_dispatch_expired_context_routes_normally(self, mock_light_handle):
         """Deve rotear normalmente se contexto expirado"""
         mock_light_handle.return_value = {"message": "OK"}
@@ -100,6 +100,18 @@ class TestDispatch:
         # Deve chamar handle normal, nao confirmation
         mock_light_handle.assert_called_once_with(intent)
 
+    @patch('core.domains.light.async_handle_confirmation')
+    def test_dispatch_context_expiring_during_read(self, mock_confirmation):
+        """Contexto expirando logo apos a leitura nao deve quebrar o dispatch"""
+        mock_confirmation.return_value = {"message": "Luz desligada"}
+        entry = {"payload": {"domain": "light"}, "expires": 0}
+
+        # Primeira leitura ve a entrada; as seguintes ja a veem expirada
+        with patch('core.context_manager.store.get', side_effect=[entry, None, None]):
+            result = dispatch({"text": "sala"})
+
+        assert result == {"message": "Luz desligada"}
+
 
 class TestDispatchIntegration:
     """Testes de integracao entre dispatcher e dominios"""
@@ -108,8 +120,8 @@ class TestDispatchIntegration:
         """Limpa contexto antes de cada teste"""
         context.clear()
     
-    @patch('core.domains.light.call_service')
-    @patch('core.domains.light.get_all_states')
+    @patch('core.domains.light.async_call_service')
+    @patch('core.domains.light.async_get_all_states')
     def test_dispatch_full_flow_light(self, mock_states, mock_call):
         """Teste de fluxo completo para luz"""
         mock_states.return_value = [
@@ -131,3 +143,220 @@ class TestDispatchIntegration:
         
         assert "message" in result
         mock_call.assert_called_once()
+
+
+class TestAsyncDispatch:
+    """Testes para async_dispatch e a ponte sincrona"""
+    
+    def setup_method(self):
+        """Limpa contexto antes de cada teste"""
+        context.clear()
+    
+    @pytest.mark.asyncio
+    @patch('core.domains.light.async_handle')
+    async def test_async_dispatch(self, mock_light_handle):
+        """async_dispatch deve aguardar o handler async do dominio"""
+        from core.dispatcher import async_dispatch
+        
+        mock_light_handle.return_value = {"message": "OK"}
+        
+        result = await async_dispatch({"domain": "light", "intent": "on"})
+        
+        assert result == {"message": "OK"}
+        mock_light_handle.assert_awaited_once()
+    
+    @pytest.mark.asyncio
+    async def test_sync_dispatch_inside_event_loop_fails(self):
+        """dispatch sincrono nao pode ser usado dentro de um event loop"""
+        with pytest.raises(RuntimeError):
+            dispatch({"domain": "unknown"})
+    
+    @patch('core.domains.light.async_handle')
+    def test_concurrent_commands_overlap(self, mock_light_handle):
+        """Comandos concorrentes devem rodar em paralelo no mesmo worker"""
+        import asyncio
+        import time
+        
+        from core.dispatcher import async_dispatch
+        
+        async def slow_handle(intent):
+            await asyncio.sleep(0.2)
+            return {"message": "OK"}
+        
+        mock_light_handle.side_effect = slow_handle
+        
+        async def burst():
+            intents = [{"domain": "light", "intent": "on"} for _ in range(50)]
+            return await asyncio.gather(*(async_dispatch(i) for i in intents))
+        
+        start = time.perf_counter()
+        results = asyncio.run(burst())
+        elapsed = time.perf_counter() - start
+        
+        assert len(results) == 50
+        assert elapsed < 1.0
+
+
+class TestDomainRegistry:
+    """Testes para o registro de dominios com import sob demanda"""
+    
+    def test_dispatcher_import_does_not_load_domains(self):
+        """Importar o dispatcher nao deve importar os modulos de dominio"""
+        import subprocess
+        import sys
+        
+        code = (
+            "import sys, core.dispatcher; "
+            "print(any(m.startswith('core.domains.') for m in sys.modules))"
+        )
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        assert out.stdout.strip() == "False"
+    
+    def test_handler_loads_module_on_first_use(self):
+        """O modulo so e importado (e cronometrado) na primeira consulta"""
+        from core.registry import DomainRegistry
+        
+        registry = DomainRegistry({"fake": "json"})
+        assert registry.report()[0]["loaded"] is False
+        
+        assert registry.handler("fake", "loads") is not None
+        
+        row = registry.report()[0]
+        assert row["loaded"] is True
+        assert row["import_ms"] >= 0
+    
+    def test_unknown_domain_and_handler(self):
+        """Dominio nao registrado ou sem o handler devolve None"""
+        from core.registry import DomainRegistry
+        
+        registry = DomainRegistry({"fake": "json"})
+        
+        assert registry.handler("nope") is None
+        assert registry.handler(None) is None
+        assert registry.handler("fake", "async_handle") is None
+    
+    def test_preload_returns_unknown(self):
+        """preload importa os conhecidos e devolve os desconhecidos"""
+        from core.registry import DomainRegistry
+        
+        registry = DomainRegistry({"fake": "json"})
+        
+        assert registry.preload(["fake", "nope"]) == ["nope"]
+        assert registry.report()[0]["loaded"] is True
+    
+    def test_dispatch_registered_domain_without_handler(self):
+        """Dominio registrado sem async_handle cai em 'nao entendi'"""
+        from core.registry import registry
+        
+        context.clear()
+        registry.register("fake", "json")
+        try:
+            result = dispatch({"domain": "fake", "intent": "on"})
+        finally:
+            registry._domains.pop("fake")
+        
+        assert "entendi" in result["message"].lower()
+
+
+class TestCompoundDispatch:
+    """Testes para comandos compostos entre dominios"""
+    
+    def setup_method(self):
+        """Limpa contexto antes de cada teste"""
+        context.clear()
+    
+    @patch('core.domains.climate.async_handle')
+    @patch('core.domains.light.async_handle')
+    def test_replies_merged_in_order(self, mock_light, mock_climate):
+        """Cada trecho vai para seu dominio e as respostas saem na ordem da frase"""
+        from core.intent_parser import parse
+        
+        mock_light.return_value = {"message": "sala ligada."}
+        mock_climate.return_value = {"message": "Ar do quarto ligado."}
+        
+        result = dispatch(parse("ligar ar do quarto e ligar luz da sala"))
+        
+        assert result["message"] == "Ar do quarto ligado. | sala ligada."
+        assert [s["domain"] for s in result["segments"]] == ["climate", "light"]
+        assert mock_light.call_args[0][0]["search"] == "luz sala"
+        assert mock_climate.call_args[0][0]["search"] == "quarto"
+    
+    @patch('core.domains.climate.async_handle')
+    @patch('core.domains.light.async_handle')
+    def test_domains_run_in_parallel(self, mock_light, mock_climate):
+        """Latencia total e a do trecho mais lento, nao a soma"""
+        import asyncio
+        import time
+        
+        async def slow(intent):
+            await asyncio.sleep(0.3)
+            return {"message": "OK"}
+        
+        mock_light.side_effect = slow
+        mock_climate.side_effect = slow
+        
+        intent = {
+            "intent": "compound",
+            "domain": "compound",
+            "commands": [
+                {"intent": "on", "domain": "light", "search": "luz sala"},
+                {"intent": "on", "domain": "climate", "search": "quarto"},
+            ],
+        }
+        
+        start = time.perf_counter()
+        dispatch(intent)
+        elapsed = time.perf_counter() - start
+        
+        assert elapsed < 0.5
+    
+    @patch('core.domains.climate.async_handle')
+    @patch('core.domains.light.async_handle')
+    def test_same_domain_keeps_order(self, mock_light, mock_climate):
+        """Trechos do mesmo dominio rodam em sequencia, na ordem da frase"""
+        import asyncio
+        
+        order = []
+        
+        async def climate(intent):
+            await asyncio.sleep(0.05 if intent["intent"] == "on" else 0)
+            order.append(intent["intent"])
+            return {"message": intent["intent"]}
+        
+        mock_climate.side_effect = climate
+        mock_light.return_value = {"message": "luz"}
+        
+        intent = {
+            "intent": "compound",
+            "domain": "compound",
+            "commands": [
+                {"intent": "on", "domain": "climate", "search": "quarto"},
+                {"intent": "on", "domain": "light", "search": "luz sala"},
+                {"intent": "set_temperature", "domain": "climate", "room": "quarto", "value": 22},
+            ],
+        }
+        
+        result = dispatch(intent)
+        
+        assert order == ["on", "set_temperature"]
+        assert result["message"] == "on | luz | set_temperature"
+    
+    @patch('core.domains.climate.async_handle')
+    @patch('core.domains.light.async_handle')
+    def test_failed_segment_does_not_drop_others(self, mock_light, mock_climate):
+        """Falha num trecho vira mensagem; os outros respondem normalmente"""
+        mock_light.side_effect = RuntimeError("boom")
+        mock_climate.return_value = {"message": "Ar do quarto ligado."}
+        
+        intent = {
+            "intent": "compound",
+            "domain": "compound",
+            "commands": [
+                {"intent": "on", "domain": "light", "search": "luz sala"},
+                {"intent": "on", "domain": "climate", "search": "quarto"},
+            ],
+        }
+        
+        result = dispatch(intent)
+        
+        assert result["message"] == "Falha ao executar comando. | Ar do quarto ligado."
@@ -0,0 +1,53 @@
+"""
+Testes para tools.eval_corpus
+
+Testa a avaliacao do intent_parser contra um corpus JSONL
+"""
+import json
+
+from tools.eval_corpus import evaluate, load_corpus, main
+
+
+def write_corpus(path, cases):
+    path.write_text("\n".join(json.dumps(c, ensure_ascii=False) for c in cases) + "\n", encoding="utf-8")
+
+
+class TestEvalCorpus:
+    """Testes da CLI de avaliacao"""
+
+    def test_evaluate_reports_accuracy(self):
+        """Deve contar acertos e listar falhas"""
+        report = evaluate([
+            {"text": "ligar luz da sala", "intent": "on", "domain": "light"},
+            {"text": "apagar led", "intent": "on"},
+        ])
+
+        assert report["total"] == 2
+        assert report["correct"] == 1
+        assert report["accuracy"] == 0.5
+        assert report["failures"][0]["got"] == {"intent": "off"}
+        assert report["per_second"] > 0
+
+    def test_main_min_accuracy(self, tmp_path, capsys):
+        """--min-accuracy deve definir o codigo de saida"""
+        corpus = tmp_path / "corpus.jsonl"
+        write_corpus(corpus, [
+            {"text": "desligar ar do quarto", "intent": "off", "search": "quarto"},
+            {"text": "apagar led", "intent": "on"},
+        ])
+
+        assert main([str(corpus), "--min-accuracy", "0.5"]) == 0
+        assert main([str(corpus), "--min-accuracy", "1"]) == 1
+        assert "frases/s" in capsys.readouterr().out
+
+    def test_record_round_trip(self, tmp_path):
+        """Corpus gravado com --record deve passar 100%"""
+        texts = tmp_path / "frases.txt"
+        texts.write_text("ligar luz da sala\nligar ventilador do quarto\n", encoding="utf-8")
+        corpus = tmp_path / "corpus.jsonl"
+
+        assert main([str(texts), "--record", str(corpus)]) == 0
+        cases = load_corpus(str(corpus))
+
+        assert len(cases) == 2
+        assert evaluate(cases)["accuracy"] == 1.0
@@ -0,0 +1,214 @@
+"""
+Testes para tools.fake_ha
+
+Exercita HTTP real (pool keep-alive, concorrencia, erros) e o WebSocket
+contra o Home Assistant falso, sem mock de requests/aiohttp
+"""
+import asyncio
+import gc
+import warnings
+from unittest.mock import patch
+
+import pytest
+import requests
+
+from core import ha_client
+from core.ha_client import AsyncHAClient, HAClient
+from core.state_mirror import StateMirror, websocket_url
+from tools.fake_ha import BASE_LIGHTS, FakeHA, FakeHAServer, main, make_entities
+
+
+@pytest.fixture
+def server():
+    with FakeHAServer(FakeHA(entities=300, token="fake")) as s:
+        yield s
+
+
+def make_client(server, **kwargs):
+    return HAClient(base_url=server.url, headers={"Authorization": "Bearer fake"}, **kwargs)
+
+
+class TestMakeEntities:
+    """Testes do conjunto sintetico de entidades"""
+
+    def test_count_and_known_entities(self):
+        """Deve completar a quantidade pedida mantendo luzes e ar conhecidos"""
+        states = make_entities(500)
+        ids = {s["entity_id"] for s in states}
+
+        assert len(states) == 500
+        assert set(BASE_LIGHTS) <= ids
+        assert "input_number.temperature_quarto" in ids
+        assert "binary_sensor.ar_condicionado_quarto_contact" in ids
+
+    def test_deterministic_by_seed(self):
+        """Mesma seed deve gerar as mesmas entidades"""
+        a = [(s["entity_id"], s["attributes"]["friendly_name"]) for s in make_entities(100, seed=1)]
+        b = [(s["entity_id"], s["attributes"]["friendly_name"]) for s in make_entities(100, seed=1)]
+        assert a == b
+
+
+class TestRest:
+    """Testes da API REST com HAClient real"""
+
+    def test_states_and_single_state(self, server):
+        """/api/states e /api/states/<id> devem responder como o HA"""
+        client = make_client(server)
+        try:
+            assert len(client.get("/api/states").json()) == 300
+            assert client.get("/api/states/light.sala").json()["attributes"]["friendly_name"] == "Luz da Sala"
+            assert client.get("/api/states/light.nao_existe").status_code == 404
+        finally:
+            client.close()
+
+    def test_service_changes_state(self, server):
+        """Servico deve alterar o estado e ficar registrado em calls"""
+        client = make_client(server)
+        try:
+            r = client.post("/api/services/light/turn_on", {"entity_id": ["light.sala"]})
+            assert r.status_code == 200
+            assert r.json()[0]["state"] == "on"
+            assert client.get("/api/states/light.sala").json()["state"] == "on"
+
+            client.post("/api/services/input_number/set_value",
+                        {"entity_id": "input_number.temperature_quarto", "value": 19})
+            assert server.fake.states["input_number.temperature_quarto"]["state"] == "19.0"
+        finally:
+            client.close()
+
+        assert server.fake.calls[0] == ("light", "turn_on", {"entity_id": ["light.sala"]})
+
+    def test_reuses_connection(self, server):
+        """Chamadas seguidas devem reaproveitar a conexao keep-alive"""
+        client = make_client(server)
+        try:
+            for _ in range(5):
+                client.get("/api/states/light.sala")
+            stats = client.stats()
+        finally:
+            client.close()
+
+        assert stats["requests"] == 5
+        assert stats["new_connections"] == 1
+
+    def test_rejects_wrong_token(self, server):
+        """Token errado deve receber 401"""
+        client = HAClient(base_url=server.url, headers={"Authorization": "Bearer outro"})
+        try:
+            assert client.get("/api/states").status_code == 401
+        finally:
+            client.close()
+
+    def test_injected_errors(self):
+        """error_rate=1 deve responder 500 em toda requisicao"""
+        with FakeHAServer(FakeHA(entities=10, error_rate=1.0)) as s:
+            client = HAClient(base_url=s.url, headers={})
+            try:
+                assert client.get("/api/states").status_code == 500
+            finally:
+                client.close()
+            assert s.fake.errors == 1
+
+    def test_module_functions_end_to_end(self, server):
+        """call_service/get_state do ha_client devem funcionar via HA_URL do fake"""
+        client = make_client(server)
+        try:
+            with patch.object(ha_client, "client", client), \
+                 patch.object(ha_client.mirror, "ready", False):
+                ha_client.call_service("light", "turn_on", {"entity_id": ["light.quarto"]})
+                assert ha_client.get_state("light.quarto") == "on"
+                assert ha_client.get_state("light.nao_existe") is None
+        finally:
+            client.close()
+
+
+class TestAsyncRest:
+    """Testes da API REST com AsyncHAClient real"""
+
+    def test_concurrency_limited_by_client(self):
+        """Requisicoes simultaneas devem respeitar max_concurrency do cliente"""
+        with FakeHAServer(FakeHA(entities=10, latency=0.02)) as s:
+            client = AsyncHAClient(base_url=s.url, headers={}, max_concurrency=3, rate_limit=0)
+
+            async def run():
+                try:
+                    return await asyncio.gather(*[
+                        client.request("GET", "/api/states/light.sala") for _ in range(9)
+                    ])
+                finally:
+                    await client.close()
+
+            results = asyncio.run(run())
+
+            assert all(status == 200 for status, _ in results)
+            assert s.fake.requests == 9
+            assert s.fake.peak_in_flight == 3
+
+    def test_new_event_loop_closes_old_session(self, server):
+        """Sessao do event loop anterior e fechada (sem "Unclosed client session")"""
+        client = AsyncHAClient(base_url=server.url, headers={"Authorization": "Bearer fake"}, rate_limit=0)
+
+        async def request():
+            await client.request("GET", "/api/states/light.sala")
+            return client._session
+
+        first = asyncio.run(request())
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            second = asyncio.run(request())
+            gc.collect()
+        asyncio.run(client.close())
+
+        assert second is not first
+        assert first.closed
+        assert not [w for w in caught if "Unclosed" in str(w.message)]
+
+
+class TestWebSocket:
+    """Testes da API WebSocket com o StateMirror real"""
+
+    def test_mirror_loads_and_follows_events(self, server):
+        """Espelho deve carregar o snapshot e receber state_changed de servicos"""
+        mirror = StateMirror()
+
+        async def run():
+            task = asyncio.create_task(mirror.run(websocket_url(server.url), "fake", reconnect_delay=0.05))
+            try:
+                assert await mirror.wait_ready(2)
+                assert len(mirror) == 300
+
+                client = AsyncHAClient(base_url=server.url, headers={"Authorization": "Bearer fake"}, rate_limit=0)
+                await client.request("POST", "/api/services/light/turn_on", {"entity_id": ["light.cozinha"]})
+                await client.close()
+
+                for _ in range(100):
+                    if mirror.get("light.cozinha")["state"] == "on":
+                        break
+                    await asyncio.sleep(0.01)
+                assert mirror.get("light.cozinha")["state"] == "on"
+            finally:
+                task.cancel()
+
+        asyncio.run(run())
+
+    def test_mirror_rejects_wrong_token(self, server):
+        """Token errado deve encerrar o espelho sem reconectar"""
+        mirror = StateMirror()
+
+        async def run():
+            await asyncio.wait_for(mirror.run(websocket_url(server.url), "outro", reconnect_delay=0.05), 2)
+
+        asyncio.run(run())
+        assert not mirror.ready
+
+
+class TestCli:
+    """Testes da linha de comando"""
+
+    def test_help(self, capsys):
+        """--help deve listar as opcoes de latencia e erros"""
+        with pytest.raises(SystemExit):
+            main(["--help"])
+        out = capsys.readouterr().out
+        assert "--latency" in out
+        assert "--error-rate" in out
@@ -0,0 +1,110 @@
+"""
+Testes para core.fuzzy
+
+Testa o indice de trigramas usado na busca aproximada de entidades
+"""
+from core.fuzzy import EntityIndex, TrigramIndex, normalize_text, trigrams
+
+
+def make_state(entity_id, name):
+    return {"entity_id": entity_id, "state": "off", "attributes": {"friendly_name": name}}
+
+
+class TestTrigrams:
+    """Testes para normalize_text e trigrams"""
+    
+    def test_normalize_text(self):
+        """Deve remover acentos, pontuacao e preposicoes"""
+        assert normalize_text("Luz da Sálla!") == "luz salla"
+        assert normalize_text("") == ""
+    
+    def test_trigrams_with_word_borders(self):
+        """Trigramas devem incluir as bordas de cada palavra"""
+        assert trigrams("sala") == {" sa", "sal", "ala", "la "}
+        assert trigrams("") == set()
+
+
+class TestTrigramIndex:
+    """Testes para TrigramIndex"""
+    
+    NAMES = ["Luz da Sala", "Luz Sala de Estar", "Luz do Quarto", "LED Quarto", "Luz da Cozinha", "Luz Varanda"]
+    
+    def setup_method(self):
+        self.index = TrigramIndex()
+        self.index.build([(n, n) for n in self.NAMES])
+    
+    def test_misspelled_queries(self):
+        """Erros comuns do STT devem ter o nome certo em primeiro"""
+        assert self.index.search("luz cosinha")[0][0] == "Luz da Cozinha"
+        assert self.index.search("luz sálla")[0][0] == "Luz da Sala"
+        assert self.index.search("led cuarto")[0][0] == "LED Quarto"
+        assert self.index.search("luz varamda")[0][0] == "Luz Varanda"
+    
+    def test_ranked_scores(self):
+        """Candidatos devem vir ordenados por score decrescente"""
+        ranked = self.index.search("luz salla", min_score=0)
+        scores = [score for _, score in ranked]
+        
+        assert scores == sorted(scores, reverse=True)
+        assert len(ranked) <= 5
+    
+    def test_unrelated_query_returns_nothing(self):
+        """Nomes sem relacao nao devem passar do score minimo"""
+        assert self.index.search("luz garagem") == []
+        assert self.index.search("") == []
+
+
+class TestEntityIndex:
+    """Testes para EntityIndex (todos os dominios)"""
+    
+    STATES = [
+        make_state("light.cozinha", "Luz da Cozinha"),
+        make_state("switch.cafeteira", "Cafeteira"),
+        make_state("climate.quarto", "Ar do Quarto"),
+    ]
+    
+    def test_search_by_domain(self):
+        """Busca deve ser restrita ao dominio pedido"""
+        index = EntityIndex()
+        index.refresh(self.STATES)
+        
+        assert index.search("luz cosinha", domain="light")[0][0] == "light.cozinha"
+        assert index.search("cafetera", domain="light") == []
+        assert index.search("cafetera", domain="switch")[0][0] == "switch.cafeteira"
+        assert index.search("ar quatro")[0][0] == "climate.quarto"
+    
+    def test_unknown_domain(self):
+        """Dominio sem entidades retorna lista vazia"""
+        index = EntityIndex()
+        index.refresh(self.STATES)
+        
+        assert index.search("sala", domain="cover") == []
+    
+    def test_rebuild_only_when_names_change(self):
+        """Indice so deve ser reconstruido quando nomes mudam"""
+        index = EntityIndex()
+        index.refresh(self.STATES)
+        index.refresh([dict(s, state="on") for s in self.STATES])
+        
+        assert index.rebuilds == 1
+        
+        index.refresh(self.STATES + [make_state("light.varanda", "Luz Varanda")])
+        
+        assert index.rebuilds == 2
+    
+    def test_large_index_is_fast(self):
+        """Busca em milhares de entidades deve ficar abaixo de 1 ms"""
+        import time
+        
+        states = [make_state(f"light.l{i}", f"Luz Comodo {i}") for i in range(5000)]
+        states.append(make_state("light.cozinha", "Luz da Cozinha"))
+        index = EntityIndex()
+        index.refresh(states)
+        
+        start = time.perf_counter()
+        for _ in range(20):
+            result = index.search("cosinha", domain="light")
+        elapsed = (time.perf_counter() - start) / 20
+        
+        assert result[0][0] == "light.cozinha"
+        assert elapsed < 0.005
@@ -8,13 +8,14 @@ from unittest.mock import Mock, patch
 import pytest
 import requests
 
-from core.ha_client import call_service, get_all_states, get_state
+from core.ha_client import (call_service, get_all_states, get_state,
+                            get_states)
 
 
 class TestCallService:
     """Testes para call_service"""
     
-    @patch('core.ha_client.requests.post')
+    @patch('core.ha_client.requests.Session.post')
     def test_call_service_success(self, mock_post):
         """Deve chamar servico com sucesso"""
         mock_response = Mock()
@@ -27,7 +28,7 @@ class TestCallService:
         assert result is True
         mock_post.assert_called_once()
     
-    @patch('core.ha_client.requests.post')
+    @patch('core.ha_client.requests.Session.post')
     def test_call_service_with_correct_url(self, mock_post):
         """Deve construir URL corretamente"""
         mock_response = Mock()
@@ -42,7 +43,7 @@ class TestCallService:
         url_in_args = len(call_args.args) > 0 and "/api/services/light/turn_on" in call_args.args[0]
         assert url_in_kwargs or url_in_args
     
-    @patch('core.ha_client.requests.post')
+    @patch('core.ha_client.requests.Session.post')
     def test_call_service_timeout(self, mock_post):
         """Deve tratar timeout"""
         mock_post.side_effect = requests.exceptions.Timeout()
@@ -50,7 +51,7 @@ class TestCallService:
         with pytest.raises(requests.exceptions.Timeout):
             call_service("light", "turn_on", {"entity_id": "light.sala"})
     
-    @patch('core.ha_client.requests.post')
+    @patch('core.ha_client.requests.Session.post')
     def test_call_service_request_exception(self, mock_post):
         """Deve tratar erros de requisicao"""
         mock_post.side_effect = requests.exceptions.RequestException("Connection error")
@@ -58,7 +59,7 @@ class TestCallService:
         with pytest.raises(requests.exceptions.RequestException):
             call_service("light", "turn_on", {"entity_id": "light.sala"})
     
-    @patch('core.ha_client.requests.post')
+    @patch('core.ha_client.requests.Session.post')
     def test_call_service_http_error(self, mock_post):
         """Deve tratar erro HTTP"""
         mock_response = Mock()
@@ -72,7 +73,7 @@ class TestCallService:
 class TestGetAllStates:
     """Testes para get_all_states"""
     
-    @patch('core.ha_client.requests.get')
+    @patch('core.ha_client.requests.Session.get')
     def test_get_all_states_success(self, mock_get):
         """Deve retornar lista de estados"""
         mock_states = [
@@ -89,7 +90,7 @@ class TestGetAllStates:
         assert len(result) == 2
         assert result[0]["entity_id"] == "light.sala"
     
-    @patch('core.ha_client.requests.get')
+    @patch('core.ha_client.requests.Session.get')
     def test_get_all_states_empty(self, mock_get):
         """Deve retornar lista vazia se nao houver estados"""
         mock_response = Mock()
@@ -101,7 +102,7 @@ class TestGetAllStates:
         
         assert result == []
     
-    @patch('core.ha_client.requests.get')
+    @patch('core.ha_client.requests.Session.get')
     def test_get_all_states_timeout(self, mock_get):
         """Deve tratar timeout"""
         mock_get.side_effect = requests.exceptions.Timeout()
@@ -109,7 +110,7 @@ class TestGetAllStates:
         with pytest.raises(requests.exceptions.Timeout):
             get_all_states()
     
-    @patch('core.ha_client.requests.get')
+    @patch('core.ha_client.requests.Session.get')
     def test_get_all_states_request_exception(self, mock_get):
         """Deve tratar erro de requisicao"""
         mock_get.side_effect = requests.exceptions.RequestException("Network error")
@@ -121,34 +122,381 @@ class TestGetAllStates:
 class TestGetState:
     """Testes para get_state"""
     
-    @patch('core.ha_client.get_all_states')
-    def test_get_state_found(self, mock_get_all):
+    @patch('core.ha_client.requests.Session.get')
+    def test_get_state_found(self, mock_get):
         """Deve retornar estado quando entidade existe"""
-        mock_get_all.return_value = [
-            {"entity_id": "light.sala", "state": "on"},
-            {"entity_id": "light.quarto", "state": "off"}
-        ]
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = {"entity_id": "light.sala", "state": "on"}
         
         result = get_state("light.sala")
         
         assert result == "on"
     
-    @patch('core.ha_client.get_all_states')
-    def test_get_state_not_found(self, mock_get_all):
-        """Deve retornar None quando entidade nao existe"""
-        mock_get_all.return_value = [
-            {"entity_id": "light.sala", "state": "on"}
-        ]
+    @patch('core.ha_client.requests.Session.get')
+    def test_get_state_uses_single_entity_endpoint(self, mock_get):
+        """Deve consultar apenas /api/states/<entity_id>"""
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.json.return_value = {"entity_id": "light.sala", "state": "on"}
+        
+        get_state("light.sala")
+        
+        url = mock_get.call_args.args[0]
+        assert url.endswith("/api/states/light.sala")
+    
+    @patch('core.ha_client.requests.Session.get')
+    def test_get_state_not_found(self, mock_get):
+        """Deve retornar None quando entidade nao existe (404)"""
+        mock_get.return_value.status_code = 404
         
         result = get_state("light.inexistente")
         
         assert result is None
     
-    @patch('core.ha_client.get_all_states')
-    def test_get_state_empty_list(self, mock_get_all):
-        """Deve retornar None quando lista vazia"""
-        mock_get_all.return_value = []
+    @patch('core.ha_client.requests.Session.get')
+    def test_get_state_request_exception(self, mock_get):
+        """Deve propagar erro de requisicao"""
+        mock_get.side_effect = requests.exceptions.RequestException("Network error")
+        
+        with pytest.raises(requests.exceptions.RequestException):
+            get_state("light.sala")
+
+
+class TestGetStates:
+    """Testes para get_states (consulta em lote)"""
+    
+    @patch('core.ha_client.get_state')
+    def test_get_states_returns_dict(self, mock_get_state):
+        """Deve retornar estado de cada entidade pedida"""
+        mock_get_state.side_effect = lambda entity_id: {"light.sala": "on"}.get(entity_id)
         
-        result = get_state("light.qualquer")
+        result = get_states(["light.sala", "light.inexistente"])
         
-        assert result is None
+        assert result == {"light.sala": "on", "light.inexistente": None}
+    
+    def test_get_states_empty(self):
+        """Lista vazia nao deve consultar o HA"""
+        assert get_states([]) == {}
+    
+    @patch('core.ha_client.get_state')
+    def test_get_states_requests_in_parallel(self, mock_get_state):
+        """Consultas devem sobrepor em vez de somar latencias"""
+        import time
+        
+        def slow_state(entity_id):
+            time.sleep(0.2)
+            return "on"
+        
+        mock_get_state.side_effect = slow_state
+        ids = [f"light.l{i}" for i in range(5)]
+        
+        start = time.perf_counter()
+        result = get_states(ids)
+        elapsed = time.perf_counter() - start
+        
+        assert all(v == "on" for v in result.values())
+        assert elapsed < 0.6
+
+
+class TestHAClient:
+    """Testes para HAClient (sessao persistente com pool)"""
+    
+    def setup_method(self):
+        """Sobe um servidor HTTP local com keep-alive"""
+        import json
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            
+            def _reply(self, body):
+                payload = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+            
+            def do_GET(self):
+                self._reply([{"entity_id": "light.sala", "state": "on"}])
+            
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                self.rfile.read(length)
+                self._reply([])
+            
+            def log_message(self, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+    
+    def teardown_method(self):
+        self.server.shutdown()
+        self.server.server_close()
+    
+    def test_reuses_connection_between_calls(self):
+        """Chamadas sequenciais devem reaproveitar a mesma conexao"""
+        from core.ha_client import HAClient
+        
+        client = HAClient(base_url=self.base_url, pool_size=2)
+        for _ in range(5):
+            client.get("/api/states").raise_for_status()
+        client.post("/api/services/light/turn_on", {"entity_id": "light.sala"})
+        
+        stats = client.stats()
+        client.close()
+        
+        assert stats["requests"] == 6
+        assert stats["new_connections"] == 1
+        assert stats["reused_connections"] == 5
+    
+    def test_stats_empty_before_requests(self):
+        """Contadores devem iniciar zerados"""
+        from core.ha_client import HAClient
+        
+        client = HAClient(base_url=self.base_url)
+        
+        assert client.stats()["requests"] == 0
+        assert client.stats()["new_connections"] == 0
+    
+    def test_close_and_reopen(self):
+        """Cliente deve reabrir a sessao apos close()"""
+        from core.ha_client import HAClient
+        
+        client = HAClient(base_url=self.base_url)
+        client.get("/api/states")
+        client.close()
+        
+        assert client.session is None
+        
+        r = client.get("/api/states")
+        
+        assert r.json()[0]["entity_id"] == "light.sala"
+        client.close()
+    
+    @patch('core.ha_client.client')
+    def test_module_functions_use_shared_client(self, mock_client):
+        """call_service deve usar o cliente compartilhado"""
+        mock_client.base_url = "http://ha"
+        mock_client.post.return_value.status_code = 200
+        
+        call_service("light", "turn_on", {"entity_id": "light.sala"})
+        
+        mock_client.post.assert_called_once_with(
+            "/api/services/light/turn_on", {"entity_id": "light.sala"}
+        )
+
+
+class TestAsyncHAClient:
+    """Testes para AsyncHAClient e funcoes async_ contra servidor local"""
+    
+    async def start_server(self):
+        from aiohttp import web
+        
+        self.posts = []
+        
+        async def states(request):
+            return web.json_response([{"entity_id": "light.sala", "state": "on"}])
+        
+        async def state(request):
+            if request.match_info["entity_id"] != "light.sala":
+                return web.json_response({"message": "Entity not found."}, status=404)
+            return web.json_response({"entity_id": "light.sala", "state": "on"})
+        
+        async def service(request):
+            self.posts.append(await request.json())
+            return web.json_response([])
+        
+        app = web.Application()
+        app.router.add_get("/api/states", states)
+        app.router.add_get("/api/states/{entity_id}", state)
+        app.router.add_post("/api/services/{domain}/{service}", service)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}"
+    
+    @pytest.mark.asyncio
+    async def test_reuses_connection(self):
+        """Requisicoes sequenciais devem reaproveitar a conexao"""
+        from core.ha_client import AsyncHAClient
+        
+        base_url = await self.start_server()
+        client = AsyncHAClient(base_url=base_url)
+        try:
+            for _ in range(4):
+                status, body = await client.request("GET", "/api/states")
+                assert status == 200
+            
+            stats = client.stats()
+            assert stats["requests"] == 4
+            assert stats["new_connections"] == 1
+            assert stats["reused_connections"] == 3
+        finally:
+            await client.close()
+            await self.runner.cleanup()
+    
+    @pytest.mark.asyncio
+    async def test_async_functions(self):
+        """async_call_service / async_get_state devem usar o cliente async"""
+        from core import ha_client
+        from core.ha_client import AsyncHAClient
+        
+        base_url = await self.start_server()
+        client = AsyncHAClient(base_url=base_url)
+        try:
+            with patch('core.ha_client.async_client', client):
+                assert await ha_client.async_call_service("light", "turn_on", {"entity_id": "light.sala"})
+                assert await ha_client.async_get_state("light.sala") == "on"
+                assert await ha_client.async_get_state("light.inexistente") is None
+                states = await ha_client.async_get_states(["light.sala", "light.inexistente"])
+                all_states = await ha_client.async_get_all_states()
+            
+            assert self.posts == [{"entity_id": "light.sala"}]
+            assert states == {"light.sala": "on", "light.inexistente": None}
+            assert all_states[0]["entity_id"] == "light.sala"
+        finally:
+            await client.close()
+            await self.runner.cleanup()
+    
+    @pytest.mark.asyncio
+    async def test_http_error_raises(self):
+        """Erro HTTP deve propagar como aiohttp.ClientResponseError"""
+        import aiohttp
+        from core.ha_client import AsyncHAClient
+        
+        base_url = await self.start_server()
+        client = AsyncHAClient(base_url=base_url)
+        try:
+            with pytest.raises(aiohttp.ClientResponseError):
+                await client.request("GET", "/api/states/light.inexistente")
+        finally:
+            await client.close()
+            await self.runner.cleanup()
+
+
+class TestAsyncLimits:
+    """Testes para limites de concorrencia e taxa do cliente async"""
+    
+    @pytest.mark.asyncio
+    async def test_rate_limiter_spaces_requests(self):
+        """RateLimiter deve espacar requisicoes alem da rajada"""
+        import asyncio
+        
+        from core.ha_client import RateLimiter
+        
+        limiter = RateLimiter(rate=20, burst=2)
+        loop = asyncio.get_running_loop()
+        
+        start = loop.time()
+        await asyncio.gather(*(limiter.acquire() for _ in range(6)))
+        elapsed = loop.time() - start
+        
+        # 2 imediatas + 4 a cada 50ms
+        assert elapsed >= 0.18
+    
+    @pytest.mark.asyncio
+    async def test_rate_limiter_disabled(self):
+        """rate=0 nao deve limitar"""
+        from core.ha_client import RateLimiter
+        
+        limiter = RateLimiter(rate=0)
+        for _ in range(100):
+            await limiter.acquire()
+    
+    @pytest.mark.asyncio
+    async def test_max_concurrency(self):
+        """Requisicoes simultaneas nao devem passar do limite configurado"""
+        import asyncio
+        
+        from aiohttp import web
+        
+        from core.ha_client import AsyncHAClient
+        
+        async def slow(request):
+            await asyncio.sleep(0.05)
+            return web.json_response([])
+        
+        app = web.Application()
+        app.router.add_post("/api/services/{domain}/{service}", slow)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        
+        client = AsyncHAClient(base_url=f"http://127.0.0.1:{port}", max_concurrency=2, rate_limit=0)
+        try:
+            await asyncio.gather(*(
+                client.request("POST", "/api/services/light/turn_on", {}) for _ in range(6)
+            ))
+            assert client.stats()["peak_in_flight"] == 2
+            assert client.stats()["requests"] == 6
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+
+class TestCoalesceCalls:
+    """Testes para coalesce_calls (agrupamento de chamadas)"""
+    
+    def test_merges_same_service(self):
+        """Chamadas iguais devem virar uma so com entity_id unido"""
+        from core.ha_client import coalesce_calls
+        
+        groups = coalesce_calls([
+            {"domain": "light", "service": "turn_on", "data": {"entity_id": ["light.sala"]}},
+            {"domain": "light", "service": "turn_on", "data": {"entity_id": "light.quarto"}},
+        ])
+        
+        assert groups == [{
+            "domain": "light",
+            "service": "turn_on",
+            "data": {"entity_id": ["light.sala", "light.quarto"]},
+            "members": [0, 1],
+        }]
+    
+    def test_keeps_distinct_services_apart(self):
+        """Servicos diferentes devem ficar em grupos separados"""
+        from core.ha_client import coalesce_calls
+        
+        groups = coalesce_calls([
+            {"domain": "light", "service": "turn_on", "data": {"entity_id": ["light.sala"]}},
+            {"domain": "light", "service": "turn_off", "data": {"entity_id": ["light.quarto"]}},
+            {"domain": "light", "service": "turn_on", "data": {"entity_id": ["light.cozinha"]}},
+        ])
+        
+        assert [g["service"] for g in groups] == ["turn_on", "turn_off"]
+        assert groups[0]["members"] == [0, 2]
+        assert groups[1]["members"] == [1]
+    
+    def test_different_service_data_not_merged(self):
+        """Dados de servico diferentes nao podem ser unidos"""
+        from core.ha_client import coalesce_calls
+        
+        groups = coalesce_calls([
+            {"domain": "light", "service": "turn_on", "data": {"entity_id": ["light.sala"], "brightness": 100}},
+            {"domain": "light", "service": "turn_on", "data": {"entity_id": ["light.quarto"], "brightness": 50}},
+            {"domain": "light", "service": "turn_on", "data": {"brightness": 100, "entity_id": ["light.cozinha"]}},
+        ])
+        
+        assert len(groups) == 2
+        assert groups[0]["data"] == {"entity_id": ["light.sala", "light.cozinha"], "brightness": 100}
+    
+    def test_dedupes_entities_and_handles_no_entity(self):
+        """Entidades repetidas aparecem uma vez; chamadas sem entity_id sao preservadas"""
+        from core.ha_client import coalesce_calls
+        
+        groups = coalesce_calls([
+            {"domain": "light", "service": "turn_on", "data": {"entity_id": ["light.sala"]}},
+            {"domain": "light", "service": "turn_on", "data": {"entity_id": ["light.sala"]}},
+            {"domain": "script", "service": "gelar_ar_lg_quarto", "data": {}},
+        ])
+        
+        assert groups[0]["data"] == {"entity_id": ["light.sala"]}
+        assert groups[1]["data"] == {}
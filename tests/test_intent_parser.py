@@ -5,7 +5,11 @@ Testa a normalizacao de texto e parsing de intents
 """
 import pytest
 
-from core.intent_parser import normalize, parse
+from core import intent_parser
+from core.intent_parser import (IncrementalParser, ParseCache, RuleEngine,
+                                Utterance, explain, is_complete, normalize,
+                                normalize_many, parse, parse_cache, parse_many,
+                                remaining_commands, split_compound)
 
 
 class TestNormalize:
@@ -34,6 +38,11 @@ class TestNormalize:
         """Deve retornar vazio se apenas stopwords"""
         assert normalize("do da de") == ""
 
+    def test_normalize_many_matches_normalize(self):
+        """normalize_many deve dar o mesmo resultado de normalize por item"""
+        texts = ["Ligar a LUZ da Sala", "", "desligar árêâ", "do da de", "texto\x00com separador"]
+        assert normalize_many(texts) == [normalize(t) for t in texts]
+
 
 class TestParseLights:
     """Testes para parsing de comandos de luz"""
@@ -51,6 +60,11 @@ class TestParseLights:
         assert result["intent"] == "off"
         assert result["domain"] == "light"
         assert "quarto" in result["search"]
+
+    def test_parse_desligar_nao_deixa_sobra(self):
+        """'desligar' deve sair inteiro do search (sem sobrar 'des')"""
+        result = parse("desligar luz da sala")
+        assert result["search"] == "luz sala"
     
     def test_parse_acender_sinonimo(self):
         """Deve reconhecer 'acender' como sinonimo de ligar"""
@@ -322,3 +336,279 @@ class TestParseEdgeCases:
         assert result["domain"] == "light"
         # search deve ter "luz" como default
         assert "luz" in result["search"]
+
+
+class TestParseCompound:
+    """Testes para comandos compostos entre dominios"""
+    
+    def test_light_and_climate(self):
+        """Luz e ar na mesma frase viram dois sub-intents, na ordem"""
+        result = parse("ligar luz da sala e ligar ar do quarto")
+        
+        assert result["intent"] == "compound"
+        first, second = result["commands"]
+        assert (first["domain"], first["intent"], first["search"]) == ("light", "on", "luz sala")
+        assert (second["domain"], second["intent"], second["search"]) == ("climate", "on", "quarto")
+    
+    def test_segment_inherits_action(self):
+        """Trecho sem acao usa a acao do trecho anterior"""
+        assert split_compound("desligar o ar e a luz da sala") == [
+            "desligar o ar", "desligar a luz da sala"
+        ]
+        
+        result = parse("desligar o ar e a luz da sala")
+        assert [c["intent"] for c in result["commands"]] == ["off", "off"]
+    
+    def test_same_domain_keeps_existing_rules(self):
+        """So luzes continua indo para multi; so ar para as regras de climate"""
+        assert parse("ligar luz da sala e led do quarto")["intent"] == "multi"
+        assert parse("ligar ventilador e aquecedor do quarto")["intent"] == "fan_on"
+    
+    def test_segment_without_domain_joins_previous(self):
+        """Trecho sem luz nem ar continua o anterior (multi das luzes)"""
+        text = "ligar luz da sala e da cozinha e ligar ar do quarto"
+        assert split_compound(text) == ["ligar luz da sala e da cozinha", "ligar ar do quarto"]
+        
+        result = parse(text)
+        assert result["intent"] == "compound"
+        lights, climate = result["commands"]
+        assert (lights["domain"], lights["intent"]) == ("light", "multi")
+        assert lights["text"] == "ligar luz da sala e da cozinha"
+        assert (climate["domain"], climate["intent"], climate["search"]) == ("climate", "on", "quarto")
+    
+    def test_other_verb_does_not_inherit_action(self):
+        """Trecho com verbo que nao e acao nao herda a acao do anterior"""
+        assert split_compound("acender ar e reduzir luz do quarto") == ["acender ar", "reduzir luz do quarto"]
+        assert split_compound("acender luz da sala e ar do quarto") == ["acender luz da sala", "acender ar do quarto"]
+
+        assert parse("acender ar e reduzir luz do quarto")["intent"] == "error"
+        assert parse("desligar luz da sala e aumentar arcondicionados")["intent"] == "error"
+
+    def test_segment_that_is_not_a_command(self):
+        """Trecho que nao e comando sozinho desfaz a divisao"""
+        result = parse("temperatura entre 22 e 24 no quarto")
+        
+        assert result["intent"] == "set_temperature"
+    
+    def test_compound_is_never_complete(self):
+        """Composto pode ganhar mais trechos: nao despacha cedo"""
+        assert not is_complete(parse("ligar luz da sala e ligar ar do quarto"))
+    
+    def test_cache_returns_independent_commands(self):
+        """Alterar um sub-intent devolvido nao altera o cache"""
+        text = "apagar o led da cozinha e desligar o ar do closet"
+        parse(text)["commands"][0]["search"] = "x"
+        
+        assert parse(text)["commands"][0]["search"] == "led cozinha"
+
+
+class TestParseCache:
+    """Testes para o cache LRU de parse"""
+
+    def setup_method(self):
+        parse_cache.clear()
+
+    def test_repeated_text_hits_cache(self):
+        """Texto repetido deve vir do cache"""
+        hits, misses = parse_cache.hits, parse_cache.misses
+
+        first = parse("ligar luz da sala")
+        second = parse("ligar luz da sala")
+
+        assert first == second
+        assert parse_cache.misses == misses + 1
+        assert parse_cache.hits == hits + 1
+
+    def test_returns_copies(self):
+        """Alterar o intent devolvido nao deve afetar o cache"""
+        result = parse("ligar todas as luzes")
+        result["intent"] = "corrompido"
+        result["entities"].append("light.outra")
+
+        cached = parse("ligar todas as luzes")
+        cached["entities"].clear()
+
+        again = parse("ligar todas as luzes")
+        assert again["intent"] == "all_on"
+        assert again["entities"] == ["light.all_light_entities"]
+
+    def test_evicts_least_recently_used(self):
+        """Deve descartar a entrada usada ha mais tempo"""
+        cache = ParseCache(maxsize=2)
+        cache.put("a", {"intent": "a"})
+        cache.put("b", {"intent": "b"})
+        cache.get("a")
+        cache.put("c", {"intent": "c"})
+
+        assert cache.get("b") is None
+        assert cache.get("a") == {"intent": "a"}
+        assert len(cache) == 2
+
+    def test_maxsize_zero_disables(self):
+        """maxsize 0 nao deve guardar nada"""
+        cache = ParseCache(maxsize=0)
+        cache.put("a", {"intent": "a"})
+
+        assert cache.get("a") is None
+
+    def test_reload_vocabulary_invalidates(self):
+        """Novo sinonimo deve valer mesmo para texto ja memorizado"""
+        assert parse("ativar luz da sala")["intent"] == "error"
+
+        intent_parser.ACTIONS_ON.append("ativar")
+        try:
+            intent_parser.reload_vocabulary()
+            assert len(parse_cache) == 0
+            assert parse("ativar luz da sala")["intent"] == "on"
+        finally:
+            intent_parser.ACTIONS_ON.remove("ativar")
+            intent_parser.reload_vocabulary()
+
+
+class TestParseMany:
+    """Testes para parse em lote"""
+
+    def setup_method(self):
+        parse_cache.clear()
+
+    def test_same_results_as_parse(self):
+        """Deve devolver o mesmo que parse, na mesma ordem"""
+        texts = [
+            "ligar luz da sala",
+            "desligar o ar do quarto",
+            "ligar ventilador",
+            "Ligar a LUZ da Sala",
+            "",
+            "ligar luz da sala",
+        ]
+        expected = []
+        for text in texts:
+            parse_cache.clear()
+            expected.append(parse(text))
+        parse_cache.clear()
+
+        assert parse_many(texts) == expected
+
+    def test_repeated_texts_get_independent_copies(self):
+        """Textos repetidos nao devem compartilhar o mesmo dict"""
+        first, second = parse_many(["ligar todas as luzes", "ligar todas as luzes"])
+        first["entities"].append("light.outra")
+
+        assert second["entities"] == ["light.all_light_entities"]
+
+    def test_fills_cache(self):
+        """Resultados do lote devem ficar no cache de parse"""
+        parse_many(["apagar led da mesa"])
+        hits = parse_cache.hits
+
+        parse("apagar led da mesa")
+
+        assert parse_cache.hits == hits + 1
+
+
+class TestRuleEngine:
+    """Testes para o motor de regras declarativas"""
+
+    def test_only_relevant_rules_evaluated(self):
+        """Comando de luz nao deve avaliar regras de climate"""
+        result = explain("ligar luz da sala")
+
+        assert result["intent"]["intent"] == "on"
+        assert result["evaluated"] == ["multi", "single_light"]
+        assert not {"fan", "climate_power"} & set(result["candidates"])
+
+    def test_first_matching_rule_wins(self):
+        """Ventilador deve parar na regra fan"""
+        result = explain("ligar ventilador do quarto")
+
+        assert result["intent"]["intent"] == "fan_on"
+        assert result["evaluated"] == ["fan"]
+
+    def test_rule_can_pass(self):
+        """Regra que devolve None passa a vez para a proxima"""
+        result = explain("ligar tela do ar")
+
+        assert result["intent"]["intent"] == "on"
+        assert result["evaluated"] == ["display_off", "climate_power"]
+
+    def test_custom_rules_and_counters(self):
+        """Regras declaradas como dados, com contagem de avaliacoes"""
+        engine = RuleEngine([
+            {"name": "led", "when": {"normalized": ["led"]},
+             "build": lambda rule, u: {"intent": "led"}},
+            {"name": "default", "build": lambda rule, u: {"intent": "default"}},
+        ])
+
+        assert engine.evaluate(Utterance("ligar led"))[0] == {"intent": "led"}
+        assert engine.evaluate(Utterance("abrir porta")) == ({"intent": "default"}, ["default"])
+        assert engine.evaluations == {"led": 1, "default": 1}
+
+
+class TestIncrementalParser:
+    """Testes para o parser de transcricoes parciais"""
+
+    def test_same_intent_as_parse(self):
+        """Cada parcial deve dar o mesmo intent que parse do mesmo texto"""
+        parser = IncrementalParser()
+        full = "desligar o ar-condicionado do quarto"
+
+        for end in range(1, len(full) + 1):
+            partial = full[:end]
+            assert parser.update(partial)["intent"] == parse(partial)
+
+    def test_complete_after_word_finished(self):
+        """So completa quando a ultima palavra terminou"""
+        parser = IncrementalParser()
+
+        assert not parser.update("ligar luz")["complete"]
+        assert not parser.update("ligar luz da sa")["complete"]
+        assert not parser.update("ligar luz da sala")["complete"]
+        # Mesma palavra repetida no parcial seguinte = terminada
+        assert parser.update("ligar luz da sala")["complete"]
+
+    def test_trailing_space_finishes_word(self):
+        """Espaco depois da palavra tambem conta como terminada"""
+        parser = IncrementalParser()
+
+        assert parser.update("ligar ventilador do quarto ")["complete"]
+
+    def test_revised_transcript_restarts(self):
+        """Parcial revisado deve refazer o estado"""
+        parser = IncrementalParser()
+        parser.update("ligar luz da ")
+        result = parser.update("desligar luz da sala", final=True)
+
+        assert parser.restarts == 1
+        assert result["intent"]["intent"] == "off"
+        assert result["complete"]
+
+    def test_is_complete(self):
+        """Intents sem alvo, multi e erro nao sao completos"""
+        assert not is_complete(parse("ligar luz"))
+        assert not is_complete(parse("ligar ar"))
+        assert not is_complete(parse("ligar luz da sala e da cozinha"))
+        assert not is_complete(parse("temperatura"))
+        assert is_complete(parse("ligar ar do quarto"))
+        assert is_complete(parse("ligar todas as luzes"))
+
+    def test_value_before_room_waits(self):
+        """Temperatura/velocidade com o valor antes do comodo espera o comodo"""
+        parser = IncrementalParser()
+
+        assert not parser.update("colocar temperatura 22 graus ")["complete"]
+        result = parser.update("colocar temperatura 22 graus quarto", final=True)
+        assert result["complete"]
+        assert (result["intent"]["value"], result["intent"]["room"]) == (22, "quarto")
+
+        parser = IncrementalParser()
+        assert not parser.update("velocidade 1 ")["complete"]
+        assert parser.update("velocidade 1 quarto ")["complete"]
+
+    def test_remaining_commands(self):
+        """O que falta da frase final depois do despacho antecipado"""
+        dispatched = parse("ligar luz da sala")
+
+        assert remaining_commands(parse("ligar luz da sala"), dispatched) == []
+        rest = remaining_commands(parse("ligar luz da sala e da cozinha e ligar ar do quarto"), dispatched)
+        assert [(c["domain"], c["search"]) for c in rest] == [("light", "luz cozinha"), ("climate", "quarto")]
+        assert remaining_commands(parse("ligar luz da cozinha"), dispatched) is None
@@ -32,7 +32,7 @@ class TestNormalizeName:
 class TestFindLightEntities:
     """Testes para find_light_entities"""
     
-    @patch('core.domains.light.get_all_lights')
+    @patch('core.domains.light.async_get_all_lights')
     def test_find_light_entities_single_match(self, mock_get_lights):
         """Deve encontrar entidade que corresponde"""
         mock_get_lights.return_value = [
@@ -51,7 +51,7 @@ class TestFindLightEntities:
         assert "light.sala" in result
         assert len(result) == 1
     
-    @patch('core.domains.light.get_all_lights')
+    @patch('core.domains.light.async_get_all_lights')
     def test_find_light_entities_multiple_matches(self, mock_get_lights):
         """Deve encontrar multiplas entidades"""
         mock_get_lights.return_value = [
@@ -69,10 +69,11 @@ class TestFindLightEntities:
         
         assert len(result) == 2
     
-    @patch('core.domains.light.get_all_lights')
-    def test_find_light_entities_no_match(self, mock_get_lights):
+    @patch('core.domains.light.async_get_all_states')
+    @patch('core.domains.light.async_get_all_lights')
+    def test_find_light_entities_no_match(self, mock_get_lights, mock_states):
         """Deve retornar lista vazia se nao encontrar"""
-        mock_get_lights.return_value = [
+        mock_get_lights.return_value = mock_states.return_value = [
             {
                 "entity_id": "light.sala",
                 "attributes": {"friendly_name": "Luz da Sala"}
@@ -82,12 +83,120 @@ class TestFindLightEntities:
         result = find_light_entities("cozinha")
         
         assert result == []
+    
+    @patch('core.domains.light.async_get_all_states')
+    @patch('core.domains.light.async_get_all_lights')
+    def test_find_light_entities_fuzzy_fallback(self, mock_get_lights, mock_states):
+        """Erros do STT devem cair na busca aproximada"""
+        lights = [
+            {"entity_id": "light.sala", "attributes": {"friendly_name": "Luz da Sala"}},
+            {"entity_id": "light.cozinha", "attributes": {"friendly_name": "Luz da Cozinha"}},
+        ]
+        mock_get_lights.return_value = lights
+        mock_states.return_value = lights + [
+            {"entity_id": "switch.cozinha", "attributes": {"friendly_name": "Luz Cozinha"}},
+        ]
+        
+        assert find_light_entities("luz cosinha") == ["light.cozinha"]
+        assert find_light_entities("luz sálla") == ["light.sala"]
+    
+    @patch('core.domains.light.async_get_all_states')
+    @patch('core.domains.light.async_get_all_lights')
+    def test_find_light_entities_exact_skips_fuzzy(self, mock_get_lights, mock_states):
+        """Busca aproximada so deve rodar quando a exata falha"""
+        mock_get_lights.return_value = [
+            {"entity_id": "light.sala", "attributes": {"friendly_name": "Luz da Sala"}},
+        ]
+        
+        assert find_light_entities("luz sala") == ["light.sala"]
+        mock_states.assert_not_called()
+
+
+class TestLightNameIndex:
+    """Testes para LightNameIndex (indice invertido de nomes)"""
+    
+    LIGHTS = [
+        {"entity_id": "light.sala", "attributes": {"friendly_name": "Luz da Sala"}},
+        {"entity_id": "light.sala_estar", "attributes": {"friendly_name": "Luz Sala de Estar"}},
+        {"entity_id": "light.quarto", "attributes": {"friendly_name": "Luz do Quarto"}},
+        {"entity_id": "light.led_quarto", "attributes": {"friendly_name": "LED Quarto"}},
+    ]
+    
+    def test_search_keeps_substring_semantics(self):
+        """Deve manter a semantica de substring do nome normalizado"""
+        from core.domains.light import LightNameIndex
+        
+        index = LightNameIndex()
+        index.refresh(self.LIGHTS)
+        
+        assert index.search("luz sala") == ["light.sala", "light.sala_estar"]
+        assert index.search("sal") == ["light.sala", "light.sala_estar"]
+        assert index.search("z sa") == ["light.sala", "light.sala_estar"]
+        assert index.search("quarto") == ["light.quarto", "light.led_quarto"]
+        assert index.search("sala quarto") == []
+        assert index.search("") == [e["entity_id"] for e in self.LIGHTS]
+    
+    def test_rebuild_only_when_names_change(self):
+        """Indice so deve ser reconstruido quando nomes ou entidades mudam"""
+        from core.domains.light import LightNameIndex
+        
+        index = LightNameIndex()
+        index.refresh(self.LIGHTS)
+        index.refresh([dict(e) for e in self.LIGHTS])
+        assert index.rebuilds == 1
+        
+        renamed = self.LIGHTS[:-1] + [
+            {"entity_id": "light.led_quarto", "attributes": {"friendly_name": "LED Cama"}}
+        ]
+        index.refresh(renamed)
+        
+        assert index.rebuilds == 2
+        assert index.search("cama") == ["light.led_quarto"]
+    
+    def test_rebuild_follows_mirror_generation(self):
+        """Com espelho ativo, so reconstroi quando a geracao de nomes muda"""
+        from core.domains.light import LightNameIndex
+        from core.state_mirror import mirror
+        
+        states = [dict(e, state="off") for e in self.LIGHTS]
+        mirror.load(states)
+        try:
+            index = LightNameIndex()
+            index.refresh(mirror.all())
+            
+            # Mudanca de estado nao altera nomes
+            mirror.apply_event({"entity_id": "light.sala", "new_state": dict(states[0], state="on")})
+            index.refresh(mirror.all())
+            assert index.rebuilds == 1
+            
+            mirror.apply_event({
+                "entity_id": "light.nova",
+                "new_state": {"entity_id": "light.nova", "state": "off", "attributes": {"friendly_name": "Luz Varanda"}},
+            })
+            index.refresh(mirror.all())
+            assert index.rebuilds == 2
+            assert index.search("varanda") == ["light.nova"]
+        finally:
+            mirror.clear()
+    
+    def test_token_cache_is_bounded(self):
+        """Cache de tokens da busca nao deve crescer sem limite"""
+        from core.domains.light import LightNameIndex
+        
+        index = LightNameIndex(token_cache_size=3)
+        index.refresh(self.LIGHTS)
+        for token in ["sala", "quarto", "led", "xyz", "abc"]:
+            index.search(token)
+        
+        assert len(index._token_cache) == 3
+        assert "sala" not in index._token_cache
+        assert index.search("sala") == ["light.sala", "light.sala_estar"]
 
 
 class TestHandle:
     """Testes para funcao handle principal"""
     
-    @patch('core.domains.light.handle_single')
+    @patch('core.domains.light.async_handle_single')
     def test_handle_routes_to_single(self, mock_single):
         """Deve rotear para handle_single quando tem search"""
         mock_single.return_value = {"message": "OK"}
@@ -97,7 +206,7 @@ class TestHandle:
         
         mock_single.assert_called_once_with(intent)
     
-    @patch('core.domains.light.handle_all')
+    @patch('core.domains.light.async_handle_all')
     def test_handle_routes_to_all_on(self, mock_all):
         """Deve rotear para handle_all quando all_on"""
         mock_all.return_value = {"message": "OK"}
@@ -107,7 +216,7 @@ class TestHandle:
         
         mock_all.assert_called_once_with(intent)
     
-    @patch('core.domains.light.handle_all')
+    @patch('core.domains.light.async_handle_all')
     def test_handle_routes_to_all_off(self, mock_all):
         """Deve rotear para handle_all quando all_off"""
         mock_all.return_value = {"message": "OK"}
@@ -117,7 +226,7 @@ class TestHandle:
         
         mock_all.assert_called_once_with(intent)
     
-    @patch('core.domains.light.handle_multi')
+    @patch('core.domains.light.async_handle_multi')
     def test_handle_routes_to_multi(self, mock_multi):
         """Deve rotear para handle_multi"""
         mock_multi.return_value = {"message": "OK"}
@@ -143,8 +252,8 @@ class TestHandleSingle:
         """Limpa contexto antes de cada teste"""
         context.clear()
     
-    @patch('core.domains.light.call_service')
-    @patch('core.domains.light.find_light_entities')
+    @patch('core.domains.light.async_call_service')
+    @patch('core.domains.light.async_find_light_entities')
     def test_handle_single_light_on(self, mock_find, mock_call):
         """Deve ligar luz encontrada"""
         mock_find.return_value = ["light.sala"]
@@ -156,8 +265,8 @@ class TestHandleSingle:
         mock_call.assert_called_once_with("light", "turn_on", {"entity_id": ["light.sala"]})
         assert "ligada" in result["message"].lower()
     
-    @patch('core.domains.light.call_service')
-    @patch('core.domains.light.find_light_entities')
+    @patch('core.domains.light.async_call_service')
+    @patch('core.domains.light.async_find_light_entities')
     def test_handle_single_light_off(self, mock_find, mock_call):
         """Deve desligar luz encontrada"""
         mock_find.return_value = ["light.quarto"]
@@ -169,7 +278,7 @@ class TestHandleSingle:
         mock_call.assert_called_once_with("light", "turn_off", {"entity_id": ["light.quarto"]})
         assert "desligada" in result["message"].lower()
     
-    @patch('core.domains.light.find_light_entities')
+    @patch('core.domains.light.async_find_light_entities')
     def test_handle_single_light_not_found(self, mock_find):
         """Deve retornar erro se luz nao encontrada"""
         mock_find.return_value = []
@@ -180,7 +289,7 @@ class TestHandleSingle:
         assert "message" in result
         assert "encontrei" in result["message"].lower()
     
-    @patch('core.domains.light.get_lights_on')
+    @patch('core.domains.light.async_get_lights_on')
     def test_handle_single_generic_off_no_lights(self, mock_lights_on):
         """'desligar luz' sem nenhuma luz ligada"""
         mock_lights_on.return_value = []
@@ -190,8 +299,8 @@ class TestHandleSingle:
         
         assert "nenhuma" in result["message"].lower()
     
-    @patch('core.domains.light.call_service')
-    @patch('core.domains.light.get_lights_on')
+    @patch('core.domains.light.async_call_service')
+    @patch('core.domains.light.async_get_lights_on')
     def test_handle_single_generic_off_one_light(self, mock_lights_on, mock_call):
         """'desligar luz' com uma luz ligada deve desligar"""
         mock_lights_on.return_value = [
@@ -205,7 +314,7 @@ class TestHandleSingle:
         mock_call.assert_called_once()
         assert "desligada" in result["message"].lower()
     
-    @patch('core.domains.light.get_lights_on')
+    @patch('core.domains.light.async_get_lights_on')
     def test_handle_single_generic_off_multiple_lights_creates_context(self, mock_lights_on):
         """'desligar luz' com multiplas luzes deve criar contexto"""
         mock_lights_on.return_value = [
@@ -220,8 +329,8 @@ class TestHandleSingle:
         assert "mais de uma" in result["message"].lower()
         assert "qual" in result["message"].lower()
     
-    @patch('core.domains.light.call_service')
-    @patch('core.domains.light.get_lights_on')
+    @patch('core.domains.light.async_call_service')
+    @patch('core.domains.light.async_get_lights_on')
     def test_handle_single_generic_off_ignores_groups_and_helpers(self, mock_lights_on, mock_call):
         """Grupos e helpers com entity_id nos atributos devem ser ignorados ao desligar luz"""
         # Simula um grupo/helper (com entity_id nos atributos) e uma luz real
@@ -240,6 +349,30 @@ class TestHandleSingle:
         assert "desligada" in result["message"].lower()
 
 
+class TestParseSegment:
+    """Testes para parse_segment (trechos de comando composto)"""
+    
+    def test_parse_segment_on(self):
+        """Deve extrair acao e busca de um trecho de ligar"""
+        from core.domains.light import parse_segment
+        
+        assert parse_segment("ligar luz sala") == {"action": "on", "search": "luz sala"}
+    
+    def test_parse_segment_desligar(self):
+        """'desligar' nao deve ser confundido com 'ligar'"""
+        from core.domains.light import parse_segment
+        
+        assert parse_segment("desligar luz quarto") == {"action": "off", "search": "luz quarto"}
+        assert parse_segment("apagar led mesa") == {"action": "off", "search": "led mesa"}
+    
+    def test_parse_segment_inherits_previous(self):
+        """Trecho sem acao/tipo usa os do trecho anterior"""
+        from core.domains.light import parse_segment
+        
+        assert parse_segment("da cozinha", "on", "luz") == {"action": "on", "search": "luz da cozinha"}
+        assert parse_segment("led da cozinha", "on", "luz") == {"action": "on", "search": "led da cozinha"}
+
+
 class TestHandleMulti:
     """Testes para handle_multi (múltiplos comandos combinados)"""
     
@@ -247,12 +380,14 @@ class TestHandleMulti:
         """Limpa contexto antes de cada teste"""
         context.clear()
     
-    @patch('core.domains.light.call_service')
-    @patch('core.domains.light.find_light_entities')
-    def test_handle_multi_two_on_commands(self, mock_find, mock_call):
+    @patch('core.domains.light.async_call_service')
+    @patch('core.domains.light.async_find_light_entities')
+    @patch('core.domains.light.async_get_all_lights')
+    def test_handle_multi_two_on_commands(self, mock_lights, mock_find, mock_call):
         """Deve processar múltiplos comandos de ligar"""
         from core.domains.light import handle_multi
         
+        mock_lights.return_value = []
         mock_find.side_effect = [["light.sala"], ["light.quarto"]]
         mock_call.return_value = True
         
@@ -261,25 +396,153 @@ class TestHandleMulti:
         
         # Deve fazer 2 chamadas ao find_light_entities
         assert mock_find.call_count == 2
-        # Deve fazer 2 chamadas ao call_service
-        assert mock_call.call_count == 2
+        # Mesma acao: uma unica chamada ao call_service com as duas luzes
+        mock_call.assert_called_once_with("light", "turn_on", {"entity_id": ["light.sala", "light.quarto"]})
         # Resultado deve conter ambas as mensagens ligadas
         assert result["message"].count("ligada") == 2
     
-    @patch('core.domains.light.call_service')
-    @patch('core.domains.light.find_light_entities')
-    def test_handle_multi_three_commands(self, mock_find, mock_call):
+    @patch('core.domains.light.async_call_service')
+    @patch('core.domains.light.async_find_light_entities')
+    @patch('core.domains.light.async_get_all_lights')
+    def test_handle_multi_segment_without_action(self, mock_lights, mock_find, mock_call):
+        """'ligar luz da sala e da cozinha' liga as duas (acao e tipo herdados)"""
+        from core.domains.light import handle_multi
+        
+        mock_lights.return_value = []
+        mock_find.side_effect = [["light.sala"], ["light.cozinha"]]
+        mock_call.return_value = True
+        
+        handle_multi({"text": "ligar luz da sala e da cozinha"})
+        
+        assert mock_find.call_args_list[1][0][0] == "luz da cozinha"
+        mock_call.assert_called_once_with("light", "turn_on", {"entity_id": ["light.sala", "light.cozinha"]})
+    
+    @patch('core.domains.light.async_call_service')
+    @patch('core.domains.light.async_find_light_entities')
+    @patch('core.domains.light.async_get_all_lights')
+    def test_handle_multi_three_commands(self, mock_lights, mock_find, mock_call):
         """Deve processar 3 comandos combinados"""
         from core.domains.light import handle_multi
         
+        mock_lights.return_value = []
         mock_find.side_effect = [["light.sala"], ["light.quarto"], ["light.cozinha"]]
         mock_call.return_value = True
         
         intent = {"text": "ligar sala e desligar quarto e ligar cozinha"}
         result = handle_multi(intent)
         
-        assert mock_call.call_count == 3
+        # Uma chamada por acao distinta (turn_on e turn_off)
+        assert mock_call.call_count == 2
         assert "|" in result["message"]  # mensagens separadas por pipe
+    
+    @patch('core.domains.light.async_call_service')
+    @patch('core.domains.light.async_find_light_entities')
+    @patch('core.domains.light.async_get_all_lights')
+    def test_handle_multi_reads_states_once(self, mock_lights, mock_find, mock_call):
+        """Estados devem ser lidos uma unica vez para todos os trechos"""
+        from core.domains.light import handle_multi
+        
+        lights = [{"entity_id": "light.sala", "attributes": {"friendly_name": "Luz Sala"}}]
+        mock_lights.return_value = lights
+        mock_find.side_effect = [["light.sala"], ["light.quarto"]]
+        
+        handle_multi({"text": "ligar luz sala e desligar luz quarto"})
+        
+        mock_lights.assert_awaited_once()
+        assert all(c.args[1] is lights for c in mock_find.call_args_list)
+    
+    @patch('core.domains.light.async_call_service')
+    @patch('core.domains.light.async_find_light_entities')
+    @patch('core.domains.light.async_get_all_lights')
+    def test_handle_multi_runs_calls_concurrently(self, mock_lights, mock_find, mock_call):
+        """Servicos devem ser enviados em paralelo, sem sleep fixo"""
+        import asyncio
+        import time
+        
+        from core.domains.light import handle_multi
+        
+        async def slow_call(domain, service, data):
+            await asyncio.sleep(0.2)
+            return True
+        
+        mock_lights.return_value = []
+        mock_find.side_effect = [["light.sala"], ["light.quarto"], ["light.cozinha"]]
+        mock_call.side_effect = slow_call
+        
+        start = time.perf_counter()
+        handle_multi({"text": "ligar luz sala e desligar luz quarto e ligar led cozinha"})
+        elapsed = time.perf_counter() - start
+        
+        assert mock_call.call_count == 2
+        assert elapsed < 0.35
+    
+    @patch('core.domains.light.async_call_service')
+    @patch('core.domains.light.async_find_light_entities')
+    @patch('core.domains.light.async_get_all_lights')
+    def test_handle_multi_keeps_order_and_reports_latency(self, mock_lights, mock_find, mock_call):
+        """Respostas devem manter a ordem original, com latencia por trecho"""
+        import asyncio
+        
+        from core.domains.light import handle_multi
+        
+        async def call(domain, service, data):
+            # Primeiro trecho termina por ultimo
+            await asyncio.sleep(0.1 if data["entity_id"] == ["light.sala"] else 0)
+            return True
+        
+        mock_lights.return_value = []
+        mock_find.side_effect = [["light.sala"], ["light.quarto"]]
+        mock_call.side_effect = call
+        
+        result = handle_multi({"text": "ligar luz sala e desligar luz quarto"})
+        
+        assert result["message"] == "luz sala ligada. | luz quarto desligada."
+        assert [s["search"] for s in result["segments"]] == ["luz sala", "luz quarto"]
+        assert result["segments"][0]["latency_ms"] >= result["segments"][1]["latency_ms"]
+    
+    @patch('core.domains.light.async_call_service')
+    @patch('core.domains.light.async_find_light_entities')
+    @patch('core.domains.light.async_get_all_lights')
+    def test_handle_multi_partial_failure(self, mock_lights, mock_find, mock_call):
+        """Falha em um trecho nao deve derrubar os demais"""
+        import aiohttp
+        
+        from core.domains.light import handle_multi
+        
+        async def call(domain, service, data):
+            if service == "turn_off":
+                raise aiohttp.ClientError("falhou")
+            return True
+        
+        mock_lights.return_value = []
+        mock_find.side_effect = [["light.sala"], ["light.quarto"], []]
+        mock_call.side_effect = call
+        
+        result = handle_multi({"text": "ligar luz sala e desligar luz quarto e ligar luz varanda"})
+        messages = [s["message"] for s in result["segments"]]
+        
+        assert "ligada" in messages[0]
+        assert "falha" in messages[1].lower()
+        assert "encontrei" in messages[2].lower()
+
+
+    @patch('core.domains.light.async_call_service')
+    @patch('core.domains.light.async_find_light_entities')
+    @patch('core.domains.light.async_get_all_lights')
+    def test_handle_multi_batches_same_action(self, mock_lights, mock_find, mock_call):
+        """N trechos com a mesma acao devem virar uma unica chamada"""
+        from core.domains.light import handle_multi
+        
+        mock_lights.return_value = []
+        mock_find.side_effect = [["light.sala"], ["light.quarto"], ["light.sala", "light.cozinha"]]
+        
+        result = handle_multi({"text": "ligar luz sala e ligar luz quarto e ligar luz cozinha"})
+        
+        mock_call.assert_called_once_with(
+            "light", "turn_on", {"entity_id": ["light.sala", "light.quarto", "light.cozinha"]}
+        )
+        assert len(result["segments"]) == 3
+        assert all("ligada" in s["message"] for s in result["segments"])
 
 
 class TestHandleAll:
@@ -289,7 +552,7 @@ class TestHandleAll:
         """Limpa contexto antes de cada teste"""
         context.clear()
     
-    @patch('core.domains.light.call_service')
+    @patch('core.domains.light.async_call_service')
     def test_handle_all_on(self, mock_call):
         """Deve ligar todas as luzes"""
         from core.domains.light import handle_all
@@ -302,7 +565,7 @@ class TestHandleAll:
         mock_call.assert_called_once_with("light", "turn_on", {"entity_id": "light.all_light_entities"})
         assert "todas" in result["message"].lower()
     
-    @patch('core.domains.light.call_service')
+    @patch('core.domains.light.async_call_service')
     def test_handle_all_off(self, mock_call):
         """Deve desligar todas as luzes"""
         from core.domains.light import handle_all
@@ -323,7 +586,7 @@ class TestHandleConfirmation:
         """Limpa contexto antes de cada teste"""
         context.clear()
     
-    @patch('core.domains.light.call_service')
+    @patch('core.domains.light.async_call_service')
     def test_handle_confirmation_select_one(self, mock_call):
         """Deve desligar apenas a luz selecionada"""
         from core.domains.light import handle_confirmation
@@ -347,7 +610,7 @@ class TestHandleConfirmation:
         assert "desligada" in result["message"].lower()
         assert not context.valid()
     
-    @patch('core.domains.light.call_service')
+    @patch('core.domains.light.async_call_service')
     def test_handle_confirmation_all_lights(self, mock_call):
         """Deve desligar todas as luzes quando user responde 'todas'"""
         from core.domains.light import handle_confirmation
@@ -388,12 +651,22 @@ class TestHandleConfirmation:
         assert "encontrei" in result["message"].lower()
         assert not context.valid()
 
+    @patch('core.domains.light.async_call_service')
+    def test_handle_confirmation_already_taken(self, mock_call):
+        """Confirmacao ja consumida (outro worker/requisicao) nao deve agir"""
+        from core.domains.light import handle_confirmation
+
+        result = handle_confirmation({"text": "sala"})
+
+        assert "inválida" in result["message"].lower()
+        mock_call.assert_not_called()
+
 
 class TestHandleSingleMultipleEntities:
     """Testes para handle_single com multiplas entidades"""
     
-    @patch('core.domains.light.call_service')
-    @patch('core.domains.light.find_light_entities')
+    @patch('core.domains.light.async_call_service')
+    @patch('core.domains.light.async_find_light_entities')
     def test_handle_single_multiple_entities(self, mock_find, mock_call):
         """Deve ligar/desligar multiplas entidades de uma vez"""
         mock_find.return_value = ["light.led1", "light.led2"]
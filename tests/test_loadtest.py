@@ -0,0 +1,114 @@
+"""
+Testes para tools.loadtest
+
+Testa agenda de chegadas, resumo, historico e uma rodada curta de ponta a
+ponta contra o servidor no processo + HA falso
+"""
+import json
+from unittest.mock import patch
+
+from core import ha_client
+from tools.fake_ha import FakeHA
+from tools.loadtest import (arrival_schedule, compare, load_baseline, load_mix, main,
+                            percentile, run_loadtest, save_result, summarize)
+
+
+class TestSchedule:
+    """Testes da agenda de chegadas em malha aberta"""
+
+    def test_uniform_rate(self):
+        """Intervalos fixos devem gerar rate * duration envios"""
+        times = arrival_schedule(10, 2, poisson=False)
+        assert len(times) == 19
+        assert times[0] == 0.1
+
+    def test_poisson_deterministic(self):
+        """Mesma seed, mesma agenda; media perto da taxa pedida"""
+        a = arrival_schedule(100, 10, seed=3)
+        assert a == arrival_schedule(100, 10, seed=3)
+        assert 900 < len(a) < 1100
+        assert all(x < y for x, y in zip(a, a[1:]))
+
+
+class TestSummary:
+    """Testes do resumo e da comparacao"""
+
+    def test_percentile(self):
+        """Percentil por posicao mais proxima"""
+        values = [i / 100 for i in range(1, 101)]
+        assert percentile(values, 50) == 0.5
+        assert percentile(values, 99) == 0.99
+        assert percentile([], 50) is None
+
+    def test_summarize_counts_errors(self):
+        """Erros HTTP, timeouts e descartes entram na taxa de erros"""
+        raw = {
+            "samples": [(0.01, 200), (0.02, 200), (0.5, 500), (10.0, "timeout")],
+            "sent": 4, "dropped": 1, "elapsed": 2.0, "duration": 2.0, "client_lag_max": 0.001,
+        }
+        result = summarize(raw)
+
+        assert result["ok"] == 2
+        assert result["errors"] == {"http_500": 1, "timeout": 1}
+        assert result["error_rate"] == 3 / 5
+        assert result["offered_rate"] == 2.5
+        assert result["throughput"] == 1.0
+        assert result["latency_ms"]["max"] == 10000.0
+
+    def test_save_and_compare(self, tmp_path):
+        """Historico guarda o ultimo resultado para comparar"""
+        history = tmp_path / "loadtest.jsonl"
+        before = {"throughput": 100.0, "error_rate": 0.0, "latency_ms": {"p50": 10.0, "p99": 40.0}}
+        after = {"throughput": 120.0, "error_rate": 0.0, "latency_ms": {"p50": 8.0, "p99": 20.0}}
+        save_result(str(history), {"throughput": 1.0})
+        save_result(str(history), before)
+
+        baseline = load_baseline(str(history))
+        assert baseline["throughput"] == 100.0
+        assert "timestamp" in baseline
+
+        lines = compare(after, baseline)
+        assert any("vazao" in line and "+20.0%" in line for line in lines)
+        assert any("p99" in line and "-50.0%" in line for line in lines)
+
+    def test_load_mix(self, tmp_path):
+        """Aceita JSONL com peso e texto puro"""
+        jsonl = tmp_path / "mix.jsonl"
+        jsonl.write_text('{"text": "ligar luz da sala", "weight": 3}\n{"text": "apagar led"}\n', encoding="utf-8")
+        txt = tmp_path / "frases.txt"
+        txt.write_text("ligar luz da sala\n\napagar led\n", encoding="utf-8")
+
+        assert load_mix(str(jsonl)) == [("ligar luz da sala", 3.0), ("apagar led", 1.0)]
+        assert load_mix(str(txt)) == [("ligar luz da sala", 1.0), ("apagar led", 1.0)]
+
+
+class TestEndToEnd:
+    """Rodada curta no processo contra o HA falso"""
+
+    def test_in_process_run(self):
+        """Deve completar os comandos e medir saturacao do worker"""
+        fake = FakeHA(entities=50, latency=0.005)
+        with patch.object(ha_client.async_client, "rate_limit", 0):
+            result = run_loadtest(40, 0.5, fake=fake, seed=1, poisson=False)
+
+        assert result["target"] == "in-process"
+        assert result["sent"] == 19
+        assert result["ok"] == 19
+        assert result["error_rate"] == 0.0
+        assert result["latency_ms"]["p99"] > 0
+        assert result["saturation"]["samples"] > 0
+        assert result["saturation"]["threadpool_size"] > 0
+        assert fake.requests > 0
+
+    def test_main_gates_and_save(self, tmp_path, capsys):
+        """--max-error-rate define o codigo de saida; --save grava o historico"""
+        history = tmp_path / "loadtest.jsonl"
+        with patch.object(ha_client.async_client, "rate_limit", 0):
+            code = main(["--rate", "20", "--duration", "0.3", "--warmup", "0", "--entities", "20",
+                         "--ha-error-rate", "1", "--max-error-rate", "0.5", "--save", str(history)])
+
+        assert code == 1
+        assert "Latencia (ms)" in capsys.readouterr().out
+        record = json.loads(history.read_text(encoding="utf-8").splitlines()[-1])
+        assert record["error_rate"] > 0.5
+        assert record["config"]["fake_ha"]["error_rate"] == 1
@@ -0,0 +1,220 @@
+"""
+Testes para tools.log_replay
+
+Testa leitura dos formatos de log (texto, JSON, rotacionados, .gz), a
+montagem dos traces por comando e os relatorios/corpus gerados
+"""
+import gzip
+import json
+import logging
+import os
+
+from tools.loadtest import load_mix
+from tools.log_replay import LineReader, Profile, log_files, main, replay
+from utils.logger import DATE_FORMAT, LOG_FORMAT
+
+
+def line(clock, logger, msg, level="INFO"):
+    """Linha no formato texto do friday.log (clock = "HH:MM:SS.mmm")"""
+    return f"2026-01-02 {clock} | {level:<8} | {logger:<20} | {msg}\n"
+
+
+LIGHT_COMMAND = [
+    line("14:30:15.100", "stt.server", "COMANDO: 'ligar luz da sala'"),
+    line("14:30:15.101", "stt.server", "Intent parseada: on | Domain: light"),
+    line("14:30:15.102", "core.dispatcher", "Despachando: light.on"),
+    line("14:30:15.103", "core.ha_client",
+         "Chamando servico: light.turn_on | Data: {'entity_id': 'light.sala'}", "DEBUG"),
+    line("14:30:15.183", "core.ha_client",
+         "API [POST] http://ha:8123/api/services/light/turn_on -> Status 200"),
+    line("14:30:15.184", "core.domains.light", "ACAO [light] turn_on -> sala"),
+    line("14:30:15.200", "stt.server", "Resposta: Luz da sala ligada"),
+]
+
+TIMEOUT_COMMAND = [
+    line("14:31:00.000", "stt.server", "COMANDO: 'desligar ar do quarto'"),
+    line("14:31:00.001", "stt.server", "Intent parseada: off | Domain: climate"),
+    line("14:31:00.002", "core.ha_client",
+         "Chamando servico: script.desligar_ar | Data: {}", "DEBUG"),
+    line("14:31:05.002", "core.ha_client",
+         "API [POST] http://ha:8123/api/services/script/desligar_ar ** ERRO: Timeout (5s)", "ERROR"),
+    "Traceback (most recent call last):\n",
+    line("14:31:05.010", "stt.server", "Resposta: Falha ao desligar o ar"),
+]
+
+
+def write_log(path, lines):
+    path.write_text("".join(lines), encoding="utf-8")
+    return str(path)
+
+
+def row(rows, name):
+    return next(r for r in rows if r["name"] == name)
+
+
+class TestReading:
+    """Testes da leitura dos arquivos"""
+
+    def test_parses_logger_format(self):
+        """Linha gerada pelo LOG_FORMAT do logger deve ter milissegundos"""
+        record = logging.LogRecord("core.ha_client", logging.INFO, __file__, 1,
+                                   "Resposta: %s", ("ok",), None)
+        record.created = 1767364215.25
+        record.msecs = 250.0
+        text = logging.Formatter(LOG_FORMAT, DATE_FORMAT).format(record)
+
+        reader = LineReader()
+        ts, level, logger, msg = reader.parse(text)
+
+        assert ts == 1767364215.25
+        assert (level, logger, msg) == ("INFO", "core.ha_client", "Resposta: ok")
+        assert not reader.second_resolution
+
+    def test_old_lines_without_millis(self):
+        """Linhas sem milissegundos sao aceitas e marcam resolucao de 1 s"""
+        reader = LineReader()
+        parsed = reader.parse("2026-01-02 14:30:15 | INFO     | stt.server          | COMANDO: 'oi'")
+
+        assert parsed[3] == "COMANDO: 'oi'"
+        assert reader.second_resolution
+        assert reader.parse("Traceback (most recent call last):") is None
+
+    def test_rotated_files_in_chronological_order(self, tmp_path):
+        """Rotacionados primeiro (mais antigo antes), arquivo atual por ultimo"""
+        for name in ("friday.log", "friday.log.1", "friday.log.2.gz",
+                     "friday.log.2026-01-02", "friday.log.2026-01-01"):
+            (tmp_path / name).write_text("", encoding="utf-8")
+        names = [os.path.basename(p) for p in log_files([str(tmp_path / "friday.log*")])]
+
+        assert names == ["friday.log.2026-01-01", "friday.log.2026-01-02",
+                         "friday.log.2.gz", "friday.log.1", "friday.log"]
+
+    def test_reads_json_and_gzip(self, tmp_path):
+        """Formato JSON (LOG_FILE_FORMAT=json) e arquivos .gz"""
+        rotated = tmp_path / "friday.jsonl.1.gz"
+        with gzip.open(rotated, "wt", encoding="utf-8") as f:
+            f.write(json.dumps({"ts": 100.0, "level": "INFO", "logger": "stt.server",
+                                "msg": "COMANDO: 'ligar led'"}) + "\n")
+            f.write(json.dumps({"ts": 100.0, "level": "INFO", "logger": "stt.server",
+                                "msg": "Intent parseada: on | Domain: light"}) + "\n")
+        current = tmp_path / "friday.jsonl"
+        current.write_text(json.dumps({"ts": 100.25, "level": "INFO", "logger": "stt.server",
+                                       "msg": "Resposta: LED ligado"}) + "\n", encoding="utf-8")
+
+        profile, reader = replay(log_files([str(tmp_path / "friday.jsonl*")]))
+        report = profile.report()
+
+        assert reader.records == 3
+        assert row(report["intents"], "light.on")["max_ms"] == 250.0
+
+
+class TestProfile:
+    """Testes da montagem dos traces e do relatorio"""
+
+    def test_intent_and_service_latency(self, tmp_path):
+        """Latencia do comando ate a Resposta e do servico desde Chamando servico"""
+        path = write_log(tmp_path / "friday.log", LIGHT_COMMAND + TIMEOUT_COMMAND)
+        report = replay([path])[0].report()
+
+        assert report["completed"] == 2
+        assert row(report["intents"], "light.on")["max_ms"] == 100.0
+        assert row(report["services"], "light.turn_on")["max_ms"] == 80.0
+
+        script = row(report["services"], "script.desligar_ar")
+        assert script["timeouts"] == 1
+        assert script["max_ms"] == 5000.0
+        assert report["timeouts"] == 1
+        # Entidades vem do entity_id da chamada (script do ar e a propria entidade)
+        entities = [r["name"] for r in report["slowest_entities"]]
+        assert entities == ["script.desligar_ar", "light.sala"]
+        assert row(report["slowest_entities"], "light.sala")["max_ms"] == 80.0
+
+    def test_quantiles_never_above_max(self, tmp_path):
+        """Percentis interpolados nao passam do maior valor observado"""
+        path = write_log(tmp_path / "friday.log", LIGHT_COMMAND)
+        light = row(replay([path])[0].report()["intents"], "light.on")
+
+        assert light["p50_ms"] <= light["max_ms"]
+        assert light["p99_ms"] <= light["max_ms"]
+
+    def test_overlapping_commands(self):
+        """Comandos sobrepostos: servico vai para o trace do mesmo dominio"""
+        profile = Profile()
+        profile.feed(0.0, "INFO", "stt.server", "COMANDO: 'ligar luz da sala'")
+        profile.feed(0.0, "INFO", "stt.server", "Intent parseada: on | Domain: light")
+        profile.feed(0.1, "INFO", "stt.server", "COMANDO: 'ligar ar'")
+        profile.feed(0.1, "INFO", "stt.server", "Intent parseada: on | Domain: climate")
+        profile.feed(0.1, "DEBUG", "core.ha_client", "Chamando servico: climate.turn_on | Data: {}")
+        profile.feed(0.3, "INFO", "core.ha_client",
+                     "API [POST] http://ha/api/services/climate/turn_on -> Status 200")
+        profile.feed(0.4, "INFO", "stt.server", "Resposta: luz ligada")
+        profile.feed(0.5, "INFO", "stt.server", "Resposta: ar ligado")
+        profile.finish()
+        report = profile.report()
+
+        assert report["overlapped"] == 2
+        assert row(report["services"], "climate.turn_on")["max_ms"] == 200.0
+        assert row(report["intents"], "light.on")["max_ms"] == 400.0
+
+    def test_stale_trace_is_incomplete(self):
+        """Comando sem Resposta (ex: HTTP 500) nao entra na latencia do intent"""
+        profile = Profile(stale_after=60)
+        profile.feed(0.0, "INFO", "stt.server", "COMANDO: 'ligar luz'")
+        profile.feed(0.0, "INFO", "stt.server", "Intent parseada: on | Domain: light")
+        profile.feed(120.0, "INFO", "stt.server", "COMANDO: 'apagar luz'")
+        profile.feed(120.0, "INFO", "stt.server", "Intent parseada: off | Domain: light")
+        profile.feed(120.5, "INFO", "stt.server", "Resposta: luz apagada")
+        profile.finish()
+        report = profile.report()
+
+        assert report["incomplete"] == 1
+        assert report["overlapped"] == 0
+        assert [r["name"] for r in report["intents"]] == ["light.off"]
+
+    def test_unparsed_intent(self):
+        """Frase nao entendida vai para "unknown\""""
+        profile = Profile()
+        profile.feed(0.0, "INFO", "stt.server", "COMANDO: 'abrir janela'")
+        profile.feed(0.0, "INFO", "stt.server", "Intent parseada: None | Domain: None")
+        profile.feed(0.01, "INFO", "stt.server", "Resposta: Nao entendi")
+
+        assert profile.report()["intents"][0]["name"] == "unknown"
+
+
+    def test_entities_from_service_data(self):
+        """Chamada com varias luzes conta para cada entity_id"""
+        profile = Profile()
+        profile.feed(0.0, "INFO", "stt.server", "COMANDO: 'ligar luz da sala e da cozinha'")
+        profile.feed(0.0, "DEBUG", "core.ha_client",
+                     "Chamando servico: light.turn_on | Data: {'entity_id': ['light.sala', 'light.cozinha']}")
+        profile.feed(0.05, "INFO", "core.ha_client",
+                     "API [POST] http://ha/api/services/light/turn_on -> Status 200")
+        profile.feed(0.06, "INFO", "core.domains.light", "ACAO [light] turn_on -> luz sala, luz cozinha")
+        profile.feed(0.07, "INFO", "stt.server", "Resposta: ok")
+        names = {r["name"] for r in profile.report()["slowest_entities"]}
+
+        assert names == {"light.sala", "light.cozinha"}
+
+
+class TestCli:
+    """Testes da linha de comando"""
+
+    def test_main_writes_report_and_corpus(self, tmp_path, capsys):
+        """--json grava o relatorio; --corpus serve de --mix para o loadtest"""
+        path = write_log(tmp_path / "friday.log", LIGHT_COMMAND + TIMEOUT_COMMAND + LIGHT_COMMAND)
+        report_path = tmp_path / "perfil.json"
+        corpus_path = tmp_path / "frases.jsonl"
+
+        assert main([path, "--json", str(report_path), "--corpus", str(corpus_path)]) == 0
+
+        out = capsys.readouterr().out
+        assert "Latencia por intent" in out
+        assert "script.desligar_ar" in out
+        saved = json.loads(report_path.read_text(encoding="utf-8"))
+        assert saved["completed"] == 3
+        assert load_mix(str(corpus_path)) == [("ligar luz da sala", 2.0), ("desligar ar do quarto", 1.0)]
+
+    def test_main_without_files(self, tmp_path, capsys):
+        """Sem arquivos de log, sai com 1"""
+        assert main([str(tmp_path / "nada.log*")]) == 1
+        assert "Nenhum arquivo" in capsys.readouterr().err
@@ -0,0 +1,199 @@
+"""
+Testes para utils.logger
+
+Testa o modo de log em fila (nao bloqueante)
+"""
+import json
+import logging
+import queue
+import threading
+from logging.handlers import QueueListener
+
+from utils import logger as log_module
+from utils.logger import (SEPARATOR, DroppingQueueHandler, JsonFormatter,
+                          log_action, log_event, log_stats, setup_logger)
+
+
+def _record(msg, *args):
+    return logging.LogRecord("teste", logging.INFO, __file__, 1, msg, args, None)
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class TestDroppingQueueHandler:
+    """Testes para o handler de fila limitada"""
+    
+    def test_full_queue_drops_and_counts(self):
+        """Fila cheia descarta o registro sem bloquear"""
+        handler = DroppingQueueHandler(queue.Queue(maxsize=2))
+        
+        for i in range(5):
+            handler.handle(_record(f"msg {i}"))
+        
+        assert handler.queue.qsize() == 2
+        assert handler.dropped == 3
+    
+    def test_notice_after_drops(self):
+        """Com espaco de novo, avisa quantos registros foram perdidos"""
+        handler = DroppingQueueHandler(queue.Queue(maxsize=2))
+        for msg in "abcd":
+            handler.handle(_record(msg))
+        handler.queue.get_nowait()
+        handler.queue.get_nowait()
+        
+        handler.handle(_record("e"))
+        
+        notice = handler.queue.get_nowait()
+        assert notice.levelno == logging.WARNING
+        assert "2 registro(s)" in notice.getMessage()
+        assert handler.queue.get_nowait().getMessage() == "e"
+        assert handler.dropped == 2
+    
+    def test_concurrent_drops_reported_once(self):
+        """Com varias threads, cada descarte entra em exatamente um aviso"""
+        handler = DroppingQueueHandler(queue.Queue(maxsize=4))
+        received = []
+        done = threading.Event()
+
+        def drain():
+            while not done.is_set() or not handler.queue.empty():
+                try:
+                    received.append(handler.queue.get(timeout=0.01))
+                except queue.Empty:
+                    pass
+
+        def produce():
+            for i in range(2000):
+                handler.handle(_record("msg %d", i))
+
+        consumer = threading.Thread(target=drain)
+        consumer.start()
+        producers = [threading.Thread(target=produce) for _ in range(8)]
+        for t in producers:
+            t.start()
+        for t in producers:
+            t.join()
+        done.set()
+        consumer.join()
+
+        reported = sum(int(r.getMessage().split()[0]) for r in received if r.levelno == logging.WARNING)
+        assert handler.dropped > 0
+        assert reported + handler._unreported == handler.dropped
+    
+    def test_prepare_snapshots_args(self):
+        """Args sao copiados na hora (podem mudar antes do listener)"""
+        handler = DroppingQueueHandler(queue.Queue())
+        items = ["sala"]
+        
+        handler.handle(_record("luzes: %s", items))
+        items.append("quarto")
+        
+        record = handler.queue.get_nowait()
+        assert record.getMessage() == "luzes: ['sala']"
+    
+    def test_prepare_does_not_format(self):
+        """A mensagem nao e montada na thread de quem loga"""
+        handler = DroppingQueueHandler(queue.Queue())
+        
+        handler.handle(_record("comodo %s", "sala"))
+        
+        record = handler.queue.get_nowait()
+        assert record.msg == "comodo %s"
+        assert record.args == ("sala",)
+    
+    def test_listener_writes_records(self):
+        """O listener entrega os registros aos handlers finais, em ordem"""
+        log_queue = queue.Queue(maxsize=100)
+        handler = DroppingQueueHandler(log_queue)
+        target = ListHandler()
+        listener = QueueListener(log_queue, target)
+        listener.start()
+        
+        for i in range(10):
+            handler.handle(_record("msg %d", i))
+        listener.stop()
+        
+        assert [r.getMessage() for r in target.records] == [f"msg {i}" for i in range(10)]
+
+
+class TestSetupLogger:
+    """Testes para setup_logger no modo em fila"""
+    
+    def test_loggers_share_queue_handler(self):
+        """Todos os loggers usam o mesmo handler de fila"""
+        if log_module.LOG_QUEUE_SIZE <= 0:
+            return
+        
+        a = setup_logger("teste.fila.a")
+        b = setup_logger("teste.fila.b")
+        
+        assert a.handlers == b.handlers
+        assert isinstance(a.handlers[0], DroppingQueueHandler)
+        assert log_stats()["maxsize"] == log_module.LOG_QUEUE_SIZE
+
+
+class TestStructuredLogging:
+    """Testes para log_event, helpers e saida JSON"""
+    
+    def setup_method(self):
+        self.logger = logging.getLogger("teste.estruturado")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.target = ListHandler()
+        self.logger.handlers = [self.target]
+    
+    def test_disabled_level_builds_nothing(self):
+        """Nivel desativado nao cria registro nem formata os campos"""
+        class Explode:
+            def __str__(self):
+                raise AssertionError("formatado")
+        
+        log_event(self.logger, "valor %(x)s", logging.DEBUG, x=Explode())
+        
+        assert self.target.records == []
+    
+    def test_fields_format_text(self):
+        """Campos nomeados montam o mesmo texto de antes"""
+        log_event(self.logger, "Despachando: %(domain)s.%(intent)s", domain="light", intent="on")
+        log_action(self.logger, "light", "turn_on", "sala")
+        log_event(self.logger, "sem campos")
+        
+        messages = [r.getMessage() for r in self.target.records]
+        assert messages == ["Despachando: light.on", "ACAO [light] turn_on -> sala", "sem campos"]
+    
+    def test_json_formatter(self):
+        """JSON compacto com os campos como chaves proprias"""
+        log_event(self.logger, "Resposta: %(message)s", message="Luz ligada")
+        
+        line = JsonFormatter().format(self.target.records[0])
+        entry = json.loads(line)
+        
+        assert " " not in line.replace("Luz ligada", "").replace("Resposta: ", "")
+        assert entry["msg"] == "Resposta: Luz ligada"
+        assert entry["message"] == "Luz ligada"
+        assert entry["level"] == "INFO"
+        assert entry["logger"] == "teste.estruturado"
+    
+    def test_json_keeps_base_keys(self):
+        """Campo com nome reservado nao sobrescreve ts/level/logger/msg"""
+        self.logger.info("x %(msg)s %(ts)s", {"msg": "campo", "ts": "agora"})
+        
+        record = self.target.records[0]
+        entry = json.loads(JsonFormatter().format(record))
+        assert entry["msg"] == "x campo agora"
+        assert entry["ts"] == round(record.created, 3)
+    
+    def test_separator_is_shared_constant(self):
+        """O separador e uma constante (filtrada no arquivo JSON)"""
+        from utils.logger import log_separator
+        
+        log_separator(self.logger)
+        
+        assert self.target.records[0].msg is SEPARATOR
@@ -0,0 +1,58 @@
+"""
+Testes para core.matcher
+
+Testa o automato Aho-Corasick usado pelo intent_parser
+"""
+from core.matcher import KeywordMatcher
+
+
+class TestKeywordMatcher:
+    """Testes do automato de palavras-chave"""
+
+    def setup_method(self):
+        self.matcher = KeywordMatcher({
+            "ligar": {"on"},
+            "desligar": {"off"},
+            "ar": {"climate"},
+            "ar condicionado": {"climate"},
+            "luz": {"light"},
+        })
+
+    def test_labels_include_word_and_groups(self):
+        """Cada palavra encontrada deve trazer seus rotulos e ela mesma"""
+        labels = self.matcher.labels("ligar luz")
+
+        # "ar" e substring de "ligar"
+        assert labels == {"ligar", "on", "ar", "climate", "luz", "light"}
+
+    def test_overlapping_matches(self):
+        """Deve achar palavras sobrepostas e contidas em outras"""
+        labels = self.matcher.labels("desligar ar condicionado")
+
+        assert {"desligar", "ligar", "ar", "ar condicionado"} <= labels
+        assert {"on", "off", "climate"} <= labels
+
+    def test_no_match(self):
+        """Texto sem vocabulario nao deve ter rotulos"""
+        assert self.matcher.labels("abrir cortina") == set()
+        assert self.matcher.labels("") == set()
+
+    def test_finditer_positions(self):
+        """Deve informar inicio e fim de cada ocorrencia"""
+        hits = list(self.matcher.finditer("desligar luz"))
+
+        assert (0, 8, "desligar") in hits
+        assert (3, 8, "ligar") in hits
+        assert (9, 12, "luz") in hits
+
+    def test_strip_prefers_longest(self):
+        """strip deve remover a ocorrencia mais longa ('desligar', nao 'ligar')"""
+        text = self.matcher.strip("desligar luz sala", {"ligar", "desligar", "luz"})
+
+        assert text.split() == ["sala"]
+
+    def test_strip_keeps_other_words(self):
+        """strip so remove as palavras pedidas"""
+        text = self.matcher.strip("ligar luz sala", {"ligar"})
+
+        assert text.split() == ["luz", "sala"]
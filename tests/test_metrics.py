@@ -0,0 +1,133 @@
+"""
+Testes para utils.metrics
+
+Testa histogramas, quantis, spans e o formato texto do Prometheus
+"""
+import asyncio
+
+import pytest
+
+from utils.metrics import (Counter, Gauge, Histogram, MetricsRegistry, span,
+                           stage_errors, stage_latency)
+
+
+class TestHistogram:
+    """Testes para o histograma de buckets fixos"""
+    
+    def test_quantiles_from_buckets(self):
+        """Quantis interpolados dentro do bucket certo"""
+        hist = Histogram("teste_seconds", "teste", buckets=(0.01, 0.1, 1.0))
+        for _ in range(90):
+            hist.observe(0.005, stage="x")
+        for _ in range(10):
+            hist.observe(0.5, stage="x")
+        
+        assert 0 < hist.quantile(0.5, stage="x") <= 0.01
+        assert 0.1 < hist.quantile(0.99, stage="x") <= 1.0
+        assert hist.count(stage="x") == 100
+    
+    def test_series_per_labels(self):
+        """Cada combinacao de rotulos e uma serie (ordem nao importa)"""
+        hist = Histogram("teste_seconds", "teste")
+        hist.observe(0.1, domain="light", intent="on")
+        hist.observe(0.1, intent="on", domain="light")
+        hist.observe(0.1, domain="climate", intent="on")
+        
+        assert hist.count(domain="light", intent="on") == 2
+        assert hist.count(domain="climate", intent="on") == 1
+        assert hist.quantile(0.5, domain="cover") is None
+    
+    def test_above_last_bucket(self):
+        """Valor acima do ultimo limite cai no +Inf"""
+        hist = Histogram("teste_seconds", "teste", buckets=(0.1, 1.0))
+        hist.observe(5.0)
+        
+        assert hist.quantile(0.5) == 1.0
+    
+    def test_render_prometheus(self):
+        """Buckets cumulativos, +Inf, sum, count e quantis"""
+        hist = Histogram("teste_seconds", "teste", buckets=(0.1, 1.0))
+        hist.observe(0.05, stage="ha")
+        hist.observe(0.5, stage="ha")
+        
+        lines = hist.render()
+        
+        assert "# TYPE teste_seconds histogram" in lines
+        assert 'teste_seconds_bucket{stage="ha",le="0.1"} 1' in lines
+        assert 'teste_seconds_bucket{stage="ha",le="1.0"} 2' in lines
+        assert 'teste_seconds_bucket{stage="ha",le="+Inf"} 2' in lines
+        assert 'teste_seconds_count{stage="ha"} 2' in lines
+        assert 'teste_seconds_sum{stage="ha"} 0.55' in lines
+        assert any(l.startswith('teste_seconds_quantile{stage="ha",quantile="0.95"}') for l in lines)
+    
+    def test_none_label(self):
+        """Rotulo None sai vazio e convive com series de mesmo nome"""
+        hist = Histogram("teste_seconds", "teste")
+        hist.observe(0.1, domain=None)
+        hist.observe(0.1, domain="light")
+        
+        body = "\n".join(hist.render())
+        
+        assert 'teste_seconds_count{domain=""} 1' in body
+        assert 'teste_seconds_count{domain="light"} 1' in body
+    
+    def test_label_escaping(self):
+        """Aspas e barras nos rotulos sao escapadas"""
+        hist = Histogram("teste_seconds", "teste")
+        hist.observe(0.1, search='luz "sala"\\x')
+        
+        assert 'search="luz \\"sala\\"\\\\x"' in "\n".join(hist.render())
+
+
+class TestRegistry:
+    """Testes para contador, gauge e registro"""
+    
+    def test_render_all(self):
+        """Registro junta as metricas na ordem"""
+        registry = MetricsRegistry()
+        counter = registry.register(Counter("teste_total", "teste"))
+        registry.register(Gauge("teste_fila", "teste", lambda: 3))
+        registry.register(Gauge("teste_cache", "teste", lambda: {(("result", "hits"),): 7}))
+        counter.inc(stage="ha")
+        counter.inc(stage="ha")
+        
+        body = registry.render()
+        
+        assert 'teste_total{stage="ha"} 2' in body
+        assert "teste_fila 3" in body
+        assert 'teste_cache{result="hits"} 7' in body
+        assert body.endswith("\n")
+
+
+class TestSpan:
+    """Testes para spans"""
+    
+    def test_labels_completed_inside(self):
+        """Rotulos conhecidos so no fim podem ser completados no bloco"""
+        before = stage_latency.count(stage="teste_span", domain="light")
+        
+        with span("teste_span") as labels:
+            labels["domain"] = "light"
+        
+        assert stage_latency.count(stage="teste_span", domain="light") == before + 1
+    
+    def test_error_counted_and_raised(self):
+        """Excecao conta em stage_errors e continua subindo"""
+        before = stage_errors.value(stage="teste_erro")
+        
+        with pytest.raises(ValueError):
+            with span("teste_erro"):
+                raise ValueError("boom")
+        
+        assert stage_errors.value(stage="teste_erro") == before + 1
+        assert stage_latency.count(stage="teste_erro") >= 1
+    
+    def test_span_includes_awaits(self):
+        """Dentro de corrotinas o tempo inclui os awaits"""
+        async def slow():
+            with span("teste_async"):
+                await asyncio.sleep(0.05)
+        
+        asyncio.run(slow())
+        
+        assert stage_latency.quantile(0.5, stage="teste_async") >= 0.03
@@ -0,0 +1,257 @@
+"""
+Testes para stt.server
+
+Testa o endpoint de transcricoes parciais (/command/partial) e a sessao
+WebSocket (/ws)
+"""
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from core.context_manager import context
+from stt import server
+
+client = TestClient(server.app)
+
+
+def send(text, session="teste", final=False):
+    return client.post("/command/partial", json={"text": text, "session": session, "final": final}).json()
+
+
+LIGHTS = [
+    {"entity_id": "light.sala", "state": "off", "attributes": {"friendly_name": "Luz da Sala"}},
+    {"entity_id": "light.cozinha", "state": "off", "attributes": {"friendly_name": "Luz da Cozinha"}},
+]
+
+SALA_JANTAR = {"entity_id": "light.sala_jantar", "state": "off",
+               "attributes": {"friendly_name": "Luz da Sala de Jantar"}}
+
+
+class TestCommandPartial:
+    """Testes do despacho antecipado de frases parciais"""
+
+    def setup_method(self):
+        server._partials.clear()
+        self.lights = list(LIGHTS)
+
+        async def all_lights():
+            return self.lights
+
+        self.patcher = patch('core.domains.light.async_get_all_lights', side_effect=all_lights)
+        self.patcher.start()
+
+    def teardown_method(self):
+        self.patcher.stop()
+
+    @patch('stt.server.async_dispatch')
+    def test_dispatches_once_when_complete(self, mock_dispatch):
+        """Deve despachar quando o intent ficar completo, uma unica vez"""
+        mock_dispatch.return_value = {"message": "luz sala ligada."}
+
+        assert send("ligar")["status"] == "pending"
+        assert send("ligar luz da")["status"] == "pending"
+        result = send("ligar luz da sala ")
+
+        assert result["status"] == "dispatched"
+        assert result["intent"] == "on"
+        assert result["response"] == {"message": "luz sala ligada."}
+
+        # Parciais seguintes e o final com o mesmo comando nao despacham de novo
+        assert send("ligar luz da sala ")["status"] == "dispatched"
+        assert send("ligar luz da sala", final=True)["response"] == {"message": "luz sala ligada."}
+        mock_dispatch.assert_called_once()
+        assert mock_dispatch.call_args[0][0]["search"] == "luz sala"
+        assert "teste" not in server._partials
+
+    @patch('stt.server.async_dispatch')
+    def test_prefix_of_another_name_waits(self, mock_dispatch):
+        """'sala' tambem e prefixo de 'sala de jantar': espera o resto da frase"""
+        mock_dispatch.return_value = {"message": "ok"}
+        self.lights.append(SALA_JANTAR)
+
+        assert send("desligar luz da sala ")["status"] == "pending"
+        assert send("desligar luz da sala de ")["status"] == "pending"
+        assert send("desligar luz da sala de jantar ")["status"] == "dispatched"
+
+        mock_dispatch.assert_called_once()
+        assert mock_dispatch.call_args[0][0]["search"] == "luz sala jantar"
+
+    @patch('stt.server.async_dispatch')
+    def test_final_dispatches_the_rest(self, mock_dispatch):
+        """Frase final que continua o comando despachado executa so o resto"""
+        mock_dispatch.side_effect = lambda intent: {"message": f"{intent['search']} ligada."}
+
+        assert send("ligar luz da sala ")["status"] == "dispatched"
+        result = send("ligar luz da sala e da cozinha", final=True)
+
+        assert result["status"] == "dispatched"
+        assert result["response"] == {"message": "luz cozinha ligada."}
+        assert result["dispatched_response"] == {"message": "luz sala ligada."}
+        assert [c[0][0]["search"] for c in mock_dispatch.call_args_list] == ["luz sala", "luz cozinha"]
+
+    @patch('stt.server.async_dispatch')
+    def test_final_that_changed_is_reported(self, mock_dispatch):
+        """Frase final sem o comando despachado nao repete a resposta antiga"""
+        mock_dispatch.return_value = {"message": "luz sala ligada."}
+
+        assert send("ligar luz da sala ")["status"] == "dispatched"
+        result = send("ligar luz da cozinha", final=True)
+
+        assert result["status"] == "mismatch"
+        assert "repetir" in result["response"]["message"]
+        mock_dispatch.assert_called_once()
+        assert "teste" not in server._partials
+
+    @patch('stt.server.async_dispatch')
+    def test_new_utterance_after_lost_final(self, mock_dispatch):
+        """Sem o final, a proxima frase da sessao comeca do zero"""
+        mock_dispatch.side_effect = lambda intent: {"message": f"{intent['search']} {intent['intent']}."}
+
+        assert send("ligar luz da sala ")["status"] == "dispatched"
+        # Final perdido: a frase seguinte nao continua a despachada
+        assert send("desligar luz da")["status"] == "pending"
+        result = send("desligar luz da cozinha ")
+
+        assert result["status"] == "dispatched"
+        assert result["response"] == {"message": "luz cozinha off."}
+        assert mock_dispatch.call_count == 2
+
+    @patch('stt.server.async_dispatch')
+    def test_dispatched_utterance_expires(self, mock_dispatch):
+        """Depois de PARTIAL_TTL o mesmo comando e despachado de novo"""
+        mock_dispatch.return_value = {"message": "luz sala ligada."}
+
+        assert send("ligar luz da sala ")["status"] == "dispatched"
+        server._partials["teste"]["at"] -= server.PARTIAL_TTL + 1
+        assert send("ligar luz da sala", final=True)["status"] == "dispatched"
+
+        assert mock_dispatch.call_count == 2
+
+    @patch('stt.server.async_dispatch')
+    def test_incomplete_waits_for_final(self, mock_dispatch):
+        """Intent incompleto so e despachado no final"""
+        mock_dispatch.return_value = {"message": "Qual luz?"}
+
+        assert send("desligar luz ")["status"] == "pending"
+        mock_dispatch.assert_not_called()
+
+        result = send("desligar luz", final=True)
+
+        assert result["status"] == "dispatched"
+        assert result["intent"] == "off"
+        mock_dispatch.assert_called_once()
+
+    @patch('stt.server.async_dispatch')
+    def test_sessions_are_independent(self, mock_dispatch):
+        """Cada sessao tem sua propria frase"""
+        mock_dispatch.return_value = {"message": "ok"}
+
+        send("ligar ventilador", session="a")
+        send("desligar ar do", session="b")
+        send("ligar ventilador do quarto ", session="a")
+
+        assert mock_dispatch.call_count == 1
+        assert mock_dispatch.call_args[0][0]["intent"] == "fan_on"
+        assert server._partials["b"]["intent"] is None
+
+
+async def fake_dispatch(intent):
+    """Pergunta cria contexto; resposta informa se havia contexto na sessao."""
+    if intent["text"].startswith("desligar luz"):
+        context.set({"domain": "light", "action": "off"})
+        return {"message": "Qual luz?"}
+    return {"message": "com contexto" if context.valid() else "sem contexto"}
+
+
+class TestCommandStream:
+    """Testes da sessao WebSocket"""
+
+    def setup_method(self):
+        context.clear()
+
+    @patch('stt.server.async_dispatch')
+    def test_pipelined_commands_answer_in_order(self, mock_dispatch):
+        """Comandos enviados sem esperar devem ser respondidos em ordem"""
+        mock_dispatch.side_effect = lambda intent: {"message": intent["text"]}
+
+        with client.websocket_connect("/ws?session=sala") as ws:
+            for i, text in enumerate(["ligar luz da sala", "desligar ar", "ligar ventilador"]):
+                ws.send_json({"id": i, "text": text})
+            replies = [ws.receive_json() for _ in range(3)]
+
+        assert [r["id"] for r in replies] == [0, 1, 2]
+        assert replies[0]["intent"] == "on"
+        assert replies[2]["intent"] == "fan_on"
+        assert replies[1]["response"] == {"message": "desligar ar"}
+
+    @patch('stt.server.async_dispatch')
+    def test_invalid_message_keeps_session(self, mock_dispatch):
+        """Mensagem invalida responde erro sem derrubar a sessao"""
+        mock_dispatch.return_value = {"message": "ok"}
+
+        with client.websocket_connect("/ws") as ws:
+            ws.send_text("nao e json")
+            ws.send_json({"id": 7})
+            ws.send_json({"id": 8, "text": "ligar luz da sala"})
+
+            assert "error" in ws.receive_json()
+            assert "error" in ws.receive_json()
+            assert ws.receive_json()["id"] == 8
+
+    @patch('stt.server.async_dispatch', side_effect=fake_dispatch)
+    def test_context_is_per_session(self, mock_dispatch):
+        """Confirmacao pendente de uma sessao nao vaza para outra"""
+        with client.websocket_connect("/ws?session=a") as ws_a, \
+                client.websocket_connect("/ws?session=b") as ws_b:
+            ws_a.send_json({"text": "desligar luz"})
+            assert ws_a.receive_json()["response"]["message"] == "Qual luz?"
+
+            ws_b.send_json({"text": "sala"})
+            assert ws_b.receive_json()["response"]["message"] == "sem contexto"
+
+            ws_a.send_json({"text": "sala"})
+            assert ws_a.receive_json()["response"]["message"] == "com contexto"
+
+        assert not context.valid()
+
+    @patch('stt.server.async_dispatch', side_effect=fake_dispatch)
+    def test_connections_without_session_are_isolated(self, mock_dispatch):
+        """Sem ?session=, cada conexao tem seu proprio contexto"""
+        with client.websocket_connect("/ws") as ws_a, client.websocket_connect("/ws") as ws_b:
+            ws_a.send_json({"text": "desligar luz"})
+            assert ws_a.receive_json()["response"]["message"] == "Qual luz?"
+
+            ws_b.send_json({"text": "cozinha"})
+            assert ws_b.receive_json()["response"]["message"] == "sem contexto"
+
+            ws_a.send_json({"text": "sala"})
+            assert ws_a.receive_json()["response"]["message"] == "com contexto"
+
+        # Nem o POST /command sem sessao (contexto "default") ve a pergunta
+        assert not context.valid()
+
+
+class TestMetrics:
+    """Testes do endpoint /metrics"""
+
+    @patch('core.domains.light.async_handle')
+    def test_command_stages_exposed(self, mock_handle):
+        """Um comando gera spans de parse, dispatch e handler com rotulos"""
+        mock_handle.return_value = {"message": "luz sala ligada."}
+
+        client.post("/command", json={"text": "ligar luz da sala", "session": "metricas"})
+        body = client.get("/metrics").text
+
+        assert 'friday_stage_latency_seconds_count{cache="' in body
+        assert 'stage="parse"' in body
+        assert 'friday_stage_latency_seconds_count{domain="light",intent="on",stage="dispatch"}' in body
+        assert 'friday_stage_latency_seconds_count{domain="light",intent="on",stage="handler"}' in body
+        assert 'quantile="0.99"' in body
+        assert "friday_parse_cache_total" in body
+
+    def test_content_type(self):
+        """Formato texto do Prometheus"""
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
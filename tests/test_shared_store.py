@@ -0,0 +1,122 @@
+"""
+Testes para core.shared_store
+
+Testa o store SQLite compartilhado entre workers (TTL, versoes e
+compare-and-set entre processos)
+"""
+import multiprocessing
+import time
+
+from core.context_manager import SQLiteContextStore
+from core.shared_store import SharedStore
+
+
+def _increment(path, times):
+    """Incrementa um contador com compare_and_set (roda em outro processo)."""
+    kv = SharedStore(path, namespace="teste")
+    for _ in range(times):
+        while True:
+            entry = kv.get("contador")
+            value = entry["value"] if entry else 0
+            version = entry["version"] if entry else None
+            if kv.compare_and_set("contador", version, value + 1, ttl=60) is not None:
+                break
+
+
+def _take(path, results):
+    kv = SharedStore(path, namespace="teste")
+    results.put(kv.take("pergunta") is not None)
+
+
+class TestSharedStore:
+    """Testes do store SQLite"""
+
+    def test_set_get_and_versions(self, tmp_path):
+        """Cada escrita deve receber versao nova"""
+        kv = SharedStore(str(tmp_path / "store.db"))
+        v1 = kv.set("sala", {"domain": "light"}, ttl=10)
+        v2 = kv.set("sala", {"domain": "climate"}, ttl=10)
+
+        entry = kv.get("sala")
+        assert v2 > v1
+        assert entry["value"] == {"domain": "climate"}
+        assert entry["version"] == v2
+        assert kv.get("quarto") is None
+
+    def test_ttl(self, tmp_path):
+        """Entrada expirada nao deve ser lida"""
+        kv = SharedStore(str(tmp_path / "store.db"))
+        kv.set("sala", "x", ttl=0.05)
+        assert kv.get("sala") is not None
+
+        time.sleep(0.1)
+        assert kv.get("sala") is None
+        assert len(kv) == 0
+        assert kv.purge() == 1
+
+    def test_compare_and_set(self, tmp_path):
+        """So grava quando a versao esperada confere"""
+        kv = SharedStore(str(tmp_path / "store.db"))
+
+        v1 = kv.compare_and_set("sala", None, "a", ttl=10)
+        assert v1 is not None
+        assert kv.compare_and_set("sala", None, "b", ttl=10) is None
+        assert kv.compare_and_set("sala", v1, "c", ttl=10) is not None
+        assert kv.compare_and_set("sala", v1, "d", ttl=10) is None
+        assert kv.get("sala")["value"] == "c"
+
+    def test_namespaces(self, tmp_path):
+        """Namespaces diferentes nao se misturam"""
+        path = str(tmp_path / "store.db")
+        SharedStore(path, namespace="a").set("k", 1, ttl=10)
+
+        assert SharedStore(path, namespace="b").get("k") is None
+
+    def test_compare_and_set_across_processes(self, tmp_path):
+        """Incrementos concorrentes de varios processos nao se perdem"""
+        path = str(tmp_path / "store.db")
+        SharedStore(path, namespace="teste")
+        procs = [multiprocessing.Process(target=_increment, args=(path, 25)) for _ in range(4)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join(30)
+
+        assert SharedStore(path, namespace="teste").get("contador")["value"] == 100
+
+    def test_take_is_exclusive(self, tmp_path):
+        """Apenas um processo deve pegar a mesma entrada"""
+        path = str(tmp_path / "store.db")
+        SharedStore(path, namespace="teste").set("pergunta", {"q": "Qual luz?"}, ttl=10)
+        results = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=_take, args=(path, results)) for _ in range(4)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join(30)
+
+        assert sorted(results.get(timeout=5) for _ in procs) == [False, False, False, True]
+
+
+class TestSQLiteContextStore:
+    """Contexto compartilhado entre workers"""
+
+    def test_confirmation_across_workers(self, tmp_path):
+        """Pergunta num worker, resposta em outro"""
+        path = str(tmp_path / "store.db")
+        worker_a = SQLiteContextStore(path)
+        worker_b = SQLiteContextStore(path)
+
+        worker_a.set("sala", {"domain": "light", "candidates": []}, ttl=10)
+
+        assert worker_b.get("sala")["payload"]["domain"] == "light"
+        assert worker_b.take("sala") is not None
+        assert worker_a.take("sala") is None
+
+    def test_zero_ttl_clears(self, tmp_path):
+        """ttl 0 deve limpar o contexto"""
+        store = SQLiteContextStore(str(tmp_path / "store.db"))
+        store.set("sala", {"domain": "light"})
+        store.set("sala", {"domain": "light"}, ttl=0)
+
+        assert store.get("sala") is None
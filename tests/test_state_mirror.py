@@ -0,0 +1,304 @@
+"""
+Testes para core.state_mirror
+
+Testa o espelho local de estados contra um servidor WebSocket falso do HA
+"""
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from aiohttp import web
+
+from core import ha_client
+from core.state_mirror import StateMirror, mirror, websocket_url
+
+
+def make_state(entity_id, state, name=None):
+    return {
+        "entity_id": entity_id,
+        "state": state,
+        "attributes": {"friendly_name": name or entity_id},
+    }
+
+
+class FakeHAWebSocket:
+    """Servidor WebSocket minimo com o protocolo de /api/websocket do HA"""
+
+    def __init__(self, states, token="token-valido"):
+        self.states = {s["entity_id"]: s for s in states}
+        self.token = token
+        self.connections = 0
+        self.clients = []
+        self.subscriptions = {}
+        self.runner = None
+        self.url = None
+
+    async def handler(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.connections += 1
+
+        await ws.send_json({"type": "auth_required", "ha_version": "fake"})
+        msg = await ws.receive_json()
+        if msg.get("access_token") != self.token:
+            await ws.send_json({"type": "auth_invalid", "message": "Invalid access token"})
+            await ws.close()
+            return ws
+        await ws.send_json({"type": "auth_ok", "ha_version": "fake"})
+
+        self.clients.append(ws)
+        try:
+            async for raw in ws:
+                msg = raw.json()
+                if msg["type"] == "subscribe_events":
+                    self.subscriptions[ws] = msg["id"]
+                    await ws.send_json({"id": msg["id"], "type": "result", "success": True, "result": None})
+                elif msg["type"] == "get_states":
+                    await ws.send_json({
+                        "id": msg["id"], "type": "result", "success": True,
+                        "result": list(self.states.values()),
+                    })
+        finally:
+            self.clients.remove(ws)
+            self.subscriptions.pop(ws, None)
+        return ws
+
+    async def set_state(self, entity_id, new_state):
+        """Altera estado e publica state_changed para os assinantes"""
+        old_state = self.states.get(entity_id)
+        if new_state is None:
+            self.states.pop(entity_id, None)
+        else:
+            self.states[entity_id] = new_state
+        for ws, sub_id in list(self.subscriptions.items()):
+            await ws.send_json({
+                "id": sub_id,
+                "type": "event",
+                "event": {
+                    "event_type": "state_changed",
+                    "data": {"entity_id": entity_id, "old_state": old_state, "new_state": new_state},
+                },
+            })
+
+    async def send_malformed_event(self):
+        """Evento sem o campo "event" (mensagem fora do protocolo)"""
+        for ws, sub_id in list(self.subscriptions.items()):
+            await ws.send_json({"id": sub_id, "type": "event"})
+
+    async def drop_clients(self):
+        for ws in list(self.clients):
+            await ws.close()
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/api/websocket", self.handler)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"ws://127.0.0.1:{port}/api/websocket"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+async def wait_until(condition, timeout=2.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        if loop.time() > deadline:
+            raise AssertionError("condicao nao satisfeita a tempo")
+        await asyncio.sleep(0.01)
+
+
+class TestStateMirrorLocal:
+    """Testes das operacoes locais do espelho"""
+
+    def test_load_and_get(self):
+        """load() deve indexar estados por entity_id"""
+        m = StateMirror()
+        m.load([make_state("light.sala", "on"), make_state("light.quarto", "off")])
+
+        assert m.ready
+        assert m.get("light.sala")["state"] == "on"
+        assert len(m.all()) == 2
+
+    def test_apply_event_updates_and_removes(self):
+        """Eventos devem atualizar e remover entidades"""
+        m = StateMirror()
+        m.load([make_state("light.sala", "off")])
+
+        m.apply_event({"entity_id": "light.sala", "new_state": make_state("light.sala", "on")})
+        assert m.get("light.sala")["state"] == "on"
+
+        m.apply_event({"entity_id": "light.sala", "new_state": None})
+        assert m.get("light.sala") is None
+        assert m.events == 2
+
+    def test_invalidate(self):
+        """invalidate() deve marcar espelho como indisponivel"""
+        m = StateMirror()
+        m.load([])
+        m.invalidate()
+
+        assert not m.ready
+
+    def test_wait_ready_across_event_loops(self):
+        """wait_ready deve funcionar em outro event loop (servidor reiniciado)"""
+        m = StateMirror()
+        assert not asyncio.run(m.wait_ready(0.01))
+
+        async def load_and_wait():
+            asyncio.get_running_loop().call_later(0.05, m.load, [])
+            return await m.wait_ready(1)
+
+        assert asyncio.run(load_and_wait())
+        assert asyncio.run(m.wait_ready(0.01))
+
+    def test_websocket_url(self):
+        """Deve converter URL HTTP do HA para URL WebSocket"""
+        assert websocket_url("http://ha:8123") == "ws://ha:8123/api/websocket"
+        assert websocket_url("https://ha.local/") == "wss://ha.local/api/websocket"
+
+
+class TestStateMirrorWebSocket:
+    """Testes contra servidor WebSocket falso"""
+
+    @pytest.mark.asyncio
+    async def test_loads_snapshot_on_connect(self):
+        """Deve carregar todos os estados ao conectar"""
+        server = FakeHAWebSocket([make_state("light.sala", "on"), make_state("light.quarto", "off")])
+        await server.start()
+        m = StateMirror()
+        task = asyncio.create_task(m.run(server.url, "token-valido", reconnect_delay=0.05))
+
+        try:
+            assert await m.wait_ready(2)
+            assert m.get("light.sala")["state"] == "on"
+            assert len(m) == 2
+        finally:
+            task.cancel()
+            await server.stop()
+
+    @pytest.mark.asyncio
+    async def test_follows_state_changed_events(self):
+        """Deve aplicar eventos state_changed recebidos"""
+        server = FakeHAWebSocket([make_state("light.sala", "off")])
+        await server.start()
+        m = StateMirror()
+        task = asyncio.create_task(m.run(server.url, "token-valido", reconnect_delay=0.05))
+
+        try:
+            await m.wait_ready(2)
+            await server.set_state("light.sala", make_state("light.sala", "on"))
+            await server.set_state("light.nova", make_state("light.nova", "off"))
+
+            await wait_until(lambda: m.events == 2)
+            assert m.get("light.sala")["state"] == "on"
+            assert m.get("light.nova")["state"] == "off"
+        finally:
+            task.cancel()
+            await server.stop()
+
+    @pytest.mark.asyncio
+    async def test_resyncs_after_reconnect(self):
+        """Deve recarregar o snapshot apos reconectar"""
+        server = FakeHAWebSocket([make_state("light.sala", "off")])
+        await server.start()
+        m = StateMirror()
+        task = asyncio.create_task(m.run(server.url, "token-valido", reconnect_delay=0.05))
+
+        try:
+            await m.wait_ready(2)
+            await server.drop_clients()
+            await wait_until(lambda: not m.ready)
+
+            # Mudanca enquanto desconectado (evento perdido)
+            server.states["light.sala"] = make_state("light.sala", "on")
+
+            await wait_until(lambda: m.snapshots == 2)
+            assert m.ready
+            assert m.get("light.sala")["state"] == "on"
+            assert server.connections == 2
+        finally:
+            task.cancel()
+            await server.stop()
+
+    @pytest.mark.asyncio
+    async def test_malformed_event_resyncs(self):
+        """Mensagem malformada invalida o espelho e reconecta (a task nao morre)"""
+        server = FakeHAWebSocket([make_state("light.sala", "off")])
+        await server.start()
+        m = StateMirror()
+        task = asyncio.create_task(m.run(server.url, "token-valido", reconnect_delay=0.05))
+
+        try:
+            await m.wait_ready(2)
+            server.states["light.sala"] = make_state("light.sala", "on")
+            await server.send_malformed_event()
+
+            await wait_until(lambda: m.snapshots == 2)
+            assert not task.done()
+            assert m.get("light.sala")["state"] == "on"
+            assert server.connections == 2
+        finally:
+            task.cancel()
+            await server.stop()
+
+    @pytest.mark.asyncio
+    async def test_auth_invalid_stops(self):
+        """Token invalido deve encerrar sem reconectar"""
+        server = FakeHAWebSocket([], token="outro-token")
+        await server.start()
+        m = StateMirror()
+
+        try:
+            await asyncio.wait_for(m.run(server.url, "token-errado", reconnect_delay=0.05), 2)
+            assert not m.ready
+            assert server.connections == 1
+        finally:
+            await server.stop()
+
+
+class TestHAClientReadsFromMirror:
+    """ha_client deve ler do espelho quando disponivel"""
+
+    def setup_method(self):
+        mirror.load([make_state("light.sala", "on")])
+
+    def teardown_method(self):
+        mirror.clear()
+
+    @patch('core.ha_client.requests.Session.get')
+    def test_get_state_without_http(self, mock_get):
+        """get_state nao deve fazer requisicao HTTP"""
+        assert ha_client.get_state("light.sala") == "on"
+        assert ha_client.get_state("light.inexistente") is None
+        mock_get.assert_not_called()
+
+    @patch('core.ha_client.requests.Session.get')
+    def test_get_all_states_without_http(self, mock_get):
+        """get_all_states nao deve fazer requisicao HTTP"""
+        states = ha_client.get_all_states()
+
+        assert states[0]["entity_id"] == "light.sala"
+        mock_get.assert_not_called()
+
+    @patch('core.ha_client.requests.Session.get')
+    def test_get_states_without_http(self, mock_get):
+        """get_states nao deve fazer requisicao HTTP"""
+        result = ha_client.get_states(["light.sala", "light.inexistente"])
+
+        assert result == {"light.sala": "on", "light.inexistente": None}
+        mock_get.assert_not_called()
+
+    @patch('core.ha_client.requests.Session.get')
+    def test_falls_back_to_rest_when_not_ready(self, mock_get):
+        """Deve voltar para REST quando espelho indisponivel"""
+        mirror.invalidate()
+        mock_get.return_value.json.return_value = []
+
+        ha_client.get_all_states()
+
+        mock_get.assert_called_once()
@@ -0,0 +1,55 @@
+"""
+Testes para utils.timer_wheel
+
+Testa o timer wheel hierarquico usado na expiracao de contextos
+"""
+import random
+
+from utils.timer_wheel import TimerWheel
+
+
+class TestTimerWheel:
+    """Testes do timer wheel"""
+
+    def test_expires_on_exact_tick(self):
+        """Timer deve expirar exatamente no tick agendado"""
+        wheel = TimerWheel(slots=4, levels=3)
+        wheel.schedule("a", 3)
+        wheel.schedule("b", 20)  # nivel 2
+
+        assert wheel.advance(2) == []
+        assert wheel.advance(1) == ["a"]
+        assert wheel.advance(16) == []
+        assert wheel.advance(1) == ["b"]
+        assert len(wheel) == 0
+
+    def test_cancel(self):
+        """Timer cancelado nao deve expirar"""
+        wheel = TimerWheel(slots=4, levels=2)
+        wheel.schedule("a", 2)
+
+        assert wheel.cancel("a")
+        assert not wheel.cancel("a")
+        assert wheel.advance(10) == []
+
+    def test_matches_naive_model(self):
+        """Deve expirar igual a um modelo ingenuo (inclusive alem do alcance)"""
+        rng = random.Random(7)
+        wheel = TimerWheel(slots=4, levels=3)  # alcance de 64 ticks
+        model = {}
+
+        for _ in range(5000):
+            op = rng.random()
+            if op < 0.4:
+                key, ticks = rng.randrange(50), rng.randrange(1, 200)
+                wheel.schedule(key, ticks)
+                model[key] = wheel.now + ticks
+            elif op < 0.5:
+                key = rng.randrange(50)
+                assert wheel.cancel(key) == (key in model)
+                model.pop(key, None)
+            else:
+                expired = set(wheel.advance(1))
+                assert expired == {k for k, t in model.items() if t == wheel.now}
+                for key in expired:
+                    del model[key]
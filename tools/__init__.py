@@ -0,0 +1,10 @@
+"""
+Tools module - Ferramentas de linha de comando do Friday
+
+Modulos disponiveis:
+- eval_corpus: Avalia o intent_parser contra um corpus JSONL de frases gravadas
+- fake_ha: Home Assistant falso (REST + WebSocket) para testes de integracao e carga
+- loadtest: Teste de carga em malha aberta do POST /command (vazao, p99, saturacao)
+- bench: Microbenchmarks de parser, busca de luzes e dispatcher, com checagem de regressao
+- log_replay: Perfis de latencia por intent/servico a partir dos logs e corpus de frases reais
+"""
@@ -0,0 +1,449 @@
+"""
+Microbenchmarks dos caminhos quentes: parser, busca de luzes, comodos do
+ar e dispatcher (com o HA substituido por stubs, sem rede).
+
+Cada benchmark e calibrado para que uma amostra dure pelo menos
+--min-time; depois de --warmup amostras descartadas, coleta --samples
+amostras (GC desligado durante a medicao). Com --processes N a medicao
+se repete em N processos novos e as amostras sao somadas: a variacao
+entre processos (layout de memoria, hash seed) entra no resultado. O
+resultado por benchmark e a mediana do tempo por operacao com intervalo
+de confianca de 95% da mediana (estatisticas de ordem, sem supor
+distribuicao normal).
+
+--json grava o resultado; --compare aponta regressoes contra um JSON
+anterior: mais lento que --threshold E com os intervalos de confianca
+separados (ruido nao conta como regressao). Sai com codigo 1 se houver.
+
+Uso:
+    python -m tools.bench
+    python -m tools.bench -k parse --samples 30 --processes 1
+    python -m tools.bench --json bench.json
+    python -m tools.bench --compare bench.json --threshold 0.10
+"""
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import math
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import ExitStack
+from unittest.mock import patch
+
+from core import intent_parser
+from core.context_manager import context
+from core.dispatcher import async_dispatch
+from core.domains import climate, light
+from core.intent_parser import normalize, parse, parse_cache
+
+# Uma frase por familia de regra do parser (ver intent_parser.RULES)
+PARSE_FAMILIES = {
+    "single_light": "ligar luz da sala",
+    "multi": "ligar luz do quarto e desligar luz da cozinha",
+    "all_lights": "apagar todas as luzes",
+    "climate_power": "ligar ar do quarto",
+    "temperature": "colocar o ar do quarto em 22 graus",
+    "speed": "aumentar a velocidade do ar do quarto",
+    "fan": "ligar ventilador do quarto",
+    "heater": "ligar aquecedor do quarto",
+    "display_off": "desligar display do ar do quarto",
+    "compound": "ligar luz da sala e ligar ar do quarto",
+    "unknown": "qual a previsao do tempo",
+}
+
+LIGHT_COUNTS = (100, 1000, 10000)
+
+# Comodos das luzes sinteticas: nenhum coincide com as buscas medidas
+_BENCH_ROOMS = ["garagem", "jardim", "lavanderia", "corredor", "hall", "deposito", "piscina", "sotao"]
+_BENCH_KINDS = ["Luz", "LED", "Abajur", "Spot", "Fita LED", "Pendente"]
+
+DISPATCH_INTENTS = {
+    "light_on": "ligar luz da sala",
+    "light_multi": "ligar luz do quarto e desligar luz da cozinha",
+    "climate_on": "ligar ar do quarto",
+    "climate_temperature": "colocar o ar do quarto em 22 graus",
+    "compound": "ligar luz da sala e ligar ar do quarto",
+}
+
+# ---------------- BENCHMARKS ----------------
+
+class Benchmark:
+    """fn() e uma operacao; async_ indica corrotina (medida dentro do loop)."""
+
+    __slots__ = ("name", "fn", "async_")
+
+    def __init__(self, name: str, fn, async_: bool = False):
+        self.name = name
+        self.fn = fn
+        self.async_ = async_
+
+
+def make_lights(count: int) -> list[dict]:
+    """Estados de luzes: as da casa (sala, cozinha, quarto) + sinteticas."""
+    lights = [
+        {"entity_id": "light.sala", "state": "off", "attributes": {"friendly_name": "Luz da Sala"}},
+        {"entity_id": "light.cozinha", "state": "on", "attributes": {"friendly_name": "Luz da Cozinha"}},
+        {"entity_id": "light.quarto", "state": "off", "attributes": {"friendly_name": "Luz do Quarto"}},
+    ]
+    for i in range(count - len(lights)):
+        kind = _BENCH_KINDS[i % len(_BENCH_KINDS)]
+        room = _BENCH_ROOMS[(i // len(_BENCH_KINDS)) % len(_BENCH_ROOMS)]
+        lights.append({
+            "entity_id": f"light.bench_{i}",
+            "state": "off",
+            "attributes": {"friendly_name": f"{kind} {room.title()} {i}"},
+        })
+    return lights
+
+
+def _complete(coro):
+    # Handlers sem I/O real terminam sem suspender: roda sem event loop
+    try:
+        coro.send(None)
+    except StopIteration as done:
+        return done.value
+    coro.close()
+    raise RuntimeError("benchmark suspendeu: use async_=True")
+
+
+def _parse_uncached(text: str):
+    def run():
+        parse_cache.clear()
+        return parse(text)
+    return run
+
+
+def build_benchmarks() -> list[Benchmark]:
+    """Todos os benchmarks, na ordem do relatorio."""
+    benches = []
+
+    texts = list(PARSE_FAMILIES.values())
+    benches.append(Benchmark("intent_parser.normalize", lambda: [normalize(t) for t in texts]))
+
+    for family, text in PARSE_FAMILIES.items():
+        benches.append(Benchmark(f"intent_parser.parse[{family}]", _parse_uncached(text)))
+    benches.append(Benchmark("intent_parser.parse[cached]", lambda: parse("ligar luz da sala")))
+
+    for count in LIGHT_COUNTS:
+        lights = make_lights(count)
+        benches.append(Benchmark(
+            f"light.find_light_entities[{count}]",
+            lambda lights=lights: _complete(light.async_find_light_entities("luz da sala", lights)),
+        ))
+
+    searches = ["ar do quarto", "closet", "ar", "sala de estar"]
+    benches.append(Benchmark("climate.match_room", lambda: [climate.match_room(s) for s in searches]))
+
+    for name, text in DISPATCH_INTENTS.items():
+        intent = intent_parser.parse(text)
+        benches.append(Benchmark(
+            f"dispatcher.dispatch[{name}]",
+            lambda intent=intent: async_dispatch(dict(intent)),
+            async_=True,
+        ))
+    return benches
+
+
+def stub_ha(states: list[dict]) -> ExitStack:
+    """
+    Substitui as chamadas ao HA dos dominios por corrotinas sem I/O.
+
+    states serve /api/states (luzes) e os estados individuais do ar.
+    """
+    by_id = {s["entity_id"]: s["state"] for s in states}
+
+    async def call_service(domain, service, data):
+        return True
+
+    async def get_all_states():
+        return states
+
+    async def get_state(entity_id):
+        return by_id.get(entity_id, "off")
+
+    async def get_states(entity_ids):
+        return {e: by_id.get(e, "off") for e in entity_ids}
+
+    stack = ExitStack()
+    stack.enter_context(patch.object(light, "async_call_service", call_service))
+    stack.enter_context(patch.object(light, "async_get_all_states", get_all_states))
+    stack.enter_context(patch.object(climate, "async_call_service", call_service))
+    stack.enter_context(patch.object(climate, "async_get_state", get_state))
+    stack.enter_context(patch.object(climate, "async_get_states", get_states))
+    return stack
+
+
+# ---------------- MEDICAO ----------------
+
+def _timer(bench: Benchmark, loop: asyncio.AbstractEventLoop):
+    fn = bench.fn
+    if not bench.async_:
+        def timed(loops: int) -> float:
+            start = time.perf_counter()
+            for _ in range(loops):
+                fn()
+            return time.perf_counter() - start
+        return timed
+
+    async def batch(loops: int) -> float:
+        # Tempo medido dentro do loop: sem o custo de run_until_complete
+        start = time.perf_counter()
+        for _ in range(loops):
+            await fn()
+        return time.perf_counter() - start
+
+    return lambda loops: loop.run_until_complete(batch(loops))
+
+
+def measure(bench: Benchmark, samples: int = 10, warmup: int = 3, min_time: float = 0.02,
+            loop: asyncio.AbstractEventLoop = None) -> dict:
+    """Amostras de segundos por operacao (ja calibradas e sem aquecimento)."""
+    timed = _timer(bench, loop)
+
+    loops = 1
+    while True:
+        elapsed = timed(loops)
+        if elapsed >= min_time or loops >= 1 << 24:
+            break
+        # Pula direto para perto do alvo, com folga
+        loops = max(loops * 2, int(loops * min_time / max(elapsed, 1e-9) * 1.2))
+
+    values = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for i in range(warmup + samples):
+            elapsed = timed(loops)
+            if i >= warmup:
+                values.append(elapsed / loops)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    return {"name": bench.name, "loops": loops, **summarize(values)}
+
+
+def summarize(values: list[float]) -> dict:
+    """Mediana, IC 95% da mediana (por posicao), media, desvio e amostras."""
+    ordered = sorted(values)
+    n = len(ordered)
+    low, high = median_ci_ranks(n)
+    return {
+        "median": statistics.median(ordered),
+        "ci_low": ordered[low],
+        "ci_high": ordered[high],
+        "mean": statistics.fmean(ordered),
+        "stdev": statistics.stdev(ordered) if n > 1 else 0.0,
+        "min": ordered[0],
+        "samples": values,
+    }
+
+
+def median_ci_ranks(n: int) -> tuple[int, int]:
+    """Posicoes (base 0) do IC 95% da mediana: n/2 -+ 1.96*sqrt(n)/2."""
+    half_width = 0.98 * math.sqrt(n)
+    low = max(math.floor(n / 2 - half_width) - 1, 0)
+    high = min(math.ceil(1 + n / 2 + half_width) - 1, n - 1)
+    return low, high
+
+
+def run(pattern: str = None, samples: int = 10, warmup: int = 3, min_time: float = 0.02,
+        with_logging: bool = False, progress=None) -> dict:
+    """Roda os benchmarks (filtrados por regex) e devolve o resultado para JSON."""
+    selected = [b for b in build_benchmarks() if not pattern or re.search(pattern, b.name)]
+
+    if not with_logging:
+        # Mede o codigo, nao o custo do log (esse e medido pelo teste de carga)
+        logging.disable(logging.INFO)
+    loop = asyncio.new_event_loop()
+    results = []
+    try:
+        with stub_ha(make_lights(1000)):
+            for bench in selected:
+                context.clear()
+                result = measure(bench, samples, warmup, min_time, loop)
+                results.append(result)
+                if progress:
+                    progress(result)
+    finally:
+        loop.close()
+        context.clear()
+        parse_cache.clear()
+        if not with_logging:
+            logging.disable(logging.NOTSET)
+
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "config": {"samples": samples, "warmup": warmup, "min_time": min_time, "with_logging": with_logging},
+        "benchmarks": results,
+    }
+
+
+def run_processes(processes: int, pattern: str = None, samples: int = 10, warmup: int = 3,
+                  min_time: float = 0.02, with_logging: bool = False, progress=None) -> dict:
+    """run() em processos novos, um depois do outro, com as amostras somadas."""
+    command = [sys.executable, "-m", "tools.bench", "--worker", "--processes", "1",
+               "--samples", str(samples), "--warmup", str(warmup), "--min-time", str(min_time)]
+    if pattern:
+        command += ["-k", pattern]
+    if with_logging:
+        command.append("--with-logging")
+
+    parts = []
+    for i in range(processes):
+        out = subprocess.run(command, capture_output=True, text=True, check=True)
+        # O JSON e a ultima linha (o log pode escrever antes no console)
+        parts.append(json.loads(out.stdout.strip().splitlines()[-1]))
+        print(f"processo {i + 1}/{processes} concluido", file=sys.stderr, flush=True)
+
+    result = merge(parts)
+    result["config"]["processes"] = processes
+    if progress:
+        for bench in result["benchmarks"]:
+            progress(bench)
+    return result
+
+
+def merge(parts: list[dict]) -> dict:
+    """Junta as amostras de varias rodadas de run() por benchmark."""
+    names = []
+    samples = {}
+    loops = {}
+    for part in parts:
+        for bench in part["benchmarks"]:
+            if bench["name"] not in samples:
+                names.append(bench["name"])
+                samples[bench["name"]] = []
+                loops[bench["name"]] = bench["loops"]
+            samples[bench["name"]].extend(bench["samples"])
+
+    result = {k: v for k, v in parts[0].items() if k != "benchmarks"}
+    result["config"] = dict(parts[0]["config"])
+    result["benchmarks"] = [
+        {"name": name, "loops": loops[name], **summarize(samples[name])} for name in names
+    ]
+    return result
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                             capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+# ---------------- COMPARACAO ----------------
+
+def compare(current: dict, baseline: dict, threshold: float = 0.10) -> list[dict]:
+    """
+    Benchmarks presentes nos dois resultados, com a variacao da mediana.
+
+    status: "regression" (mais lento que threshold e ICs separados),
+    "improvement" (o simetrico) ou "same".
+    """
+    before = {b["name"]: b for b in baseline.get("benchmarks", [])}
+    rows = []
+    for now in current.get("benchmarks", []):
+        old = before.get(now["name"])
+        if old is None:
+            continue
+        change = now["median"] / old["median"] - 1
+        if change > threshold and now["ci_low"] > old["ci_high"]:
+            status = "regression"
+        elif change < -threshold and now["ci_high"] < old["ci_low"]:
+            status = "improvement"
+        else:
+            status = "same"
+        rows.append({"name": now["name"], "before": old["median"], "after": now["median"],
+                     "change": change, "status": status})
+    return rows
+
+
+def format_time(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def format_result(result: dict) -> str:
+    ci = (result["ci_high"] - result["ci_low"]) / 2 / result["median"] if result["median"] else 0.0
+    ops = 1 / result["median"] if result["median"] else float("inf")
+    return f"{result['name']:<45} {format_time(result['median']):>10} +-{ci:5.1%}  {ops:>12,.0f} op/s"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Microbenchmarks de parser, busca de luzes e dispatcher")
+    parser.add_argument("-k", dest="pattern", help="regex dos benchmarks a rodar (ex: parse, find_light)")
+    parser.add_argument("--samples", type=int, default=10,
+                        help="amostras por benchmark em cada processo (padrao: 10)")
+    parser.add_argument("--processes", type=int, default=3,
+                        help="processos novos medidos em sequencia (padrao: 3; 1 mede neste processo)")
+    parser.add_argument("--warmup", type=int, default=3, help="amostras descartadas (padrao: 3)")
+    parser.add_argument("--min-time", type=float, default=0.02, help="segundos minimos por amostra")
+    parser.add_argument("--with-logging", action="store_true", help="mantem o log ligado durante a medicao")
+    parser.add_argument("--json", metavar="FILE", help="grava o resultado em JSON")
+    parser.add_argument("--compare", metavar="FILE", help="JSON de referencia para apontar regressoes")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="variacao da mediana considerada regressao (padrao: 0.10)")
+    parser.add_argument("--list", action="store_true", help="lista os benchmarks e sai")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for bench in build_benchmarks():
+            if not args.pattern or re.search(args.pattern, bench.name):
+                print(bench.name)
+        return 0
+
+    if args.samples < 2:
+        parser.error("--samples precisa ser pelo menos 2")
+
+    if args.worker:
+        # Processo filho de run_processes: so o JSON, numa linha
+        result = run(args.pattern, args.samples, args.warmup, args.min_time, args.with_logging)
+        print(json.dumps(result))
+        return 0
+
+    show = lambda r: print(format_result(r), flush=True)  # noqa: E731
+    if args.processes > 1:
+        result = run_processes(args.processes, args.pattern, args.samples, args.warmup,
+                               args.min_time, args.with_logging, progress=show)
+    else:
+        result = run(args.pattern, args.samples, args.warmup, args.min_time, args.with_logging,
+                     progress=show)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+            f.write("\n")
+
+    if not args.compare:
+        return 0
+
+    with open(args.compare, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    rows = compare(result, baseline, args.threshold)
+    print(f"\nComparado com {baseline.get('commit') or '?'} ({baseline.get('timestamp', '?')}), "
+          f"limite {args.threshold:.0%}:")
+    for row in rows:
+        mark = {"regression": "REGRESSAO", "improvement": "melhora", "same": ""}[row["status"]]
+        print(f"  {row['name']:<45} {format_time(row['before']):>10} -> {format_time(row['after']):>10} "
+              f"({row['change']:+.1%}) {mark}".rstrip())
+
+    return 1 if any(row["status"] == "regression" for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
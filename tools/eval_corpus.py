@@ -0,0 +1,114 @@
+"""
+Avalia o intent_parser contra um corpus JSONL.
+
+Cada linha tem o texto e os campos esperados do intent:
+
+    {"text": "ligar luz da sala", "intent": "on", "domain": "light"}
+
+Todos os campos alem de "text" sao comparados com o resultado de parse.
+
+Uso:
+    python -m tools.eval_corpus corpus.jsonl
+    python -m tools.eval_corpus corpus.jsonl --failures 20 --min-accuracy 0.99
+    python -m tools.eval_corpus frases.txt --record corpus.jsonl
+"""
+import argparse
+import json
+import sys
+import time
+
+from core.intent_parser import parse_cache, parse_many
+
+
+def load_corpus(path: str) -> list[dict]:
+    cases = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            case = json.loads(line)
+            if "text" not in case:
+                raise ValueError(f"{path}:{line_no}: linha sem 'text'")
+            cases.append(case)
+    return cases
+
+
+def evaluate(cases: list[dict]) -> dict:
+    """Roda o corpus inteiro com parse_many e compara os campos esperados."""
+    texts = [case["text"] for case in cases]
+
+    # Mede o parser, nao o cache de execucoes anteriores
+    parse_cache.clear()
+    started = time.perf_counter()
+    results = parse_many(texts)
+    elapsed = time.perf_counter() - started
+
+    failures = []
+    for case, result in zip(cases, results):
+        expected = {k: v for k, v in case.items() if k != "text"}
+        got = {k: (result or {}).get(k) for k in expected}
+        if got != expected:
+            failures.append({"text": case["text"], "expected": expected, "got": got})
+
+    total = len(cases)
+    return {
+        "total": total,
+        "correct": total - len(failures),
+        "accuracy": (total - len(failures)) / total if total else 1.0,
+        "seconds": elapsed,
+        "per_second": total / elapsed if elapsed > 0 else float("inf"),
+        "failures": failures,
+    }
+
+
+def record(texts_path: str, out_path: str, fields: list[str]) -> int:
+    """Grava o corpus esperado a partir do parser atual (uma frase por linha)."""
+    with open(texts_path, "r", encoding="utf-8") as f:
+        texts = [line.strip() for line in f if line.strip()]
+
+    with open(out_path, "w", encoding="utf-8") as out:
+        for text, result in zip(texts, parse_many(texts)):
+            case = {"text": text}
+            case.update({k: result[k] for k in fields if k in result})
+            out.write(json.dumps(case, ensure_ascii=False) + "\n")
+    return len(texts)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Avalia o intent_parser contra um corpus JSONL")
+    parser.add_argument("corpus", help="JSONL com text + campos esperados (ou frases, com --record)")
+    parser.add_argument("--failures", type=int, default=10, help="quantas falhas listar (padrao: 10)")
+    parser.add_argument("--min-accuracy", type=float, default=None,
+                        help="sai com codigo 1 se a acuracia ficar abaixo disso")
+    parser.add_argument("--record", metavar="OUT",
+                        help="grava OUT com o resultado atual para cada frase de CORPUS")
+    parser.add_argument("--fields", default="intent,domain,search,room,value",
+                        help="campos gravados com --record")
+    args = parser.parse_args(argv)
+
+    if args.record:
+        count = record(args.corpus, args.record, args.fields.split(","))
+        print(f"{count} frase(s) gravada(s) em {args.record}")
+        return 0
+
+    report = evaluate(load_corpus(args.corpus))
+
+    for failure in report["failures"][:args.failures]:
+        print(f"FALHA: {failure['text']!r}")
+        print(f"  esperado: {failure['expected']}")
+        print(f"  obtido:   {failure['got']}")
+
+    print(
+        f"{report['correct']}/{report['total']} corretas "
+        f"({report['accuracy']:.2%}) em {report['seconds']:.3f}s "
+        f"-> {report['per_second']:.0f} frases/s"
+    )
+
+    if args.min_accuracy is not None and report["accuracy"] < args.min_accuracy:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
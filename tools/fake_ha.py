@@ -0,0 +1,356 @@
+"""
+Home Assistant falso para testes de integracao e de carga.
+
+Implementa o que o Friday usa do HA: GET /api/states, GET
+/api/states/<entity_id>, POST /api/services/<domain>/<service> e a API
+WebSocket (auth, subscribe_events state_changed, get_states). As
+entidades sao sinteticas (quantidade configuravel) e cada requisicao
+pode sofrer latencia, jitter e erros injetados.
+
+Aponte o Friday para ele com HA_URL:
+
+    python -m tools.fake_ha --port 8123 --entities 2000 --latency 0.03 --jitter 0.01
+    HA_URL=http://localhost:8123 HA_TOKEN=fake uvicorn stt.server:app
+
+Uso:
+    python -m tools.fake_ha [--host H] [--port P] [--entities N] [--latency S]
+                            [--jitter S] [--error-rate F] [--token T] [--seed N]
+"""
+import argparse
+import asyncio
+import random
+import sys
+import threading
+import time
+
+from aiohttp import WSMsgType, web
+
+from core.domains.climate import CLIMATE_DEVICES
+
+# Luzes que os testes e o corpus usam pelo nome
+BASE_LIGHTS = {
+    "light.sala": "Luz da Sala",
+    "light.quarto": "Luz do Quarto",
+    "light.cozinha": "Luz da Cozinha",
+    "light.escritorio": "Luz do Escritorio",
+    "light.banheiro": "Luz do Banheiro",
+    "light.varanda": "Luz da Varanda",
+    "light.led_sala": "LED Sala",
+    "light.led_cozinha": "LED Cozinha",
+}
+
+_ROOMS = ["sala", "quarto", "cozinha", "escritorio", "banheiro", "varanda",
+          "closet", "lavanderia", "garagem", "corredor", "jardim", "hall"]
+_KINDS = ["Luz", "LED", "Abajur", "Spot", "Fita LED", "Pendente"]
+
+# ---------------- ENTIDADES ----------------
+
+def _state(entity_id: str, state: str, name: str = None, **attributes) -> dict:
+    now = time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime())
+    if name:
+        attributes["friendly_name"] = name
+    return {
+        "entity_id": entity_id,
+        "state": state,
+        "attributes": attributes,
+        "last_changed": now,
+        "last_updated": now,
+    }
+
+
+def make_entities(count: int = 200, seed: int = 0) -> list[dict]:
+    """
+    Estados sinteticos: as luzes de BASE_LIGHTS, os dispositivos de ar
+    de CLIMATE_DEVICES e, ate completar count, luzes e sensores extras
+    com nomes de casa (uma casa real tem bem mais sensores que luzes).
+    """
+    rng = random.Random(seed)
+    states = [_state(eid, "off", name) for eid, name in BASE_LIGHTS.items()]
+
+    for room, cfg in CLIMATE_DEVICES.items():
+        for key, value in cfg.items():
+            if not value:
+                continue
+            entity_id = value[0] if isinstance(value, tuple) else value
+            if any(s["entity_id"] == entity_id for s in states):
+                continue
+            domain = entity_id.split(".", 1)[0]
+            if domain == "input_number":
+                initial = "22.0" if key == "temperature" else "2.0"
+                states.append(_state(entity_id, initial, f"{key} {room}", min=1, max=30, step=1))
+            else:
+                states.append(_state(entity_id, "off", f"{key} {room}"))
+
+    n = 0
+    while len(states) < count:
+        n += 1
+        room = rng.choice(_ROOMS)
+        if rng.random() < 0.3:
+            kind = rng.choice(_KINDS)
+            states.append(_state(f"light.fake_{n}", rng.choice(["on", "off"]), f"{kind} {room.title()} {n}"))
+        else:
+            states.append(_state(
+                f"sensor.fake_{n}", f"{rng.uniform(15, 30):.1f}", f"Temperatura {room.title()} {n}",
+                unit_of_measurement="°C",
+            ))
+    return states
+
+
+# ---------------- SERVIDOR ----------------
+
+class FakeHA:
+    """
+    Estado e comportamento do HA falso (independente do servidor HTTP).
+
+    latency/jitter: atraso por requisicao em segundos (latency +- jitter).
+    error_rate: fracao das requisicoes REST respondidas com 500.
+    token: se definido, exige "Authorization: Bearer <token>" (e no WS).
+    """
+
+    def __init__(self, entities: int = 200, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, token: str = None, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.token = token
+        self._rng = random.Random(seed)
+        self.states = {s["entity_id"]: s for s in make_entities(entities, seed)}
+        self.calls = []          # (domain, service, data) na ordem de chegada
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._subscribers = {}   # ws -> id da assinatura state_changed
+
+    # ---- comportamento ----
+
+    async def _delay(self):
+        delay = self.latency
+        if self.jitter:
+            delay += self._rng.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _authorized(self, request: web.Request) -> bool:
+        return not self.token or request.headers.get("Authorization") == f"Bearer {self.token}"
+
+    def set_state(self, entity_id: str, state: str, **attributes):
+        """Muda um estado e avisa os assinantes do WebSocket."""
+        old = self.states.get(entity_id)
+        new = dict(old) if old else _state(entity_id, state)
+        new["state"] = state
+        new["attributes"] = {**(old or {}).get("attributes", {}), **attributes}
+        new["last_changed"] = new["last_updated"] = time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime())
+        self.states[entity_id] = new
+        self._broadcast(entity_id, old, new)
+
+    def remove(self, entity_id: str):
+        old = self.states.pop(entity_id, None)
+        if old is not None:
+            self._broadcast(entity_id, old, None)
+
+    def _broadcast(self, entity_id: str, old: dict | None, new: dict | None):
+        for ws, sub_id in list(self._subscribers.items()):
+            asyncio.ensure_future(ws.send_json({
+                "id": sub_id,
+                "type": "event",
+                "event": {
+                    "event_type": "state_changed",
+                    "data": {"entity_id": entity_id, "old_state": old, "new_state": new},
+                },
+            }))
+
+    def apply_service(self, domain: str, service: str, data: dict):
+        """Efeito do servico nos estados (o que o Friday le de volta)."""
+        entity_ids = data.get("entity_id", [])
+        if isinstance(entity_ids, str):
+            entity_ids = [entity_ids]
+
+        if domain in ("light", "switch", "homeassistant") and service in ("turn_on", "turn_off"):
+            for entity_id in entity_ids:
+                self.set_state(entity_id, "on" if service == "turn_on" else "off")
+        elif domain == "input_number" and service == "set_value":
+            for entity_id in entity_ids:
+                self.set_state(entity_id, str(float(data.get("value", 0))))
+        elif domain == "script":
+            self.set_state(f"script.{service}", "off")
+
+    # ---- rotas ----
+
+    @web.middleware
+    async def middleware(self, request: web.Request, handler):
+        if request.path == "/api/websocket":
+            return await handler(request)
+
+        self.requests += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await self._delay()
+            if not self._authorized(request):
+                return web.json_response({"message": "Unauthorized"}, status=401)
+            if self.error_rate and self._rng.random() < self.error_rate:
+                self.errors += 1
+                return web.json_response({"message": "Erro injetado"}, status=500)
+            return await handler(request)
+        finally:
+            self.in_flight -= 1
+
+    async def get_states(self, request: web.Request):
+        return web.json_response(list(self.states.values()))
+
+    async def get_state(self, request: web.Request):
+        state = self.states.get(request.match_info["entity_id"])
+        if state is None:
+            return web.json_response({"message": "Entity not found."}, status=404)
+        return web.json_response(state)
+
+    async def call_service(self, request: web.Request):
+        domain = request.match_info["domain"]
+        service = request.match_info["service"]
+        data = (await request.json() if request.can_read_body else None) or {}
+        self.calls.append((domain, service, data))
+        self.apply_service(domain, service, data)
+
+        # Como o HA: devolve os estados que mudaram com a chamada
+        entity_ids = data.get("entity_id", [])
+        if isinstance(entity_ids, str):
+            entity_ids = [entity_ids]
+        return web.json_response([self.states[e] for e in entity_ids if e in self.states])
+
+    async def websocket(self, request: web.Request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        await ws.send_json({"type": "auth_required", "ha_version": "fake"})
+
+        msg = await ws.receive_json()
+        if msg.get("type") != "auth" or (self.token and msg.get("access_token") != self.token):
+            await ws.send_json({"type": "auth_invalid", "message": "Invalid access token"})
+            await ws.close()
+            return ws
+        await ws.send_json({"type": "auth_ok", "ha_version": "fake"})
+
+        try:
+            async for raw in ws:
+                if raw.type != WSMsgType.TEXT:
+                    break
+                msg = raw.json()
+                kind = msg.get("type")
+                if kind == "subscribe_events":
+                    self._subscribers[ws] = msg["id"]
+                    await ws.send_json({"id": msg["id"], "type": "result", "success": True, "result": None})
+                elif kind == "get_states":
+                    await self._delay()
+                    await ws.send_json({
+                        "id": msg["id"], "type": "result", "success": True,
+                        "result": list(self.states.values()),
+                    })
+                else:
+                    await ws.send_json({
+                        "id": msg.get("id"), "type": "result", "success": False,
+                        "error": {"code": "unknown_command", "message": f"Unknown command: {kind}"},
+                    })
+        finally:
+            self._subscribers.pop(ws, None)
+        return ws
+
+    def make_app(self) -> web.Application:
+        app = web.Application(middlewares=[self.middleware])
+        app.router.add_get("/api/states", self.get_states)
+        app.router.add_get("/api/states/{entity_id}", self.get_state)
+        app.router.add_post("/api/services/{domain}/{service}", self.call_service)
+        app.router.add_get("/api/websocket", self.websocket)
+        return app
+
+
+class FakeHAServer:
+    """
+    Sobe um FakeHA numa thread com event loop proprio (testes e scripts
+    sincronos). port=0 escolhe uma porta livre; url fica disponivel apos
+    start().
+
+        with FakeHAServer(FakeHA(entities=500, latency=0.02)) as server:
+            HAClient(base_url=server.url).get("/api/states")
+    """
+
+    def __init__(self, fake: FakeHA = None, host: str = "127.0.0.1", port: int = 0):
+        self.fake = fake or FakeHA()
+        self.host = host
+        self.port = port
+        self.url = None
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    def start(self) -> "FakeHAServer":
+        ready = threading.Event()
+        self._loop = asyncio.new_event_loop()
+
+        async def serve():
+            # Sem esperar clientes keep-alive ao parar (ex: o Friday em teste)
+            self._runner = web.AppRunner(self.fake.make_app(), shutdown_timeout=1.0)
+            await self._runner.setup()
+            site = web.TCPSite(self._runner, self.host, self.port)
+            await site.start()
+            self.port = site._server.sockets[0].getsockname()[1]
+            self.url = f"http://{self.host}:{self.port}"
+            ready.set()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(serve())
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="fake-ha", daemon=True)
+        self._thread.start()
+        if not ready.wait(5):
+            raise RuntimeError("FakeHA nao subiu")
+        return self
+
+    def call(self, fn, *args, **kwargs):
+        """Executa fn(*args) no loop do servidor (ex: fake.set_state com WS)."""
+        async def run():
+            return fn(*args, **kwargs)
+        return asyncio.run_coroutine_threadsafe(run(), self._loop).result(5)
+
+    def stop(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result(10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+        self._loop.close()
+        self._loop = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Home Assistant falso (REST + WebSocket)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8123)
+    parser.add_argument("--entities", type=int, default=200, help="quantidade de entidades (padrao: 200)")
+    parser.add_argument("--latency", type=float, default=0.0, help="atraso por requisicao em segundos")
+    parser.add_argument("--jitter", type=float, default=0.0, help="variacao do atraso (+-) em segundos")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fracao de respostas 500 (0..1)")
+    parser.add_argument("--token", default=None, help="token exigido (padrao: aceita qualquer um)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    fake = FakeHA(entities=args.entities, latency=args.latency, jitter=args.jitter,
+                  error_rate=args.error_rate, token=args.token, seed=args.seed)
+    print(
+        f"FakeHA em http://{args.host}:{args.port} | {len(fake.states)} entidades | "
+        f"latencia {args.latency * 1000:.0f}+-{args.jitter * 1000:.0f} ms | erros {args.error_rate:.1%}"
+    )
+    web.run_app(fake.make_app(), host=args.host, port=args.port, print=None)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,512 @@
+"""
+Teste de carga de ponta a ponta do POST /command.
+
+Dispara uma mistura ponderada de frases reais numa taxa de chegada alvo,
+em malha aberta: cada comando sai no horario agendado, sem esperar as
+respostas anteriores, e a latencia conta a partir do horario agendado
+(um servidor lento nao "freia" a carga nem esconde a fila).
+
+Sem --url, sobe no proprio processo o servidor do Friday (uvicorn, porta
+livre) apontado para o HA falso de tools/fake_ha e mede tambem a
+saturacao do worker: atraso do event loop, pool de threads do servidor
+e concorrencia com o HA.
+
+A mistura e um JSONL com "text" e "weight" opcional (um corpus do
+eval_corpus serve) ou um .txt com uma frase por linha.
+
+Uso:
+    python -m tools.loadtest --rate 100 --duration 30
+    python -m tools.loadtest --rate 200 --ha-latency 0.03 --ha-jitter 0.01 --save loadtest.jsonl
+    python -m tools.loadtest --rate 200 --compare loadtest.jsonl --max-p99 250
+    python -m tools.loadtest --url http://localhost:8000 --mix frases.jsonl --rate 50
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import subprocess
+import sys
+import threading
+import time
+
+import aiohttp
+
+# Frases e pesos aproximados do uso real (luzes dominam)
+DEFAULT_MIX = [
+    ("ligar luz da sala", 20),
+    ("apagar luz da cozinha", 15),
+    ("desligar luz do quarto", 15),
+    ("ligar luz do escritorio", 8),
+    ("apagar todas as luzes", 5),
+    ("ligar luz do quarto e desligar luz da cozinha", 5),
+    ("ligar ar do quarto", 8),
+    ("desligar ar do quarto", 6),
+    ("colocar o ar do quarto em 22 graus", 6),
+    ("aumentar a velocidade do ar do quarto", 3),
+    ("ligar ventilador do quarto", 3),
+    ("ligar luz da sala e ligar ar do quarto", 4),
+    ("desligar o ar e a luz da sala", 2),
+]
+
+PERCENTILES = (50, 90, 95, 99, 99.9)
+
+# Respostas 200 que na verdade sao falha de execucao (ex: trecho composto)
+FAILED_MESSAGES = ("Falha ao executar comando.",)
+
+SAMPLE_INTERVAL = 0.01  # segundos entre amostras de saturacao
+
+# ---------------- CARGA ----------------
+
+def load_mix(path: str) -> list[tuple[str, float]]:
+    """[(frase, peso)] de um JSONL (text/weight) ou de um .txt (peso 1)."""
+    mix = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if not line.startswith("{"):
+                mix.append((line, 1.0))
+                continue
+            case = json.loads(line)
+            if "text" not in case:
+                raise ValueError(f"{path}:{line_no}: linha sem 'text'")
+            mix.append((case["text"], float(case.get("weight", 1.0))))
+    if not mix:
+        raise ValueError(f"{path}: mistura vazia")
+    return mix
+
+
+def arrival_schedule(rate: float, duration: float, seed: int = 0,
+                     poisson: bool = True) -> list[float]:
+    """
+    Instantes de envio (segundos desde o inicio) para a taxa dada.
+
+    poisson: intervalos exponenciais (chegadas independentes, como
+    pessoas falando); senao intervalos fixos de 1/rate.
+    """
+    rng = random.Random(seed)
+    times = []
+    t = 0.0
+    while True:
+        t += rng.expovariate(rate) if poisson else 1.0 / rate
+        if t >= duration:
+            return times
+        times.append(t)
+
+
+def percentile(values: list[float], p: float) -> float | None:
+    """Percentil p (0..100) por posicao mais proxima; values ja ordenado."""
+    if not values:
+        return None
+    index = max(math.ceil(p / 100 * len(values)) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+async def run_load(url: str, mix: list[tuple[str, float]], rate: float, duration: float,
+                   seed: int = 0, poisson: bool = True, timeout: float = 10.0,
+                   max_outstanding: int = 1000) -> dict:
+    """
+    Envia a carga contra url (base do Friday) e devolve as amostras brutas.
+
+    Com max_outstanding comandos sem resposta, os proximos sao descartados
+    (contados em dropped) para o gerador nao crescer sem limite.
+    """
+    schedule = arrival_schedule(rate, duration, seed, poisson)
+    rng = random.Random(seed)
+    texts = rng.choices([t for t, _ in mix], weights=[w for _, w in mix], k=len(schedule))
+
+    samples = []       # (latencia desde o agendado, status)
+    client_lag = []    # atraso do proprio gerador em relacao a agenda
+    dropped = 0
+    outstanding = 0
+
+    connector = aiohttp.TCPConnector(limit=max_outstanding)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+
+        async def fire(i: int, text: str, scheduled: float):
+            nonlocal outstanding
+            # Sessao propria: uma confirmacao pendente nao vaza para outro comando
+            payload = {"text": text, "session": f"load-{i}"}
+            try:
+                async with session.post(f"{url}/command", json=payload) as r:
+                    body = await r.json(content_type=None) if r.status == 200 else None
+                    status = r.status
+                    if body and body.get("response", {}).get("message") in FAILED_MESSAGES:
+                        status = "failed"
+            except asyncio.TimeoutError:
+                status = "timeout"
+            except aiohttp.ClientError:
+                status = "transport"
+            finally:
+                outstanding -= 1
+            samples.append((time.perf_counter() - scheduled, status))
+
+        loop = asyncio.get_running_loop()
+        tasks = []
+        started = time.perf_counter()
+        for i, (offset, text) in enumerate(zip(schedule, texts)):
+            scheduled = started + offset
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            client_lag.append(time.perf_counter() - scheduled)
+
+            if outstanding >= max_outstanding:
+                dropped += 1
+                continue
+            outstanding += 1
+            tasks.append(loop.create_task(fire(i, text, scheduled)))
+
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    return {
+        "samples": samples,
+        "sent": len(tasks),
+        "dropped": dropped,
+        "elapsed": elapsed,
+        "duration": duration,
+        "client_lag_max": max(client_lag, default=0.0),
+    }
+
+
+def summarize(raw: dict) -> dict:
+    """Vazao, percentis de latencia (ms) e erros por tipo."""
+    latencies = sorted(lat for lat, _ in raw["samples"])
+    errors = {}
+    ok = 0
+    for _, status in raw["samples"]:
+        if status == 200:
+            ok += 1
+        else:
+            key = status if isinstance(status, str) else f"http_{status}"
+            errors[key] = errors.get(key, 0) + 1
+
+    completed = len(raw["samples"])
+    latency_ms = {f"p{p:g}": _ms(percentile(latencies, p)) for p in PERCENTILES}
+    latency_ms["max"] = _ms(latencies[-1] if latencies else None)
+    latency_ms["mean"] = _ms(sum(latencies) / completed if completed else None)
+
+    failed = completed - ok + raw["dropped"]
+    return {
+        "sent": raw["sent"],
+        "completed": completed,
+        "ok": ok,
+        "dropped": raw["dropped"],
+        "errors": errors,
+        "error_rate": failed / (completed + raw["dropped"]) if completed + raw["dropped"] else 0.0,
+        "offered_rate": (raw["sent"] + raw["dropped"]) / raw["duration"],
+        "throughput": ok / raw["elapsed"] if raw["elapsed"] > 0 else 0.0,
+        "elapsed": round(raw["elapsed"], 3),
+        "latency_ms": latency_ms,
+        "client_lag_ms_max": _ms(raw["client_lag_max"]),
+    }
+
+
+def _ms(seconds: float | None) -> float | None:
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+# ---------------- SERVIDOR NO PROCESSO ----------------
+
+class InProcessServer:
+    """
+    Friday (uvicorn numa thread, porta livre) ligado a um FakeHAServer.
+
+    Enquanto roda, amostra no event loop do servidor o atraso do loop,
+    a ocupacao do pool de threads (anyio, usado pelo Starlette) e as
+    requisicoes em andamento do AsyncHAClient contra max_concurrency.
+    """
+
+    def __init__(self, fake=None, state_mirror: bool = True):
+        from tools.fake_ha import FakeHA, FakeHAServer
+
+        self.ha = FakeHAServer(fake or FakeHA())
+        self.state_mirror = state_mirror
+        self.url = None
+        self._server = None
+        self._thread = None
+        self._saved = None
+        self._samples = []   # (atraso do loop, ha em andamento, threads ocupadas)
+        self._thread_limit = None
+
+    def start(self) -> "InProcessServer":
+        import uvicorn
+
+        from core import ha_client
+        from stt import server
+
+        self.ha.start()
+        self._saved = (ha_client.HA_URL, ha_client.client.base_url,
+                       ha_client.async_client.base_url, server.STATE_MIRROR_ENABLED)
+        ha_client.HA_URL = self.ha.url
+        ha_client.client.base_url = self.ha.url
+        ha_client.async_client.base_url = self.ha.url
+        server.STATE_MIRROR_ENABLED = self.state_mirror
+
+        config = uvicorn.Config(server.app, host="127.0.0.1", port=0, log_level="warning",
+                                lifespan="on", timeout_graceful_shutdown=5)
+        self._server = uvicorn.Server(config)
+
+        async def serve():
+            sampler = asyncio.create_task(self._sample())
+            try:
+                await self._server.serve()
+            finally:
+                sampler.cancel()
+
+        self._thread = threading.Thread(target=lambda: asyncio.run(serve()),
+                                        name="loadtest-server", daemon=True)
+        self._thread.start()
+
+        deadline = time.monotonic() + 15
+        while not self._server.started:
+            if not self._thread.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError("servidor do Friday nao subiu")
+            time.sleep(0.01)
+        port = self._server.servers[0].sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        return self
+
+    async def _sample(self):
+        import anyio.to_thread
+
+        from core import ha_client
+
+        loop = asyncio.get_running_loop()
+        limiter = anyio.to_thread.current_default_thread_limiter()
+        self._thread_limit = limiter.total_tokens
+        while True:
+            expected = loop.time() + SAMPLE_INTERVAL
+            await asyncio.sleep(SAMPLE_INTERVAL)
+            self._samples.append((
+                max(loop.time() - expected, 0.0),
+                ha_client.async_client.stats()["in_flight"],
+                limiter.borrowed_tokens,
+            ))
+
+    def reset(self):
+        """Descarta as amostras (ex: depois do aquecimento)."""
+        self._samples = []
+        self.ha.fake.peak_in_flight = self.ha.fake.in_flight
+
+    def saturation(self) -> dict:
+        from core import ha_client
+
+        samples = list(self._samples)
+        lags = sorted(s[0] for s in samples)
+        in_flight = [s[1] for s in samples]
+        threads = [s[2] for s in samples]
+        max_concurrency = ha_client.async_client.max_concurrency
+        n = len(samples) or 1
+        return {
+            "samples": len(samples),
+            "loop_lag_ms": {
+                "p50": _ms(percentile(lags, 50)),
+                "p99": _ms(percentile(lags, 99)),
+                "max": _ms(lags[-1] if lags else None),
+            },
+            "threadpool_size": self._thread_limit,
+            "threadpool_peak": max(threads, default=0),
+            "threadpool_saturated": sum(t >= self._thread_limit for t in threads) / n
+            if self._thread_limit else 0.0,
+            "ha_rate_limit": ha_client.async_client.rate_limit,
+            "ha_max_concurrency": max_concurrency,
+            "ha_in_flight_peak": max(in_flight, default=0),
+            "ha_saturated": sum(f >= max_concurrency for f in in_flight) / n,
+            "fake_ha_peak_in_flight": self.ha.fake.peak_in_flight,
+        }
+
+    def stop(self):
+        if self._server is None:
+            return
+        from core import ha_client
+        from stt import server
+
+        self._server.should_exit = True
+        self._thread.join(15)
+        self.ha.stop()
+        (ha_client.HA_URL, ha_client.client.base_url,
+         ha_client.async_client.base_url, server.STATE_MIRROR_ENABLED) = self._saved
+        self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+
+def run_loadtest(rate: float, duration: float, mix: list[tuple[str, float]] = None,
+                 url: str = None, warmup: float = 0.0, fake=None, state_mirror: bool = True,
+                 **load_kwargs) -> dict:
+    """
+    Roda o teste completo e devolve o resultado (o mesmo gravado por --save).
+
+    Sem url, sobe o servidor no processo contra o HA falso (fake, um
+    tools.fake_ha.FakeHA) e inclui "saturation" no resultado.
+    """
+    mix = mix or DEFAULT_MIX
+    server = None if url else InProcessServer(fake, state_mirror=state_mirror).start()
+    try:
+        target = url or server.url
+        if warmup > 0:
+            asyncio.run(run_load(target, mix, rate, warmup, seed=load_kwargs.get("seed", 0) + 1,
+                                 **{k: v for k, v in load_kwargs.items() if k != "seed"}))
+            if server:
+                server.reset()
+        result = summarize(asyncio.run(run_load(target, mix, rate, duration, **load_kwargs)))
+        if server:
+            result["saturation"] = server.saturation()
+    finally:
+        if server:
+            server.stop()
+
+    result["target"] = url or "in-process"
+    result["config"] = {"rate": rate, "duration": duration, "warmup": warmup, "mix": len(mix), **load_kwargs}
+    if fake is not None:
+        result["config"]["fake_ha"] = {
+            "entities": len(fake.states), "latency": fake.latency,
+            "jitter": fake.jitter, "error_rate": fake.error_rate,
+        }
+    return result
+
+
+# ---------------- RESULTADOS ----------------
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                             capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def save_result(path: str, result: dict):
+    """Acrescenta o resultado (com commit e horario) ao historico JSONL."""
+    record = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": _git_commit(), **result}
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def load_baseline(path: str) -> dict | None:
+    """Ultimo resultado gravado no historico JSONL (None se vazio)."""
+    last = None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                last = json.loads(line)
+    return last
+
+
+def compare(current: dict, baseline: dict) -> list[str]:
+    """Linhas 'metrica: antes -> agora (variacao)' das metricas principais."""
+    rows = [("vazao (cmd/s)", "throughput"), ("erros", "error_rate")]
+    rows += [(f"{k} (ms)", ("latency_ms", k)) for k in ("p50", "p95", "p99", "max")]
+
+    def get(result, key):
+        if isinstance(key, tuple):
+            return (result.get(key[0]) or {}).get(key[1])
+        return result.get(key)
+
+    lines = []
+    for label, key in rows:
+        before, now = get(baseline, key), get(current, key)
+        if before is None or now is None:
+            continue
+        change = f"{(now - before) / before:+.1%}" if before else "n/a"
+        lines.append(f"  {label:<15} {before:>10.3f} -> {now:>10.3f}  ({change})")
+    return lines
+
+
+def format_report(result: dict) -> list[str]:
+    lat = result["latency_ms"]
+    lines = [
+        f"Alvo: {result['target']} | oferecido {result['offered_rate']:.1f} cmd/s | "
+        f"vazao {result['throughput']:.1f} cmd/s",
+        f"Enviados {result['sent']} | ok {result['ok']} | descartados {result['dropped']} | "
+        f"erros {result['error_rate']:.2%} {result['errors'] or ''}".rstrip(),
+        "Latencia (ms): " + " | ".join(f"{k} {v:.1f}" for k, v in lat.items() if v is not None),
+        f"Atraso do gerador: max {result['client_lag_ms_max']:.1f} ms",
+    ]
+    sat = result.get("saturation")
+    if sat:
+        loop_lag = sat["loop_lag_ms"]
+        lines.append(
+            f"Event loop: atraso p50 {loop_lag['p50'] or 0:.1f} / p99 {loop_lag['p99'] or 0:.1f} / "
+            f"max {loop_lag['max'] or 0:.1f} ms"
+        )
+        lines.append(
+            f"Pool de threads: pico {sat['threadpool_peak']}/{sat['threadpool_size']} "
+            f"(cheio {sat['threadpool_saturated']:.1%} do tempo)"
+        )
+        lines.append(
+            f"HA: pico {sat['ha_in_flight_peak']}/{sat['ha_max_concurrency']} em andamento "
+            f"(no limite {sat['ha_saturated']:.1%} do tempo) | "
+            + (f"rate limit {sat['ha_rate_limit']:g} req/s" if sat["ha_rate_limit"] else "sem rate limit")
+        )
+    return lines
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Teste de carga em malha aberta do POST /command")
+    parser.add_argument("--url", help="Friday ja rodando (padrao: sobe no processo contra o HA falso)")
+    parser.add_argument("--rate", type=float, default=50, help="comandos por segundo (padrao: 50)")
+    parser.add_argument("--duration", type=float, default=10, help="segundos de carga medida (padrao: 10)")
+    parser.add_argument("--warmup", type=float, default=2, help="segundos de aquecimento descartados (padrao: 2)")
+    parser.add_argument("--mix", help="JSONL com text/weight ou .txt com uma frase por linha")
+    parser.add_argument("--arrival", choices=["poisson", "uniform"], default="poisson")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=10, help="timeout por comando em segundos")
+    parser.add_argument("--max-outstanding", type=int, default=1000,
+                        help="comandos sem resposta antes de descartar os proximos")
+    parser.add_argument("--entities", type=int, default=200, help="entidades do HA falso")
+    parser.add_argument("--ha-latency", type=float, default=0.0, help="latencia do HA falso em segundos")
+    parser.add_argument("--ha-jitter", type=float, default=0.0, help="jitter do HA falso em segundos")
+    parser.add_argument("--ha-error-rate", type=float, default=0.0, help="fracao de erros 500 do HA falso")
+    parser.add_argument("--no-mirror", action="store_true", help="sem espelho WebSocket (consulta a API REST)")
+    parser.add_argument("--save", metavar="FILE", help="acrescenta o resultado ao historico JSONL")
+    parser.add_argument("--compare", metavar="FILE", help="compara com o ultimo resultado do historico")
+    parser.add_argument("--max-p99", type=float, help="sai com codigo 1 se o p99 (ms) passar disso")
+    parser.add_argument("--max-error-rate", type=float, help="sai com codigo 1 se a taxa de erros passar disso")
+    parser.add_argument("--json", action="store_true", help="imprime o resultado em JSON")
+    args = parser.parse_args(argv)
+
+    fake = None
+    if not args.url:
+        from tools.fake_ha import FakeHA
+        fake = FakeHA(entities=args.entities, latency=args.ha_latency, jitter=args.ha_jitter,
+                      error_rate=args.ha_error_rate, seed=args.seed)
+
+    baseline = load_baseline(args.compare) if args.compare else None
+    result = run_loadtest(
+        args.rate, args.duration, mix=load_mix(args.mix) if args.mix else None, url=args.url,
+        warmup=args.warmup, fake=fake, state_mirror=not args.no_mirror, seed=args.seed,
+        poisson=args.arrival == "poisson", timeout=args.timeout, max_outstanding=args.max_outstanding,
+    )
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        print("\n".join(format_report(result)))
+    if baseline:
+        print(f"Comparado com {baseline.get('commit') or '?'} ({baseline.get('timestamp', '?')}):")
+        print("\n".join(compare(result, baseline)))
+    if args.save:
+        save_result(args.save, result)
+
+    p99 = result["latency_ms"]["p99"]
+    if args.max_p99 is not None and (p99 is None or p99 > args.max_p99):
+        return 1
+    if args.max_error_rate is not None and result["error_rate"] > args.max_error_rate:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,458 @@
+"""
+Reconstroi perfis de latencia a partir dos logs do Friday.
+
+Le os arquivos em streaming (linha a linha, inclusive rotacionados e
+.gz), junta as linhas de cada comando num trace (COMANDO -> Intent
+parseada -> Despachando -> API [...] -> ACAO -> Resposta) e agrega em
+histogramas, sem guardar as linhas:
+
+- latencia por intent (domain.intent, "unknown" quando o parser nao
+  entendeu), do COMANDO ate a Resposta;
+- latencia por servico do HA, de "Chamando servico" (DEBUG) ate a linha
+  API [...]; sem ela, desde a linha anterior do mesmo comando;
+- entidades mais lentas (entity_id do "Chamando servico"; scripts do ar
+  contam como script.<nome>), pela latencia das chamadas que as envolvem;
+- timeouts e erros por servico.
+
+Aceita o formato texto (logs/friday.log*) e o JSON (LOG_FILE_FORMAT=json,
+logs/friday.jsonl*). Logs antigos, sem milissegundos, tem resolucao de
+1 s (o relatorio avisa). Sem id de requisicao no log, comandos
+sobrepostos sao atribuidos pelo dominio e contados em "sobrepostos".
+
+--corpus grava as frases reais com a frequencia (text/weight), no formato
+de --mix do tools.loadtest.
+
+Uso:
+    python -m tools.log_replay
+    python -m tools.log_replay logs/friday.log* --top 20
+    python -m tools.log_replay logs/friday.log* --json perfil.json --corpus frases.jsonl
+"""
+import argparse
+import glob
+import gzip
+import json
+import re
+import sys
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import urlparse
+
+from core.ha_client import service_label
+from utils.metrics import Histogram, QUANTILES
+
+DEFAULT_LOGS = "logs/friday.log*"
+
+# Trace sem Resposta (ex: excecao -> HTTP 500) e encerrado apos esse tempo
+# sem linhas novas
+STALE_AFTER = 60.0
+
+_TEXT_LINE = re.compile(
+    r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)(?:[.,](\d{3}))? \| (\w+)\s*\| (\S+?)\s*\| (.*)$"
+)
+
+# friday.log.2026-01-01 (TimedRotatingFileHandler) / friday.log.3 (RotatingFileHandler)
+_ROTATED = re.compile(r"^(.+?\.(?:log|jsonl))\.(.+)$")
+_DATE_SUFFIX = re.compile(r"\d{4}-\d\d-\d\d(_\d\d(-\d\d){0,2})?")
+
+_COMMAND = re.compile(r"^COMANDO: '(.*)'(?: >> Intent: (\S+) \| Domain: (\S+))?$")
+_INTENT = re.compile(r"^Intent parseada: (\S+) \| Domain: (\S+)")
+_DISPATCH = re.compile(r"^Despachando: ([^.\s]+)\.(\S+)")
+_CALLING = re.compile(r"^Chamando servico: (\S+?)\.(\S+) \| Data: (.*)$")
+_DATA_ENTITIES = re.compile(r"""['"]entity_id['"]: (\[[^\]]*\]|'[^']*'|"[^"]*")""")
+_ENTITY_ID = re.compile(r"""['"]([a-z_]+\.[^'"]+)['"]""")
+_API = re.compile(r"^API \[(\w+)\] (\S+) (?:-> Status (\d+)|\*\* ERRO: (.*))$")
+_ACTION = re.compile(r"^ACAO \[(\w+)\] (\S+)(?: -> (.*))?$")
+_RESPONSE = re.compile(r"^Resposta: (.*)$")
+
+# ---------------- LEITURA ----------------
+
+def log_files(patterns: list[str]) -> list[str]:
+    """
+    Arquivos dos padroes, do mais antigo ao mais novo.
+
+    friday.log.2026-01-01 (rotacao diaria) vem pela data; friday.log.3
+    (por tamanho) vem antes de friday.log.1; o arquivo atual vem por ultimo.
+    """
+    paths = set()
+    for pattern in patterns:
+        matches = glob.glob(pattern)
+        paths.update(matches if matches else [pattern])
+
+    def order(path: str):
+        name = Path(path).name.removesuffix(".gz")
+        match = _ROTATED.match(name)
+        base, suffix = match.groups() if match else (name, None)
+        if suffix and _DATE_SUFFIX.fullmatch(suffix):
+            return (base, 0, 0, suffix)
+        if suffix and suffix.isdigit():
+            return (base, 1, -int(suffix), "")
+        return (base, 2, 0, name)
+
+    return sorted(paths, key=order)
+
+
+def _open(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, "r", encoding="utf-8", errors="replace")
+
+
+class LineReader:
+    """Linhas (ts, level, logger, msg) dos arquivos, em streaming."""
+
+    def __init__(self):
+        self.lines = 0
+        self.records = 0
+        self.second_resolution = False
+        self._last_second = None
+        self._last_epoch = None
+
+    def _epoch(self, second: str) -> float:
+        # Linhas seguidas quase sempre caem no mesmo segundo
+        if second != self._last_second:
+            self._last_epoch = datetime.strptime(second, "%Y-%m-%d %H:%M:%S").timestamp()
+            self._last_second = second
+        return self._last_epoch
+
+    def parse(self, line: str):
+        """(ts, level, logger, msg) ou None (continuacao, banner, lixo)."""
+        if line.startswith("{"):
+            try:
+                entry = json.loads(line)
+                return float(entry["ts"]), entry["level"], entry["logger"], entry["msg"]
+            except (ValueError, KeyError, TypeError):
+                return None
+
+        match = _TEXT_LINE.match(line)
+        if match is None:
+            return None
+        second, millis, level, logger, msg = match.groups()
+        if millis is None:
+            self.second_resolution = True
+            ts = self._epoch(second)
+        else:
+            ts = self._epoch(second) + int(millis) / 1000
+        return ts, level, logger, msg
+
+    def read(self, paths: list[str]):
+        for path in paths:
+            with _open(path) as f:
+                for line in f:
+                    self.lines += 1
+                    record = self.parse(line.rstrip("\n"))
+                    if record is not None:
+                        self.records += 1
+                        yield record
+
+
+# ---------------- TRACES ----------------
+
+class Trace:
+    __slots__ = ("text", "start", "last", "domain", "intent",
+                 "pending", "overlapped", "failed")
+
+    def __init__(self, text: str, ts: float, overlapped: bool):
+        self.text = text
+        self.start = ts
+        self.last = ts
+        self.domain = None
+        self.intent = None
+        self.pending = {}    # servico -> [(ts de "Chamando servico", entity_ids)]
+        self.overlapped = overlapped
+        self.failed = False
+
+
+class Profile:
+    """Agrega os traces em histogramas (memoria nao cresce com o log)."""
+
+    def __init__(self, stale_after: float = STALE_AFTER):
+        self.stale_after = stale_after
+        self.commands = Histogram("replay_command_seconds", "Latencia por intent")
+        self.services = Histogram("replay_service_seconds", "Latencia por servico do HA")
+        self.entities = Histogram("replay_entity_seconds", "Latencia por entidade")
+        self.max = {}           # (tipo, nome) -> maior latencia
+        self.timeouts = {}      # servico -> contagem
+        self.errors = {}        # servico -> contagem
+        self.utterances = {}    # frase -> contagem
+        self.completed = 0
+        self.incomplete = 0
+        self.overlapped = 0
+        self.first_ts = None
+        self.last_ts = None
+        self._open = []
+
+    # ---- entrada ----
+
+    def feed(self, ts: float, level: str, logger: str, msg: str):
+        if self.first_ts is None:
+            self.first_ts = ts
+        self.last_ts = ts
+        self._expire(ts)
+
+        match = _COMMAND.match(msg)
+        if match:
+            text, intent, domain = match.groups()
+            trace = Trace(text, ts, overlapped=bool(self._open))
+            if trace.overlapped:
+                for other in self._open:
+                    other.overlapped = True
+            trace.intent, trace.domain = intent, domain
+            self._open.append(trace)
+            self.utterances[text] = self.utterances.get(text, 0) + 1
+            return
+
+        if not self._open:
+            return
+
+        match = _INTENT.match(msg)
+        if match:
+            # Logada logo depois do COMANDO, sem await no meio
+            trace = next((t for t in reversed(self._open) if t.intent is None), self._open[-1])
+            trace.intent, trace.domain = match.groups()
+            trace.last = ts
+            return
+
+        match = _RESPONSE.match(msg)
+        if match:
+            self._close(self._open.pop(0), ts)
+            return
+
+        match = _CALLING.match(msg)
+        if match:
+            domain, service, data = match.groups()
+            trace = self._trace_for(domain)
+            trace.pending.setdefault(f"{domain}.{service}", []).append((ts, _entities(domain, service, data)))
+            trace.last = ts
+            return
+
+        match = _API.match(msg)
+        if match:
+            self._api(ts, *match.groups())
+            return
+
+        match = _ACTION.match(msg)
+        if match:
+            trace = self._trace_for(match.group(1))
+            trace.last = ts
+            return
+
+        match = _DISPATCH.match(msg)
+        if match:
+            trace = self._trace_for(match.group(1))
+            trace.last = ts
+            return
+
+        if level in ("ERROR", "CRITICAL"):
+            trace = self._open[-1] if len(self._open) == 1 else None
+            if trace is not None:
+                trace.failed = True
+
+    def _trace_for(self, domain: str) -> Trace:
+        # Sobrepostos: o mais novo do mesmo dominio (compostos aceitam todos)
+        if len(self._open) == 1:
+            return self._open[0]
+        for trace in reversed(self._open):
+            if trace.domain in (domain, "compound"):
+                return trace
+        return self._open[-1]
+
+    def _api(self, ts: float, method: str, url: str, status: str, error: str):
+        path = urlparse(url).path
+        service = service_label(method, path)
+        domain = service.split(".", 1)[0] if "." in service else None
+        trace = self._trace_for(domain) if domain else self._open[-1]
+
+        started = trace.pending.get(service)
+        start, entity_ids = started.pop(0) if started else (trace.last, ())
+        elapsed = max(ts - start, 0.0)
+        self._observe(self.services, "service", service, elapsed)
+        for entity_id in entity_ids:
+            self._observe(self.entities, "entity", entity_id, elapsed)
+        trace.last = ts
+
+        if error is not None:
+            trace.failed = True
+            counter = self.timeouts if error.startswith("Timeout") else self.errors
+            counter[service] = counter.get(service, 0) + 1
+        elif status and int(status) >= 500:
+            trace.failed = True
+            self.errors[service] = self.errors.get(service, 0) + 1
+
+    def _close(self, trace: Trace, ts: float, complete: bool = True):
+        elapsed = max(ts - trace.start, 0.0)
+        if complete:
+            self.completed += 1
+            name = f"{trace.domain}.{trace.intent}" if trace.intent not in (None, "None") else "unknown"
+            self._observe(self.commands, "intent", name, elapsed)
+        else:
+            self.incomplete += 1
+        if trace.overlapped:
+            self.overlapped += 1
+
+    def _expire(self, now: float):
+        while self._open and now - self._open[0].last > self.stale_after:
+            trace = self._open.pop(0)
+            self._close(trace, trace.last, complete=False)
+
+    def finish(self):
+        """Encerra os traces ainda abertos no fim do log."""
+        while self._open:
+            trace = self._open.pop(0)
+            self._close(trace, trace.last, complete=False)
+
+    def _observe(self, histogram: Histogram, kind: str, name: str, seconds: float):
+        histogram.observe(seconds, name=name)
+        key = (kind, name)
+        if seconds > self.max.get(key, -1.0):
+            self.max[key] = seconds
+
+    # ---- saida ----
+
+    def _rows(self, histogram: Histogram, kind: str) -> list[dict]:
+        rows = []
+        for (kind_, name), worst in self.max.items():
+            if kind_ != kind:
+                continue
+            row = {"name": name, "count": histogram.count(name=name), "max_ms": _ms(worst)}
+            for q in QUANTILES:
+                # Interpolado no bucket: nunca acima do maior valor visto
+                row[f"p{int(q * 100)}_ms"] = _ms(min(histogram.quantile(q, name=name), worst))
+            rows.append(row)
+        return rows
+
+    def report(self, top: int = 10) -> dict:
+        intents = sorted(self._rows(self.commands, "intent"), key=lambda r: -r["count"])
+        services = self._rows(self.services, "service")
+        for row in services:
+            row["timeouts"] = self.timeouts.get(row["name"], 0)
+            row["errors"] = self.errors.get(row["name"], 0)
+        services.sort(key=lambda r: -r["count"])
+        entities = sorted(self._rows(self.entities, "entity"), key=lambda r: -(r["p95_ms"] or 0))
+
+        return {
+            "commands": self.completed + self.incomplete,
+            "completed": self.completed,
+            "incomplete": self.incomplete,
+            "overlapped": self.overlapped,
+            "timeouts": sum(self.timeouts.values()),
+            "errors": sum(self.errors.values()),
+            "first_ts": self.first_ts,
+            "last_ts": self.last_ts,
+            "intents": intents,
+            "services": services,
+            "slowest_entities": entities[:top],
+        }
+
+    def corpus(self) -> list[dict]:
+        """Frases reais com a frequencia, da mais comum para a menos."""
+        ranked = sorted(self.utterances.items(), key=lambda item: (-item[1], item[0]))
+        return [{"text": text, "weight": count} for text, count in ranked]
+
+
+def _entities(domain: str, service: str, data: str) -> list[str]:
+    """entity_ids do Data de "Chamando servico" (repr de dict); script sem alvo e a propria entidade."""
+    match = _DATA_ENTITIES.search(data)
+    if match:
+        return _ENTITY_ID.findall(match.group(1))
+    if domain == "script":
+        return [f"script.{service}"]
+    return []
+
+
+def _ms(seconds: float | None) -> float | None:
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def replay(paths: list[str], stale_after: float = STALE_AFTER) -> tuple[Profile, LineReader]:
+    """Le os arquivos em ordem e devolve o perfil agregado."""
+    reader = LineReader()
+    profile = Profile(stale_after)
+    for record in reader.read(paths):
+        profile.feed(*record)
+    profile.finish()
+    return profile, reader
+
+
+# ---------------- RELATORIO ----------------
+
+def _table(rows: list[dict], columns: list[tuple[str, str]]) -> list[str]:
+    widths = [max([len(title)] + [len(_cell(r.get(key))) for r in rows]) for title, key in columns]
+    lines = ["  " + "  ".join(title.ljust(w) if i == 0 else title.rjust(w)
+                              for i, ((title, _), w) in enumerate(zip(columns, widths)))]
+    for row in rows:
+        lines.append("  " + "  ".join(_cell(row.get(key)).ljust(w) if i == 0 else _cell(row.get(key)).rjust(w)
+                                      for i, ((_, key), w) in enumerate(zip(columns, widths))))
+    return lines
+
+
+def _cell(value) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.1f}"
+    return str(value)
+
+
+def format_report(report: dict, reader: LineReader, files: list[str]) -> list[str]:
+    span = ""
+    if report["first_ts"] is not None:
+        first = datetime.fromtimestamp(report["first_ts"]).strftime("%Y-%m-%d %H:%M")
+        last = datetime.fromtimestamp(report["last_ts"]).strftime("%Y-%m-%d %H:%M")
+        span = f" | {first} -> {last}"
+    lines = [
+        f"{len(files)} arquivo(s), {reader.lines} linha(s){span}",
+        f"Comandos: {report['commands']} | completos {report['completed']} | "
+        f"sem resposta {report['incomplete']} | sobrepostos {report['overlapped']} | "
+        f"timeouts {report['timeouts']} | erros {report['errors']}",
+    ]
+    if reader.second_resolution:
+        lines.append("AVISO: linhas sem milissegundos; latencias com resolucao de 1 s")
+
+    latency = [("p50 ms", "p50_ms"), ("p95 ms", "p95_ms"), ("p99 ms", "p99_ms"), ("max ms", "max_ms")]
+    lines += ["", "Latencia por intent:"]
+    lines += _table(report["intents"], [("intent", "name"), ("n", "count")] + latency)
+    lines += ["", "Servicos do HA:"]
+    lines += _table(report["services"], [("servico", "name"), ("n", "count")] + latency
+                    + [("timeouts", "timeouts"), ("erros", "errors")])
+    lines += ["", "Entidades mais lentas (p95):"]
+    lines += _table(report["slowest_entities"], [("entidade", "name"), ("n", "count")] + latency)
+    return lines
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Perfis de latencia a partir dos logs do Friday")
+    parser.add_argument("logs", nargs="*", default=[DEFAULT_LOGS],
+                        help=f"arquivos ou padroes (padrao: {DEFAULT_LOGS})")
+    parser.add_argument("--top", type=int, default=10, help="entidades mais lentas listadas (padrao: 10)")
+    parser.add_argument("--stale-after", type=float, default=STALE_AFTER,
+                        help="segundos sem linhas para encerrar um comando sem Resposta")
+    parser.add_argument("--json", metavar="FILE", help="grava o relatorio em JSON")
+    parser.add_argument("--corpus", metavar="FILE",
+                        help="grava as frases com frequencia em JSONL (--mix do tools.loadtest)")
+    args = parser.parse_args(argv)
+
+    files = [f for f in log_files(args.logs) if Path(f).is_file()]
+    if not files:
+        print(f"Nenhum arquivo de log em: {' '.join(args.logs)}", file=sys.stderr)
+        return 1
+
+    profile, reader = replay(files, args.stale_after)
+    report = profile.report(args.top)
+    print("\n".join(format_report(report, reader, files)))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"files": files, "second_resolution": reader.second_resolution, **report},
+                      f, ensure_ascii=False, indent=2)
+            f.write("\n")
+    if args.corpus:
+        corpus = profile.corpus()
+        with open(args.corpus, "w", encoding="utf-8") as f:
+            for entry in corpus:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        print(f"\n{len(corpus)} frase(s) gravada(s) em {args.corpus}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
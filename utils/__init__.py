@@ -3,10 +3,16 @@ Utils module - Utilitarios para o Friday
 
 Modulos disponiveis:
 - logger: Sistema de logging estruturado
+- aio: Ponte entre a API sincrona e o caminho assincrono
+- timer_wheel: Timer wheel hierarquico para expiracoes em O(1)
+- metrics: Histogramas de latencia por etapa e spans (/metrics)
 """
 
+from .aio import run_sync
 from .logger import (log_action, log_api_call, log_command, log_separator,
                      setup_logger)
+from .metrics import metrics, span
+from .timer_wheel import TimerWheel
 
 __all__ = [
     "setup_logger",
@@ -14,4 +20,8 @@ __all__ = [
     "log_command",
     "log_action",
     "log_separator",
+    "run_sync",
+    "TimerWheel",
+    "metrics",
+    "span",
 ]
@@ -0,0 +1,56 @@
+import asyncio
+import contextvars
+import threading
+
+# ============================================================
+# PONTE SYNC -> ASYNC
+# ============================================================
+#
+# O caminho principal do Friday e assincrono (async_dispatch, async_handle,
+# async_call_service). A API sincrona antiga continua existindo para testes
+# e scripts, executando as corrotinas em um event loop dedicado que roda em
+# uma thread de fundo. Assim as conexoes do cliente async sao reaproveitadas
+# entre chamadas sincronas.
+
+_loop = None
+_lock = threading.Lock()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            thread = threading.Thread(
+                target=_loop.run_forever,
+                name="friday-sync-bridge",
+                daemon=True,
+            )
+            thread.start()
+        return _loop
+
+
+async def _run_in_context(coro, ctx: contextvars.Context):
+    # Executa no contexto de quem chamou run_sync (preserva ContextVars). A
+    # task copia o contexto corrente; create_task(context=) exige Python 3.11
+    return await ctx.run(asyncio.get_running_loop().create_task, coro)
+
+
+def run_sync(coro):
+    """
+    Executa uma corrotina a partir de codigo sincrono e retorna o resultado.
+
+    Nao pode ser chamada de dentro de um event loop: nesse caso use
+    diretamente a versao async_ da funcao.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        coro.close()
+        raise RuntimeError("run_sync chamado dentro de um event loop; use a versao async_")
+
+    ctx = contextvars.copy_context()
+    future = asyncio.run_coroutine_threadsafe(_run_in_context(coro, ctx), _get_loop())
+    return future.result()
@@ -1,7 +1,15 @@
+import atexit
+import copy
+import json
 import logging
+import os
+import queue
 import sys
+import threading
+from collections.abc import Mapping
 from datetime import datetime
-from logging.handlers import RotatingFileHandler, TimedRotatingFileHandler
+from logging.handlers import (QueueHandler, QueueListener, RotatingFileHandler,
+                              TimedRotatingFileHandler)
 from pathlib import Path
 
 # ============================================================
@@ -27,10 +35,24 @@ LOG_RETENTION_DAYS = 30  # Manter logs dos ultimos 30 dias
 
 LOG_FILE = LOG_DIR / "friday.log"
 
-# Formato de log limpo e estruturado
-LOG_FORMAT = "%(asctime)s | %(levelname)-8s | %(name)-20s | %(message)s"
+# text: mesmo formato do console | json: uma linha JSON compacta por
+# registro em friday.jsonl (mais barato de escrever e de processar depois)
+LOG_FILE_FORMAT = os.getenv("LOG_FILE_FORMAT", "text")
+LOG_JSON_FILE = LOG_DIR / "friday.jsonl"
+
+# Formato de log limpo e estruturado (com milissegundos: tools.log_replay
+# mede latencias a partir dessas linhas)
+LOG_FORMAT = "%(asctime)s.%(msecs)03d | %(levelname)-8s | %(name)-20s | %(message)s"
 DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
 
+SEPARATOR = "=" * 70
+
+# Registros aguardando a thread de log. A thread do comando so enfileira;
+# formatacao, escrita e rotacao ficam com o listener. Fila cheia (disco
+# lento) descarta o registro em vez de atrasar o comando. 0 = modo
+# sincrono (cada logger escreve direto no arquivo e no console).
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
 
 def setup_logger(name: str, level=logging.INFO):
     """
@@ -40,6 +62,9 @@ def setup_logger(name: str, level=logging.INFO):
     - Por padrao: Rotacao diaria a meia-noite, mantendo 30 dias
     - Alternativa: Rotacao por tamanho (10MB), mantendo 7 arquivos
     
+    Com LOG_QUEUE_SIZE > 0 (padrao) o logger so enfileira; arquivo e
+    console sao escritos pela thread do listener (ver start_queue_logging).
+    
     Args:
         name: Nome do logger (geralmente __name__ do modulo)
         level: Nivel de log (DEBUG, INFO, WARNING, ERROR, CRITICAL)
@@ -54,11 +79,26 @@ def setup_logger(name: str, level=logging.INFO):
     if logger.handlers:
         return logger
     
+    if LOG_QUEUE_SIZE > 0:
+        logger.addHandler(start_queue_logging())
+        return logger
+    
+    for handler in _build_handlers():
+        logger.addHandler(handler)
+    
+    return logger
+
+
+def _build_handlers() -> list:
+    """Handlers de arquivo (com rotacao) e console."""
+    json_file = LOG_FILE_FORMAT == "json"
+    log_file = LOG_JSON_FILE if json_file else LOG_FILE
+    
     # Handler para arquivo com rotacao
     if USE_TIME_ROTATION:
         # Rotacao por tempo (diaria, semanal, etc)
         file_handler = TimedRotatingFileHandler(
-            LOG_FILE,
+            log_file,
             when=LOG_ROTATION_WHEN,
             interval=LOG_ROTATION_INTERVAL,
             backupCount=LOG_RETENTION_DAYS,
@@ -69,7 +109,7 @@ def setup_logger(name: str, level=logging.INFO):
     else:
         # Rotacao por tamanho
         file_handler = RotatingFileHandler(
-            LOG_FILE,
+            log_file,
             maxBytes=MAX_LOG_SIZE,
             backupCount=MAX_LOG_FILES,
             encoding="utf-8"
@@ -77,17 +117,179 @@ def setup_logger(name: str, level=logging.INFO):
         # Formato do arquivo rotacionado: friday.log.1, friday.log.2, etc
     
     file_handler.setLevel(logging.DEBUG)
-    file_handler.setFormatter(logging.Formatter(LOG_FORMAT, DATE_FORMAT))
+    if json_file:
+        file_handler.setFormatter(JsonFormatter())
+        # Separadores so servem para leitura no console/texto
+        file_handler.addFilter(lambda record: record.msg is not SEPARATOR)
+    else:
+        file_handler.setFormatter(logging.Formatter(LOG_FORMAT, DATE_FORMAT))
     
     # Handler para console
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(logging.INFO)
     console_handler.setFormatter(logging.Formatter(LOG_FORMAT, DATE_FORMAT))
     
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-    
-    return logger
+    return [file_handler, console_handler]
+
+
+# ============================================================
+# LOG EM FILA (NAO BLOQUEANTE)
+# ============================================================
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    QueueHandler com fila limitada: cheia, descarta o registro e conta.
+
+    Quando volta a ter espaco, enfileira antes um aviso com quantos
+    registros foram perdidos desde o ultimo aviso.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._unreported = 0
+        self._drop_lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Nada e formatado aqui: os args sao copiados (podem mudar antes do
+        # listener) e a mensagem, data e colunas ficam com o listener
+        record = copy.copy(record)
+        record.args = _snapshot(record.args)
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if self._unreported:
+            # Pega e zera sob o lock: cada descarte entra em um aviso so
+            with self._drop_lock:
+                unreported, self._unreported = self._unreported, 0
+            if unreported:
+                try:
+                    self.queue.put_nowait(self._drop_notice(unreported))
+                except queue.Full:
+                    with self._drop_lock:
+                        self._unreported += unreported
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._drop_lock:
+                self.dropped += 1
+                self._unreported += 1
+
+    def _drop_notice(self, count: int) -> logging.LogRecord:
+        return logging.LogRecord(
+            "utils.logger", logging.WARNING, __file__, 0,
+            f"{count} registro(s) de log descartado(s): fila cheia", None, None
+        )
+
+
+_IMMUTABLE = (str, int, float, bool, type(None))
+
+
+def _snapshot(value):
+    """Copia de args/campos para formatar depois em outra thread."""
+    if isinstance(value, _IMMUTABLE):
+        return value
+    if isinstance(value, tuple):
+        return tuple(_snapshot(v) for v in value)
+    if isinstance(value, list):
+        return [_snapshot(v) for v in value]
+    if isinstance(value, Mapping):
+        return {k: _snapshot(v) for k, v in value.items()}
+    if isinstance(value, (set, frozenset)):
+        return {_snapshot(v) for v in value}
+    return str(value)
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # Bloqueia em vez de falhar com a fila cheia: o listener esta drenando
+        self.queue.put(self._sentinel)
+
+
+_queue_handler = None
+_listener = None
+_queue_lock = threading.Lock()
+
+
+def start_queue_logging(size: int = None) -> DroppingQueueHandler:
+    """
+    Handler compartilhado por todos os loggers no modo em fila.
+
+    Na primeira chamada cria a fila (size, padrao LOG_QUEUE_SIZE) e inicia
+    a thread do listener com um unico handler de arquivo e um de console.
+    """
+    global _queue_handler, _listener
+    with _queue_lock:
+        if _queue_handler is None:
+            log_queue = queue.Queue(maxsize=size or LOG_QUEUE_SIZE)
+            _queue_handler = DroppingQueueHandler(log_queue)
+            _listener = _Listener(log_queue, *_build_handlers(), respect_handler_level=True)
+            _listener.start()
+            atexit.register(stop_queue_logging)
+        return _queue_handler
+
+
+def stop_queue_logging():
+    """Escreve o que ainda esta na fila e para a thread do listener."""
+    global _listener
+    with _queue_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def log_stats() -> dict:
+    """{"queued", "dropped", "maxsize"} da fila de log (zeros no modo sincrono)."""
+    if _queue_handler is None:
+        return {"queued": 0, "dropped": 0, "maxsize": 0}
+    return {
+        "queued": _queue_handler.queue.qsize(),
+        "dropped": _queue_handler.dropped,
+        "maxsize": _queue_handler.queue.maxsize,
+    }
+
+
+# ============================================================
+# LOG ESTRUTURADO
+# ============================================================
+#
+# Campos nomeados vao como um dict unico de args ("%(campo)s" na
+# mensagem): a mensagem so e montada se algum handler aceitar o registro
+# (e, no modo em fila, na thread do listener). No arquivo JSON os campos
+# saem como chaves proprias.
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON compacta por registro: ts, level, logger, msg + campos."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if isinstance(record.args, Mapping):
+            for key, value in record.args.items():
+                entry.setdefault(key, value)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def log_event(logger, msg: str, level: int = logging.INFO, **fields):
+    """
+    Log com campos nomeados, formatado so se o nivel estiver ativo.
+
+    Ex: log_event(logger, "Resposta: %(message)s", message=msg)
+    """
+    if logger.isEnabledFor(level):
+        if fields:
+            logger.log(level, msg, fields, stacklevel=2)
+        else:
+            logger.log(level, msg, stacklevel=2)
 
 
 # ============================================================
@@ -97,27 +299,31 @@ def setup_logger(name: str, level=logging.INFO):
 def log_api_call(logger, method: str, url: str, status: int = None, error: str = None):
     """Log estruturado para chamadas de API"""
     if error:
-        logger.error(f"API [{method}] {url} ** ERRO: {error}")
+        logger.error("API [%(method)s] %(url)s ** ERRO: %(error)s",
+                     {"method": method, "url": url, "error": error})
     else:
-        logger.info(f"API [{method}] {url} -> Status {status}")
+        logger.info("API [%(method)s] %(url)s -> Status %(status)s",
+                    {"method": method, "url": url, "status": status})
 
 
 def log_command(logger, text: str, intent: str = None, domain: str = None):
     """Log estruturado para comandos recebidos"""
     if intent and domain:
-        logger.info(f"COMANDO: '{text}' >> Intent: {intent} | Domain: {domain}")
+        logger.info("COMANDO: '%(text)s' >> Intent: %(intent)s | Domain: %(domain)s",
+                    {"text": text, "intent": intent, "domain": domain})
     else:
-        logger.info(f"COMANDO: '{text}'")
+        logger.info("COMANDO: '%(text)s'", {"text": text})
 
 
 def log_action(logger, domain: str, action: str, target: str = None):
     """Log estruturado para acoes executadas"""
     if target:
-        logger.info(f"ACAO [{domain}] {action} -> {target}")
+        logger.info("ACAO [%(domain)s] %(action)s -> %(target)s",
+                    {"domain": domain, "action": action, "target": target})
     else:
-        logger.info(f"ACAO [{domain}] {action}")
+        logger.info("ACAO [%(domain)s] %(action)s", {"domain": domain, "action": action})
 
 
 def log_separator(logger):
     """Separador visual para logs"""
-    logger.info("=" * 70)
+    logger.info(SEPARATOR)
@@ -0,0 +1,249 @@
+import bisect
+import threading
+import time
+
+# ============================================================
+# METRICAS EM PROCESSO
+# ============================================================
+#
+# Histogramas de latencia por etapa (parse, dispatch, handler, ha) com
+# rotulos (dominio, intent, servico do HA), expostos em formato texto do
+# Prometheus. p50/p95/p99 saem estimados dos proprios buckets, entao
+# /metrics ja responde "onde o comando lento gastou tempo" sem Prometheus.
+
+# Limites dos buckets em segundos (~x1.5 entre vizinhos: boa resolucao
+# para os quantis de 0,25 ms a 30 s)
+LATENCY_BUCKETS = (
+    0.00025, 0.0005, 0.001, 0.002, 0.003, 0.005, 0.0075,
+    0.01, 0.015, 0.02, 0.03, 0.05, 0.075,
+    0.1, 0.15, 0.2, 0.3, 0.5, 0.75,
+    1.0, 1.5, 2.0, 3.0, 5.0, 7.5, 10.0, 30.0,
+)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _key(labels: dict) -> tuple:
+    # Chaves sao unicas: o sort nunca compara os valores
+    return tuple(sorted(labels.items()))
+
+
+def _sort_key(item) -> list:
+    """Ordem das series no /metrics (rotulos None vem como "")."""
+    return [(k, "" if v is None else str(v)) for k, v in item[0]]
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{_escape("" if v is None else str(v))}"' for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if value is None:
+        return "NaN"
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    Histograma com buckets fixos, uma serie por combinacao de rotulos.
+
+    observe() e O(log buckets) sob um lock; nada e guardado por amostra.
+    """
+
+    def __init__(self, name: str, help: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._series = {}  # rotulos -> [contagens por bucket (+Inf no fim), soma]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = [[0] * (len(self.buckets) + 1), 0.0]
+                self._series[key] = series
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            series = self._series.get(_key(labels))
+            return sum(series[0]) if series else 0
+
+    def quantile(self, q: float, **labels) -> float | None:
+        """Quantil q (0..1) estimado dos buckets da serie; None sem amostras."""
+        with self._lock:
+            series = self._series.get(_key(labels))
+            counts = list(series[0]) if series else None
+        return self._quantile(q, counts) if counts else None
+
+    def _quantile(self, q: float, counts: list) -> float | None:
+        # Mesma interpolacao linear do histogram_quantile do Prometheus
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for i, n in enumerate(counts):
+            if seen + n >= rank and n:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i]
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self) -> list[str]:
+        with self._lock:
+            snapshot = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        quantile_lines = []
+        for key, counts, total in sorted(snapshot, key=_sort_key):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(key, (('le', _format_value(bound)),))} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+            for q in QUANTILES:
+                value = self._quantile(q, counts)
+                quantile_lines.append(
+                    f"{self.name}_quantile{_format_labels(key, (('quantile', str(q)),))} {_format_value(value)}"
+                )
+
+        lines.append(f"# HELP {self.name}_quantile Quantis estimados dos buckets de {self.name}")
+        lines.append(f"# TYPE {self.name}_quantile gauge")
+        return lines + quantile_lines
+
+
+class Counter:
+    """Contador monotonico, uma serie por combinacao de rotulos."""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._series.get(_key(labels), 0)
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self) -> list[str]:
+        with self._lock:
+            snapshot = sorted(self._series.items(), key=_sort_key)
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_format_labels(key)} {_format_value(v)}" for key, v in snapshot]
+        return lines
+
+
+class Gauge:
+    """Valor lido na hora do /metrics (fn devolve numero ou {rotulos: valor})."""
+
+    def __init__(self, name: str, help: str, fn):
+        self.name = name
+        self.help = help
+        self.fn = fn
+
+    def render(self) -> list[str]:
+        value = self.fn()
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        if isinstance(value, dict):
+            lines += [f"{self.name}{_format_labels(_key(dict(k)))} {_format_value(v)}"
+                      for k, v in sorted(value.items(), key=_sort_key)]
+        else:
+            lines.append(f"{self.name} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """Metricas do processo, na ordem de registro."""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str):
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Formato texto de exposicao do Prometheus (0.0.4)."""
+        lines = []
+        for metric in self._metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+stage_latency = metrics.register(Histogram(
+    "friday_stage_latency_seconds",
+    "Latencia por etapa do comando (parse, dispatch, handler, ha)",
+))
+stage_errors = metrics.register(Counter(
+    "friday_stage_errors_total",
+    "Etapas encerradas com excecao",
+))
+
+# ============================================================
+# SPANS
+# ============================================================
+
+class span:
+    """
+    Mede o bloco em stage_latency{stage, **labels}.
+
+    Devolve o dict de rotulos: o bloco pode completar rotulos que so
+    conhece no fim (ex: domain/intent depois do parse). Funciona igual
+    dentro de corrotinas (o tempo inclui os awaits do bloco).
+    """
+
+    __slots__ = ("labels", "start")
+
+    def __init__(self, stage: str, **labels):
+        labels["stage"] = stage
+        self.labels = labels
+
+    def __enter__(self) -> dict:
+        self.start = time.perf_counter()
+        return self.labels
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        if exc_type is not None and issubclass(exc_type, Exception):
+            stage_errors.inc(**self.labels)
+        stage_latency.observe(elapsed, **self.labels)
+        return False
@@ -0,0 +1,86 @@
+# ============================================================
+# TIMER WHEEL HIERARQUICO
+# ============================================================
+#
+# Agenda expiracoes em O(1) sem ordenar nada: cada nivel e um anel de
+# `slots` posicoes; o nivel 0 anda um slot por tick, o nivel 1 um slot a
+# cada `slots` ticks, e assim por diante. Timers distantes ficam nos niveis
+# altos e descem (cascata) conforme o tempo se aproxima.
+#
+# O wheel nao le o relogio: quem usa chama advance(ticks) (ex: uma thread
+# que acorda a cada tick).
+
+
+class TimerWheel:
+    """
+    Timers identificados por chave (agendar de novo a mesma chave substitui).
+
+    Com slots=64 e levels=4 cobre 64**4 ticks (~19 dias com tick de 0,1s);
+    alem disso o timer fica no ultimo nivel e e reagendado ao descer.
+    """
+
+    def __init__(self, slots: int = 64, levels: int = 4):
+        self.slots = slots
+        self.levels = levels
+        self.now = 0  # tick atual
+        self._wheels = [[set() for _ in range(slots)] for _ in range(levels)]
+        self._timers = {}  # chave -> (tick de expiracao, slot onde esta)
+
+    def __len__(self):
+        return len(self._timers)
+
+    def schedule(self, key, ticks: int):
+        """Expira key daqui a `ticks` ticks (minimo 1)."""
+        self.cancel(key)
+        self._place(key, self.now + max(1, int(ticks)))
+
+    def cancel(self, key) -> bool:
+        timer = self._timers.pop(key, None)
+        if timer is None:
+            return False
+        timer[1].discard(key)
+        return True
+
+    def advance(self, ticks: int = 1) -> list:
+        """Anda `ticks` ticks e devolve as chaves que expiraram."""
+        expired = []
+        for _ in range(ticks):
+            self.now += 1
+            self._cascade()
+            slot = self._wheels[0][self.now % self.slots]
+            for key in slot:
+                del self._timers[key]
+                expired.append(key)
+            slot.clear()
+        return expired
+
+    def _place(self, key, expires: int):
+        delta = expires - self.now
+        span = 1
+        for level in range(self.levels):
+            if delta < span * self.slots or level == self.levels - 1:
+                index = (expires // span) % self.slots
+                slot = self._wheels[level][index]
+                break
+            span *= self.slots
+        slot.add(key)
+        self._timers[key] = (expires, slot)
+
+    def _cascade(self):
+        """Desce para o nivel de baixo os timers do slot que acabou de virar."""
+        # Do nivel mais alto para o mais baixo: o que desce do nivel 2 pode
+        # cair no slot do nivel 1 que tambem desce neste tick
+        boundaries = []
+        span = self.slots
+        for level in range(1, self.levels):
+            if self.now % span:
+                break
+            boundaries.append((level, span))
+            span *= self.slots
+
+        for level, span in reversed(boundaries):
+            slot = self._wheels[level][(self.now // span) % self.slots]
+            pending = [(key, self._timers[key][0]) for key in slot]
+            slot.clear()
+            for key, expires in pending:
+                self._place(key, max(expires, self.now))